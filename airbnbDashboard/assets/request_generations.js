@@ -0,0 +1,19 @@
+// Tags every callback request with the id of the browser tab and a growing sequence number,
+// so the server can skip requests that were superseded by a newer one (see utils/generations.py).
+(function () {
+    const tab = Math.random().toString(36).slice(2) + Date.now().toString(36);
+    let sequence = 0;
+    const fetch = window.fetch.bind(window);
+
+    window.fetch = function (resource, options) {
+        const url = typeof resource === 'string' ? resource : (resource && resource.url) || '';
+        if (!url.endsWith('_dash-update-component') || !options) {
+            return fetch(resource, options);
+        }
+        sequence += 1;
+        const headers = new Headers(options.headers || {});
+        headers.set('X-Dash-Tab', tab);
+        headers.set('X-Dash-Request', String(sequence));
+        return fetch(resource, Object.assign({}, options, {headers: headers}));
+    };
+})();
@@ -1,15 +1,34 @@
-from dash import dcc, html
+from dash import dcc, html, ctx, no_update, Patch
 import dash_bootstrap_components as dbc
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go 
 
-from airbnbDashboard.plots import generate_map, update_scatter_plot, get_sort_options, generate_sorted_table
-from airbnbDashboard.utils.helpers import get_neighborhood_options, filter_listings
+from airbnbDashboard.plots import create_map_figure, create_choropleth, map_graph, update_scatter_plot, generate_sorted_table, generate_table
+from airbnbDashboard.plots.generate_map import METRIC_SWITCH_JS
+from airbnbDashboard.plots.slider import SLIDER_DEBOUNCE_JS
+from airbnbDashboard.plots.generate_table import get_facet_options, generate_search_results, generate_host_portfolio, table_columns
+from airbnbDashboard.data.aggregates import range_stats
+from airbnbDashboard.data.facets import filter_facets, facet_counts
+from airbnbDashboard.data.search import search_listings
+from airbnbDashboard.data.hosts import top_hosts, host_portfolio
+from airbnbDashboard.data.incremental import city_snapshot
+from airbnbDashboard.data.density import density_tile, density_scale, tile_coordinates, visible_tiles, view_corners
+from airbnbDashboard.data.paths import city_data
+from airbnbDashboard.plots.density import density_image, density_layer
+from airbnbDashboard.utils.helpers import filter_listings
+from airbnbDashboard.data.query import PandasBackend
+from airbnbDashboard.data.neighbourhoods import feature_ids
+from airbnbDashboard.utils.cache import LRUCache
+from airbnbDashboard.utils.export import ExportJobs, start_export
+from airbnbDashboard.utils.generations import RequestGenerations
+from airbnbDashboard.utils.serialization import serialize_figure, pre_serialized, serialize_output, serialized_outputs
 from airbnbDashboard.plots.generate_scatter import update_scatter_plot
 
 
 
-def register_callbacks(app, listings_data, neighborhoods_geojson, neighborhood_stats, date_marks):
+def register_callbacks(app, listings_data, listing_dims, neighborhoods_geojson, neighborhood_stats, date_marks, city_indexes,
+                       query_backend=None, export_jobs=None, request_generations=None, prefetcher=None):
     """
     Registers all the callback functions for the Dash application.
 
@@ -21,44 +40,311 @@ def register_callbacks(app, listings_data, neighborhoods_geojson, neighborhood_s
     app : dash.Dash
         The Dash app instance where callbacks are registered.
     listings_data : dict
-        A dictionary containing the raw listing data for each city.
+        A dictionary containing the monthly listing data for each city.
         The key is the city name, and the value is a DataFrame containing the
-        raw listing data.
+        monthly listing data. It is empty with the DuckDB backend, which
+        answers the table and scatter plot from the validated files instead.
+    listing_dims : dict
+        A dictionary containing the static listing attributes for each city,
+        indexed by listing id. They are joined to the table rows on demand.
     neighborhoods_geojson : dict
         GeoJSON data for neighborhoods, used to update the map visualization.
     neighborhood_stats : dict
         Aggregated statistics for each neighborhood.
     date_marks : dict
         A dictionary mapping slider positions to date labels.
+    city_indexes : dict
+        Precomputed per-city structures, including the dropdown options
+        stored under 'metadata', the facet index of the table under 'facets', the search
+        index under 'search', the host portfolios under 'hosts', the prefix sums for
+        month ranges under 'prefix_sums', the listing coordinates under 'density', the
+        map colour ranges under 'color_ranges' and the scatter cube under 'scatter'.
+    query_backend : PandasBackend or DuckDBBackend, optional
+        The backend of the listing queries that are not answered from `city_indexes`
+        (see `data/query.py`): the tables and scatter plots of cities without a
+        facet index or scatter cube. The default queries `listings_data` with pandas.
+    export_jobs : ExportJobs, optional
+        The runner of the table exports, shared with the export endpoints
+        (see `utils/export.py`). The default is a runner of its own.
+    request_generations : RequestGenerations, optional
+        The latest request of the map and table callbacks per browser tab
+        (see `utils/generations.py`). The default is a tracker of its own.
+    prefetcher : Prefetcher, optional
+        The background runner that warms the caches with the likely next views
+        (see `utils/prefetch.py`). The default is no prefetching.
 
     Notes
     -----
     - Each callback function handles a specific aspect of the application's interactivity.
     - The callback functions rely on user input through dropdowns, sliders, and other UI elements.
+    - Everything that only depends on the city is served by a single batched callback
+      from `city_indexes`, so a city change costs one request instead of four.
+    - The map, table and scatter plot outputs are serialized with orjson by the
+      `serialized_outputs` decorator before Dash builds the response.
+    - In range mode, the map shows the statistics over several months. They are
+      computed from the prefix sums in `city_indexes`, so the cost does not grow
+      with the length of the range.
+    - Switching the map metric is a clientside callback that recolours the figure
+      already shown in the browser, using the values and per-city colour ranges
+      embedded in it. The geometry is not sent again.
+    - The listing density is binned on the server into image tiles of the visible part
+      of the map. Tiles are cached per city, months, zoom level and position, and only
+      the map layers are sent, as a partial update of the figure.
+    - The table and the scatter plot live in the modal. They are only rendered while the
+      modal is open and are cached, so reopening it with the same inputs is a lookup.
+    - The table can be narrowed by room type, price, minimum nights and rating. The
+      facets and the counts next to their options are served from the facet index.
+    - The table selection can be exported as a background job. Its progress is polled
+      by an interval that only runs while an export is in progress.
+    - The callbacks depend on the months selected by the sliders through the 'month-selection'
+      and 'month-range-selection' stores, which a clientside debounce only sets once a slider
+      settles. Map and table requests that are superseded by a newer request from the same
+      browser tab stop at the next step instead of finishing a result that would be replaced.
+    - With a prefetcher, the maps of the months next to the one shown are built while the
+      server is idle, and a click on a neighbourhood starts the table and the scatter plot
+      of that neighbourhood before the modal asks for them, so the next step is a cache hit.
 
     Exceptions
     ----------
-    - If `selected_city` is not in `listings_data`, some callbacks return default or empty values.
+    - If `selected_city` is not in `city_indexes`, some callbacks return default or empty values.
     - This prevents the app from crashing due to invalid user inputs.
     """
+    query_backend = query_backend or PandasBackend(listings_data, listing_dims)
+    export_jobs = export_jobs or ExportJobs()
+    request_generations = request_generations or RequestGenerations()
+
+    # Slider position -> calendar month, parsed once instead of on every request
+    selected_months = {index: int(date.split('-')[1]) for index, date in date_marks.items()}
+
+    def slider_month(selected_date_index):
+        """
+        Returns the calendar month of a slider position, including marks added
+        by `append_month` after the callbacks were registered.
+        """
+        if selected_date_index not in selected_months:
+            selected_months[selected_date_index] = int(date_marks[selected_date_index].split('-')[1])
+        return selected_months[selected_date_index]
+
+    def data_version(selected_city):
+        """
+        Returns the data version of a city. It is part of every cache key, so
+        figures rendered before a new month was appended are not served again.
+        """
+        return city_indexes.get(selected_city, {}).get('version', 0)
+
+    # Serialized modal contents keyed by the inputs they were rendered from
+    table_cache = LRUCache(maxsize=64, name='table')
+    scatter_cache = LRUCache(maxsize=64, name='scatter')
+
+    # Serialized map figures keyed by (city, version, month), sent again without re-encoding
+    map_cache = LRUCache(maxsize=128, name='map')
+
+    # Density tile images keyed by (city, version, start, end, zoom, column, row) and colour scales without the tile
+    tile_cache = LRUCache(maxsize=1024, name='tile')
+    scale_cache = LRUCache(maxsize=128, name='scale')
+
+    def prefetch(cache_name, cache, cache_key, warm):
+        """
+        Queues the computation of a cache entry on the prefetcher, unless it is cached.
+        """
+        if prefetcher is not None and cache_key not in cache:
+            prefetcher.submit((cache_name,) + cache_key, warm)
+
+    def cached(cache_name, cache, cache_key):
+        """
+        Returns a cache entry. If it is missing but being prefetched, waits for the
+        prefetch instead of computing it again; a queued prefetch is cancelled.
+        """
+        value = cache.get(cache_key)
+        if value is None and prefetcher is not None and prefetcher.claim((cache_name,) + cache_key):
+            value = cache.get(cache_key)
+        return value
+
+    def render_map(selected_city, selected_month, metric):
+        """
+        Returns the map component for a city and month, building and serializing
+        the figure only on the first request. A superseded request stops before
+        each of the two steps.
+        """
+        cache_key = (selected_city, data_version(selected_city), selected_month, metric)
+        figure_json = cached('map', map_cache, cache_key)
+        if figure_json is None:
+            request_generations.check()
+            color_ranges = city_indexes.get(selected_city, {}).get('color_ranges')
+            fig = create_map_figure(selected_city, selected_month, neighborhoods_geojson, neighborhood_stats, metric, color_ranges)
+            if fig is None:
+                return html.Div("Invalid city selected")
+            request_generations.check()
+            figure_json = serialize_figure(fig)
+            map_cache.set(cache_key, figure_json)
+        return map_graph(pre_serialized(figure_json))
+
+    def prefetch_adjacent_months(selected_city, selected_date_index, metric):
+        """
+        Prefetches the maps of the slider positions before and after the one shown,
+        up to the last month with listings; the months after it only hold forecasts.
+        """
+        scatter_cube = city_indexes.get(selected_city, {}).get('scatter')
+        if scatter_cube is None or not scatter_cube['history']:
+            return
+        last_month = scatter_cube['dates'][scatter_cube['history'] - 1].strftime('%Y-%m')
+        last_index = max((i for i, mark in date_marks.items() if mark <= last_month), default=-1)
+        for date_index in (selected_date_index + 1, selected_date_index - 1):
+            if 0 <= date_index <= last_index:
+                selected_month = slider_month(date_index)
+                prefetch('map', map_cache, (selected_city, data_version(selected_city), selected_month, metric),
+                         lambda selected_month=selected_month: render_map(selected_city, selected_month, metric))
+
+    def render_range_map(selected_city, start_index, end_index, metric):
+        """
+        Returns the map component for a city and a range of slider positions.
+        The statistics are two lookups per neighbourhood in the prefix sums.
+        """
+        cache_key = (selected_city, data_version(selected_city), 'range', start_index, end_index, metric)
+        figure_json = map_cache.get(cache_key)
+        if figure_json is None:
+            if selected_city not in city_indexes or 'prefix_sums' not in city_indexes[selected_city]:
+                return html.Div("Invalid city selected")
+            stats = range_stats(city_indexes[selected_city]['prefix_sums'], start_index, end_index)
+            if 'feature_index' in city_indexes[selected_city]:
+                stats['feature_id'] = feature_ids(stats['neighbourhood_cleansed'], city_indexes[selected_city]['feature_index'])
+            request_generations.check()
+            fig = create_choropleth(selected_city, stats, neighborhoods_geojson, metric, city_indexes[selected_city].get('color_ranges'))
+            if fig is None:
+                return html.Div("Invalid city selected")
+            request_generations.check()
+            figure_json = serialize_figure(fig)
+            map_cache.set(cache_key, figure_json)
+        return map_graph(pre_serialized(figure_json))
+
+    @app.callback(
+        Output('month-slider-container', 'style'),
+        Output('month-range-slider-container', 'style'),
+        Input('slider-mode', 'value'),
+    )
+    def toggle_slider_mode(slider_mode):
+        """
+        Shows either the single month slider or the range slider.
+
+        Parameters
+        ----------
+        slider_mode : str
+            'month' for a single month, 'range' for a range of months.
+
+        Returns
+        -------
+        dict
+            The style of the single month slider container.
+        dict
+            The style of the range slider container.
+        """
+        shown = {'width': '85%', 'margin': '0 auto'}
+        hidden = dict(shown, display='none')
+        if slider_mode == 'range':
+            return hidden, shown
+        return shown, hidden
+
+    def table_key(selected_city, selected_month, selected_neighborhood, sort_by, selected_columns, n_clicks_asc, n_clicks_desc,
+                  room_types, min_price, max_price, max_nights, min_rating):
+        """
+        Returns the cache key of a table, see `render_table`.
+        """
+        order = 'asc' if n_clicks_asc > n_clicks_desc else 'desc'
+        return (selected_city, data_version(selected_city), selected_month, selected_neighborhood, sort_by, tuple(selected_columns or ()), order,
+                tuple(room_types or ()), min_price, max_price, max_nights, min_rating)
+
+    def render_table(selected_city, selected_month, selected_neighborhood, sort_by, selected_columns, n_clicks_asc, n_clicks_desc,
+                     room_types, min_price, max_price, max_nights, min_rating):
+        """
+        Returns the serialized table of a selection, filtering and sorting the
+        listings only on the first request. A superseded request stops before
+        the table is sorted and serialized.
+        """
+        cache_key = table_key(selected_city, selected_month, selected_neighborhood, sort_by, selected_columns, n_clicks_asc, n_clicks_desc,
+                              room_types, min_price, max_price, max_nights, min_rating)
+        table = cached('table', table_cache, cache_key)
+        if table is None:
+            selections = {'room_type': room_types, 'minimum_nights': max_nights, 'rating': min_rating}
+            if 'facets' in city_indexes.get(selected_city, {}):
+                # The listings and the facet index of the same month, see `city_snapshot`
+                listings, listing_dim, indexes = city_snapshot(selected_city, listings_data, listing_dims, city_indexes)
+                listings_filtered = filter_facets(listings, indexes['facets'], selected_month, selected_neighborhood, selections,
+                                                  (min_price, max_price))
+            else:
+                # Without the listings in memory (the DuckDB backend), the backend filters and projects the rows
+                listing_dim = listing_dims.get(selected_city)
+                listings_filtered = filter_listings(query_backend, selected_city, selected_month, selected_neighborhood, selections,
+                                                    (min_price, max_price), table_columns(sort_by, selected_columns))
+            request_generations.check()
+            table = serialize_output(generate_sorted_table(listings_filtered, sort_by, selected_columns, n_clicks_asc, n_clicks_desc,
+                                                           listing_dim))
+            table_cache.set(cache_key, table)
+        return table
+
+    def scatter_key(selected_city, selected_neighborhood, n_clicks_price, n_clicks_rating):
+        """
+        Returns the cache key of a scatter plot, see `render_scatter`.
+        """
+        plot_type = 'rating' if n_clicks_rating > n_clicks_price else 'price'
+        return (selected_city, data_version(selected_city), selected_neighborhood, plot_type)
+
+    def render_scatter(selected_city, selected_neighborhood, n_clicks_price, n_clicks_rating):
+        """
+        Returns the serialized scatter plot and its title, building them only on the first request.
+        """
+        cache_key = scatter_key(selected_city, selected_neighborhood, n_clicks_price, n_clicks_rating)
+        scatter = cached('scatter', scatter_cache, cache_key)
+        if scatter is None:
+            figure, title = update_scatter_plot(selected_city, selected_neighborhood, n_clicks_price, n_clicks_rating, query_backend,
+                                                city_indexes.get(selected_city, {}).get('scatter'))
+            scatter = (serialize_output(figure), title)
+            scatter_cache.set(cache_key, scatter)
+        return scatter
+
+    # The slider values reach the server callbacks through their stores, once the slider settled
+    app.clientside_callback(
+        SLIDER_DEBOUNCE_JS,
+        Output('month-selection', 'data'),
+        Input('month-slider', 'value'),
+        prevent_initial_call=True
+    )
+    app.clientside_callback(
+        SLIDER_DEBOUNCE_JS,
+        Output('month-range-selection', 'data'),
+        Input('month-range-slider', 'value'),
+        prevent_initial_call=True
+    )
 
     @app.callback(
         Output('table-container', 'children'),
         [
             Input('city-dropdown', 'value'), 
-            Input('month-slider', 'value'), 
+            Input('month-selection', 'data'), 
             Input('sort-dropdown', 'value'), 
             Input('columns-dropdown', 'value'), 
             Input('order-asc', 'n_clicks'), 
             Input('order-desc', 'n_clicks'), 
-            Input('neighborhood-dropdown', 'value')
+            Input('neighborhood-dropdown', 'value'),
+            Input('modal', 'is_open'),
+            Input('room-type-filter', 'value'),
+            Input('price-min', 'value'),
+            Input('price-max', 'value'),
+            Input('nights-filter', 'value'),
+            Input('rating-filter', 'value')
         ]
     )
-    def update_table(selected_city, selected_date_index, sort_by, selected_columns, n_clicks_asc, n_clicks_desc, selected_neighborhood):
+    @serialized_outputs
+    def update_table(selected_city, selected_date_index, sort_by, selected_columns, n_clicks_asc, n_clicks_desc, selected_neighborhood, is_open,
+                     room_types, min_price, max_price, max_nights, min_rating):
         """
         Updates the Dash table figure based on selected city, month, neighborhood, 
         sort by, and additional columns options.
 
+        Nothing is rendered while the modal is closed. Rendered tables are cached
+        by their inputs, so reopening the modal with an unchanged selection does
+        not filter and sort the listings again. A table that is superseded by a
+        newer request is not sorted and serialized.
+
         Parameters
         ----------
         selected_city : str
@@ -82,6 +368,21 @@ def register_callbacks(app, listings_data, neighborhoods_geojson, neighborhood_s
         selected_neighborhood : str
             The selected neighborhood from the dropdown.
 
+        is_open : bool
+            Whether the modal containing the table is open.
+
+        room_types : list
+            The selected room types. All room types if empty.
+
+        min_price, max_price : float
+            The selected price range. Either may be None.
+
+        max_nights : int
+            The selected minimum nights band, or None.
+
+        min_rating : float
+            The selected rating threshold, or None.
+
         Returns
         -------
         html.Div
@@ -89,68 +390,291 @@ def register_callbacks(app, listings_data, neighborhoods_geojson, neighborhood_s
 
         Raises
         ------
-        KeyError
-            If the selected city is not in the listings data.
+        PreventUpdate
+            If the modal is closed and the table is not visible, or if a newer
+            request from the same browser tab superseded this one.
         """
-        if selected_city not in listings_data:
+        if not is_open:
+            raise PreventUpdate
+
+        if selected_city not in city_indexes:
             return html.Div("Invalid city selected")
 
-        selected_month = int(date_marks[selected_date_index].split('-')[1])
-        listings_filtered = filter_listings(listings_data, selected_city, selected_month, selected_neighborhood)
-        return generate_sorted_table(listings_filtered, sort_by, selected_columns, n_clicks_asc, n_clicks_desc)
+        request_generations.begin('table')
+        return render_table(selected_city, slider_month(selected_date_index), selected_neighborhood, sort_by, selected_columns,
+                            n_clicks_asc, n_clicks_desc, room_types, min_price, max_price, max_nights, min_rating)
 
     @app.callback(
-        Output('sort-dropdown', 'options'),
-        [Input('city-dropdown', 'value')]
+        Output('room-type-filter', 'options'),
+        Output('nights-filter', 'options'),
+        Output('rating-filter', 'options'),
+        [
+            Input('city-dropdown', 'value'),
+            Input('month-selection', 'data'),
+            Input('neighborhood-dropdown', 'value'),
+            Input('modal', 'is_open'),
+            Input('room-type-filter', 'value'),
+            Input('price-min', 'value'),
+            Input('price-max', 'value'),
+            Input('nights-filter', 'value'),
+            Input('rating-filter', 'value')
+        ]
     )
-    def update_sort_options(selected_city):
+    def update_facet_options(selected_city, selected_date_index, selected_neighborhood, is_open, room_types, min_price, max_price, max_nights, min_rating):
         """
-        Generates and returns sorting options for the dropdown menu in the table figure.
+        Updates the facet filter options with the number of matching listings.
+
+        The counts of a facet's options take all other selected facets into
+        account. They are computed from the bitmaps of the facet index.
 
         Parameters
         ----------
         selected_city : str
             The selected city from the dropdown.
 
+        selected_date_index : int
+            The selected date index from the date slider.
+
+        selected_neighborhood : str
+            The selected neighborhood from the dropdown.
+
+        is_open : bool
+            Whether the modal containing the filters is open.
+
+        room_types, min_price, max_price, max_nights, min_rating
+            The selected facets, see `update_table`.
+
         Returns
         -------
         list
-            A list of sorting options for the dropdown menu.
+            The options of the room type checklist.
+        list
+            The options of the minimum nights dropdown.
+        list
+            The options of the rating dropdown.
 
         Raises
         ------
-        KeyError
-            If the selected city is not in the listings data.
+        PreventUpdate
+            If the modal is closed or the city has no facet index.
         """
-        return get_sort_options(listings_data, selected_city)
+        if not is_open or 'facets' not in city_indexes.get(selected_city, {}):
+            raise PreventUpdate
+
+        selections = {'room_type': room_types, 'minimum_nights': max_nights, 'rating': min_rating}
+        counts = facet_counts(city_indexes[selected_city]['facets'], slider_month(selected_date_index), selected_neighborhood,
+                              selections, (min_price, max_price))
+        return get_facet_options(counts)
 
     @app.callback(
+        Output('map-container', 'children'),
+        Output('sort-dropdown', 'options'),
         Output('columns-dropdown', 'options'),
-        [Input('city-dropdown', 'value')]
+        Output('neighborhood-dropdown', 'options'),
+        Output('map-view', 'data'),
+        [
+            Input('city-dropdown', 'value'), 
+            Input('month-selection', 'data'),
+            Input('month-range-selection', 'data'),
+            Input('slider-mode', 'value')
+        ],
+        State('map-metric', 'value')
     )
-    def update_column_options(selected_city):
+    @serialized_outputs
+    def update_city_view(selected_city, selected_date_index, selected_date_range, slider_mode, metric):
         """
-        Generates and returns column options for the dropdown menu in the table figure.
+        Updates the map and all city dependent dropdown options in one request.
+
+        The dropdown options are looked up in the precomputed `city_indexes`
+        and are only resent when the city changed. A change of a slider or
+        of the slider mode only updates the map, whose serialized figure is
+        cached per city, month (or range of months) and metric. The months
+        arrive once the slider settled (see `SLIDER_DEBOUNCE_JS`), and a map
+        that is superseded by a newer request is not finished. The maps of the
+        adjacent months are prefetched, as the slider is most often moved by one step.
 
         Parameters
         ----------
         selected_city : str
             The selected city from the dropdown.
 
+        selected_date_index : int
+            The selected date index from the date slider, once it settled.
+
+        selected_date_range : list
+            The first and last selected date index from the range slider, once it settled.
+
+        slider_mode : str
+            'month' to show a single month, 'range' to show a range of months.
+
+        metric : str
+            The statistic that colours the map, e.g. 'avg_price' or 'median_price'.
+            Changes of the metric alone are handled in the browser.
+
         Returns
         -------
+        dash_html_components.Div
+            A div containing the updated map figure.
+        list
+            A list of sorting options for the dropdown menu.
         list
             A list of column options for the dropdown menu.
+        list
+            A list of neighborhood options for the dropdown menu.
+        dict
+            The city and the first and last slider index shown on the map.
+
+        Raises
+        ------
+        PreventUpdate
+            If the slider that is currently hidden was moved, or if a newer
+            slider or city change from the same browser tab superseded this one.
+        """
+        range_mode = slider_mode == 'range'
+        if ctx.triggered_id == ('month-selection' if range_mode else 'month-range-selection'):
+            raise PreventUpdate
+
+        # A new city always supersedes older requests, but is itself never skipped, so its dropdown options are sent
+        slider_change = ctx.triggered_id in ('month-selection', 'month-range-selection', 'slider-mode')
+        request_generations.begin('city_view', cancellable=slider_change)
+
+        if range_mode:
+            map_figure = render_range_map(selected_city, *selected_date_range, metric)
+            map_view = {'city': selected_city, 'start': min(selected_date_range), 'end': max(selected_date_range)}
+        else:
+            map_figure = render_map(selected_city, slider_month(selected_date_index), metric)
+            map_view = {'city': selected_city, 'start': selected_date_index, 'end': selected_date_index}
+            prefetch_adjacent_months(selected_city, selected_date_index, metric)
+
+        if slider_change:
+            return map_figure, no_update, no_update, no_update, map_view
+
+        if selected_city not in city_indexes:
+            return map_figure, [], [], [], map_view
+
+        metadata = city_indexes[selected_city]['metadata']
+        return map_figure, metadata['sort_options'], metadata['column_options'], metadata['neighborhood_options'], map_view
+
+    @app.callback(
+        Output('map', 'figure', allow_duplicate=True),
+        [Input('density-toggle', 'value'), Input('map-view', 'data'), Input('map', 'relayoutData')],
+        prevent_initial_call=True
+    )
+    def update_density_layer(density_toggle, map_view, relayout_data):
+        """
+        Adds the listing density of the visible part of the map as image layers.
+
+        The density is binned into tiles one zoom level deeper than the map,
+        so the size of the update does not depend on the number of listings.
+        Only the layers of the figure are sent, not the geometry.
+
+        Parameters
+        ----------
+        density_toggle : list
+            Contains 'density' if the density layer is switched on.
+
+        map_view : dict
+            The city and the first and last slider index shown on the map.
+
+        relayout_data : dict
+            The view of the map after the user panned or zoomed.
+
+        Returns
+        -------
+        dash.Patch
+            A partial update of the map figure that replaces its layers.
+
+        Raises
+        ------
+        PreventUpdate
+            If the map was moved while the density layer is switched off.
         """
-        return get_sort_options(listings_data, selected_city)
+        density_points = city_indexes.get((map_view or {}).get('city'), {}).get('density')
+        patch = Patch()
+        if not density_toggle or density_points is None:
+            if ctx.triggered_id == 'map':
+                raise PreventUpdate
+            patch['layout']['mapbox']['layers'] = []
+            return patch
+
+        selected_city, start, end = map_view['city'], map_view['start'], map_view['end']
+        relayout_data = relayout_data or {}
+        if ctx.triggered_id != 'map-view' and 'mapbox._derived' in relayout_data and 'mapbox.zoom' in relayout_data:
+            corners, zoom = relayout_data['mapbox._derived']['coordinates'], relayout_data['mapbox.zoom']
+        elif selected_city in city_data:
+            # A new map figure is shown at the default view of the city
+            corners, zoom = view_corners(city_data[selected_city]['center'], city_data[selected_city]['zoom_level']), city_data[selected_city]['zoom_level']
+        else:
+            raise PreventUpdate
+
+        tile_zoom, tiles = visible_tiles(corners, zoom)
+        scale_key = (selected_city, data_version(selected_city), start, end, tile_zoom)
+        scale = scale_cache.get(scale_key)
+        if scale is None:
+            scale = density_scale(density_points, start, end, tile_zoom)
+            scale_cache.set(scale_key, scale)
+
+        layers = []
+        for tile_x, tile_y in tiles:
+            tile_key = scale_key + (tile_x, tile_y)
+            image = tile_cache.get(tile_key)
+            if image is None:
+                image = density_image(density_tile(density_points, start, end, tile_zoom, tile_x, tile_y), scale) or ''
+                tile_cache.set(tile_key, image)
+            if image:
+                layers.append(density_layer(image, tile_coordinates(tile_zoom, tile_x, tile_y)))
+        patch['layout']['mapbox']['layers'] = layers
+        return patch
+
+    app.clientside_callback(
+        METRIC_SWITCH_JS,
+        Output('map', 'figure'),
+        Input('map-metric', 'value'),
+        State('map', 'figure'),
+        prevent_initial_call=True
+    )
 
     @app.callback(
-        Output('map-container', 'children'),
-        [Input('city-dropdown', 'value'), Input('month-slider', 'value')]
+        Output('search-results', 'children'),
+        [Input('listing-search', 'value'), Input('city-dropdown', 'value')]
+    )
+    def update_search_results(query, selected_city):
+        """
+        Searches the listings of the selected city by name and host name.
+
+        The search uses the inverted index in `city_indexes`, so its cost depends
+        on the number of matching listings rather than on the size of the city.
+
+        Parameters
+        ----------
+        query : str
+            The text entered in the search box.
+
+        selected_city : str
+            The selected city from the dropdown.
+
+        Returns
+        -------
+        dbc.Table, html.Div or None
+            The matching listings with their latest neighbourhood and month,
+            or None if the search box is empty.
+        """
+        search_index = city_indexes.get(selected_city, {}).get('search')
+        if not query or search_index is None:
+            return None
+        return generate_search_results(search_listings(search_index, query))
+
+    @app.callback(
+        [Output('top-hosts-container', 'children'), Output('host-dropdown', 'options')],
+        [Input('city-dropdown', 'value'), Input('month-selection', 'data')]
     )
-    def generate_map_callback(selected_city, selected_date_index):
+    @serialized_outputs
+    def update_top_hosts(selected_city, selected_date_index):
         """
-        Updates the map based on the selected city and date.
+        Updates the table of the hosts with the most listings in the selected city and month,
+        and the hosts whose portfolio can be shown.
+
+        The ranking is precomputed per month in the host index, so this is a lookup.
 
         Parameters
         ----------
@@ -162,11 +686,49 @@ def register_callbacks(app, listings_data, neighborhoods_geojson, neighborhood_s
 
         Returns
         -------
-        dash_html_components.Div
-            A div containing the updated map figure.
+        dcc.Graph or html.Div
+            A table of the top multi-listing hosts, or a message if there are none.
+        list
+            The options of the host dropdown, the top hosts by name and id.
         """
-        selected_month = int(date_marks[selected_date_index].split('-')[1])
-        return generate_map(selected_city, selected_month, neighborhoods_geojson, neighborhood_stats)
+        host_index = city_indexes.get(selected_city, {}).get('hosts')
+        if host_index is None:
+            return html.Div("No host data available"), []
+        hosts = top_hosts(host_index, slider_month(selected_date_index))
+        if hosts.empty:
+            return html.Div("No hosts with more than one listing"), []
+        options = [{'label': f"{name} ({host_id})", 'value': host_id} for name, host_id in zip(hosts['Host'], hosts['Host ID'].tolist())]
+        return serialize_output(generate_table(hosts, height=60 + 30 * len(hosts))), options
+
+    @app.callback(
+        Output('host-portfolio-container', 'children'),
+        [Input('host-dropdown', 'value'), Input('city-dropdown', 'value')]
+    )
+    def update_host_portfolio(host_id, selected_city):
+        """
+        Shows the portfolio of the host selected in the host dropdown.
+
+        The listings and monthly statistics are slices of the host index, so
+        this is a lookup as well.
+
+        Parameters
+        ----------
+        host_id : int
+            The selected host id.
+
+        selected_city : str
+            The selected city from the dropdown.
+
+        Returns
+        -------
+        html.Div or None
+            The tables of the portfolio, or None if no host of the city is selected.
+        """
+        host_index = city_indexes.get(selected_city, {}).get('hosts')
+        if host_id is None or host_index is None:
+            return None
+        portfolio = host_portfolio(host_index, host_id)
+        return generate_host_portfolio(portfolio) if portfolio is not None else None
 
     @app.callback(
         Output('neighborhood-dropdown', 'value'),
@@ -192,12 +754,32 @@ def register_callbacks(app, listings_data, neighborhoods_geojson, neighborhood_s
         Output("modal", "is_open"),
         Output('clicked-neighborhood', 'data'),
         [Input('map', 'clickData')],
-        [State("modal", "is_open")],
+        [
+            State("modal", "is_open"),
+            State('city-dropdown', 'value'),
+            State('month-selection', 'data'),
+            State('sort-dropdown', 'value'),
+            State('columns-dropdown', 'value'),
+            State('order-asc', 'n_clicks'),
+            State('order-desc', 'n_clicks'),
+            State('room-type-filter', 'value'),
+            State('price-min', 'value'),
+            State('price-max', 'value'),
+            State('nights-filter', 'value'),
+            State('rating-filter', 'value'),
+            State('price-over-time', 'n_clicks'),
+            State('rating-over-time', 'n_clicks')
+        ],
     )
-    def toggle_modal(clickData, is_open):
+    def toggle_modal(clickData, is_open, selected_city, selected_date_index, sort_by, selected_columns, n_clicks_asc, n_clicks_desc,
+                     room_types, min_price, max_price, max_nights, min_rating, n_clicks_price, n_clicks_rating):
         """
         Toggles the modal visibility and updates the clicked neighborhood data.
 
+        When the modal is opened, the table and the scatter plot of the clicked
+        neighbourhood are prefetched with the current selection, while the
+        browser is still updating the neighbourhood dropdown that they depend on.
+
         Parameters
         ----------
         clickData : dict
@@ -206,6 +788,13 @@ def register_callbacks(app, listings_data, neighborhoods_geojson, neighborhood_s
         is_open : bool
             Current state of the modal (open or closed).
 
+        selected_city, selected_date_index, sort_by, selected_columns, n_clicks_asc, n_clicks_desc,
+        room_types, min_price, max_price, max_nights, min_rating
+            The selection of the table (see `update_table`).
+
+        n_clicks_price, n_clicks_rating : int
+            The number of times the price and rating buttons of the scatter plot were clicked.
+
         Returns
         -------
         bool
@@ -214,8 +803,17 @@ def register_callbacks(app, listings_data, neighborhoods_geojson, neighborhood_s
             The neighborhood clicked on the map.
         """
         if clickData:
-            neighborhood = clickData['points'][0]['location']
-            return not is_open, neighborhood
+            # The map locates neighbourhoods by feature id, the name is the hover text
+            point = clickData['points'][0]
+            clicked_neighborhood = point.get('hovertext', point['location'])
+            if not is_open and selected_city in city_indexes:
+                selected_month = slider_month(selected_date_index)
+                table_args = (selected_city, selected_month, clicked_neighborhood, sort_by, selected_columns, n_clicks_asc, n_clicks_desc,
+                              room_types, min_price, max_price, max_nights, min_rating)
+                prefetch('table', table_cache, table_key(*table_args), lambda: render_table(*table_args))
+                scatter_args = (selected_city, clicked_neighborhood, n_clicks_price, n_clicks_rating)
+                prefetch('scatter', scatter_cache, scatter_key(*scatter_args), lambda: render_scatter(*scatter_args))
+            return not is_open, clicked_neighborhood
         return is_open, None
 
     @app.callback(
@@ -225,14 +823,19 @@ def register_callbacks(app, listings_data, neighborhoods_geojson, neighborhood_s
             Input('city-dropdown', 'value'), 
             Input('neighborhood-dropdown', 'value'), 
             Input('price-over-time', 'n_clicks'), 
-            Input('rating-over-time', 'n_clicks')
+            Input('rating-over-time', 'n_clicks'),
+            Input('modal', 'is_open')
         ]
     )
-    def update_scatter_plot_callback(selected_city, selected_neighborhood, n_clicks_price, n_clicks_rating):
+    @serialized_outputs
+    def update_scatter_plot_callback(selected_city, selected_neighborhood, n_clicks_price, n_clicks_rating, is_open):
         """
         Updates the scatter plot figure and title based on the selected city, neighborhood, 
         and the number of clicks on the price or rating buttons.
 
+        Like the table, the scatter plot is only rendered while the modal is open
+        and served from a cache when the modal is reopened with the same inputs.
+
         Parameters
         ----------
         selected_city : str
@@ -247,6 +850,9 @@ def register_callbacks(app, listings_data, neighborhoods_geojson, neighborhood_s
         n_clicks_rating : int
             The number of times the rating button was clicked.
 
+        is_open : bool
+            Whether the modal containing the scatter plot is open.
+
         Returns
         -------
         plotly.graph_objs.Figure
@@ -257,31 +863,120 @@ def register_callbacks(app, listings_data, neighborhoods_geojson, neighborhood_s
 
         Raises
         ------
-        KeyError
-            If the selected city is not in the listings data.
+        PreventUpdate
+            If the modal is closed and the scatter plot is not visible.
         """
-        if selected_city not in listings_data:
+        if not is_open:
+            raise PreventUpdate
+
+        if selected_city not in city_indexes:
             return go.Figure(), ""
 
-        listings_filtered = filter_listings(listings_data, selected_city, None, selected_neighborhood)
-        return update_scatter_plot(selected_city, selected_neighborhood, n_clicks_price, n_clicks_rating, listings_data)
+        return render_scatter(selected_city, selected_neighborhood, n_clicks_price, n_clicks_rating)
 
     @app.callback(
-        Output('neighborhood-dropdown', 'options'),
-        [Input('city-dropdown', 'value')]
+        Output('export-job', 'data'),
+        Input('export-button', 'n_clicks'),
+        [
+            State('export-format', 'value'),
+            State('city-dropdown', 'value'),
+            State('month-selection', 'data'),
+            State('neighborhood-dropdown', 'value'),
+            State('sort-dropdown', 'value'),
+            State('columns-dropdown', 'value'),
+            State('order-asc', 'n_clicks'),
+            State('order-desc', 'n_clicks'),
+            State('room-type-filter', 'value'),
+            State('price-min', 'value'),
+            State('price-max', 'value'),
+            State('nights-filter', 'value'),
+            State('rating-filter', 'value')
+        ],
+        prevent_initial_call=True
     )
-    def update_neighborhood_options(selected_city):
+    def start_export_job(n_clicks, export_format, selected_city, selected_date_index, selected_neighborhood, sort_by, selected_columns,
+                         n_clicks_asc, n_clicks_desc, room_types, min_price, max_price, max_nights, min_rating):
         """
-        Generates and returns neighborhood options for the dropdown menu.
+        Starts the export of the rows shown in the table, in the table order.
+
+        The export runs in the background (see `utils/export.py`), so the
+        callback returns at once with the id of the job.
 
         Parameters
         ----------
-        selected_city : str
-            The selected city from the dropdown.
+        n_clicks : int
+            The number of times the export button was clicked.
+
+        export_format : str
+            The selected file format.
+
+        selected_city, selected_date_index, selected_neighborhood, sort_by, selected_columns,
+        n_clicks_asc, n_clicks_desc, room_types, min_price, max_price, max_nights, min_rating
+            The selection of the table (see `update_table`).
 
         Returns
         -------
-        list
-            A list of neighborhood options for the dropdown menu.
+        str
+            The id of the export job. It is failed at once, with the reason
+            shown below the progress bar, if the selection cannot be exported.
+
+        Raises
+        ------
+        PreventUpdate
+            If the city is invalid.
+        """
+        if selected_city not in city_indexes:
+            raise PreventUpdate
+        if selected_city not in listings_data:
+            return export_jobs.reject("Exports need the listings in memory, which the DuckDB query backend does not load",
+                                      export_format)
+        selections = {'room_type': room_types, 'minimum_nights': max_nights, 'rating': min_rating}
+        return start_export(export_jobs, listings_data, listing_dims, city_indexes, selected_city, slider_month(selected_date_index),
+                            selected_neighborhood, sort_by, n_clicks_asc > n_clicks_desc, selected_columns, selections,
+                            (min_price, max_price), export_format)
+
+    @app.callback(
+        Output('export-progress', 'value'),
+        Output('export-progress', 'label'),
+        Output('export-link', 'children'),
+        Output('export-poll', 'disabled'),
+        Input('export-job', 'data'),
+        Input('export-poll', 'n_intervals'),
+        prevent_initial_call=True
+    )
+    def update_export_progress(job_id, n_intervals):
+        """
+        Shows the progress of the current export and the download link once it is written.
+
+        Parameters
+        ----------
+        job_id : str
+            The id of the export job.
+
+        n_intervals : int
+            The number of polls so far.
+
+        Returns
+        -------
+        float
+            The progress in percent.
+
+        str
+            The number of rows written.
+
+        html.A or str
+            The download link, an error message or nothing while the export runs.
+
+        bool
+            Whether polling stops, once the export is finished.
         """
-        return get_neighborhood_options(listings_data, selected_city)
+        status = export_jobs.status(job_id) if job_id else None
+        if status is None:
+            return 0, '', '', True
+        percent = 100 * status['rows'] / status['total'] if status['total'] else 100
+        label = f"{status['rows']} / {status['total']} rows"
+        if status['status'] == 'failed':
+            return percent, label, f"Export failed: {status['error']}", True
+        if status['status'] == 'done':
+            return 100, label, html.A(f"Download {status['file_name']}", href=f"/export/{job_id}/download"), True
+        return percent, label, '', False
@@ -1,11 +1,13 @@
 from dash import dcc, html
 import dash_bootstrap_components as dbc
 
-from airbnbDashboard.plots.generate_map import generate_map
-from airbnbDashboard.plots.slider import create_date_slider
+from airbnbDashboard.plots.generate_map import generate_map, map_metrics
+from airbnbDashboard.plots.slider import create_date_slider, create_date_range_slider
 from airbnbDashboard.data.paths import colors
+from airbnbDashboard.utils.export import available_formats
+from airbnbDashboard.data.tracing import phase
 
-def setup_layout(city_options, date_marks, neighborhoods_geojson, neighborhood_stats):
+def setup_layout(city_options, date_marks, neighborhoods_geojson, neighborhood_stats, trace=None):
     """
     This functions defines the layout of the Dash application.
     It uses Dash and Dash Bootstrap Components (dbc) libraries to
@@ -27,6 +29,9 @@ def setup_layout(city_options, date_marks, neighborhoods_geojson, neighborhood_s
     neighborhood_stats : dict
         A dictionary containing the aggregated statistics for each neighborhood.
 
+    trace : StartupTrace, optional
+        If given, the building of the initial map is recorded in it (see `utils/tracing.py`).
+
     Returns
     -------
     html.Div
@@ -43,6 +48,11 @@ def setup_layout(city_options, date_marks, neighborhoods_geojson, neighborhood_s
     and help bug fixing when certain containers were not correctly positioned.
     It also helped to use correct the syntax and add the buttons. 
     """
+    # The map shown before the first callback, built before the rest of the layout so its cost can be traced
+    with phase(trace, 'initial_map', city='Madrid, Spain'):
+        initial_map = generate_map('Madrid, Spain', 1, neighborhoods_geojson, neighborhood_stats)
+    month_slider, month_range_slider = create_date_slider(date_marks), create_date_range_slider(date_marks)
+
     return html.Div([
         # Navbar with Header and City Dropdown
         dbc.Navbar(
@@ -88,14 +98,76 @@ def setup_layout(city_options, date_marks, neighborhoods_geojson, neighborhood_s
         # City selection section
         html.Div(
             [
+                # Search listings of the selected city by name or host
+                html.Div(
+                    [
+                        dcc.Input(
+                            id='listing-search',
+                            type='search',
+                            placeholder='Search listings by name or host',
+                            debounce=True,
+                            style={'width': '100%', 'borderRadius': '10px', 'padding': '5px 10px', 'fontSize': '15px', 'border': '1px solid #7F7F7F'}
+                        ),
+                        html.Div(id='search-results', style={'marginTop': '10px', 'maxHeight': '300px', 'overflowY': 'auto'}),
+                    ],
+                    style={'width': '50%', 'margin': '0 auto 20px auto'}
+                ),
                 # Slider
                 html.H2("SELECT MONTH", style={'fontSize': '19px', 'fontWeight': '580', 'textAlign': 'center', 'color': '#7F7F7F'}),
+                # Switch between a single month and a range of months (e.g. a quarter or season)
+                dcc.RadioItems(
+                    id='slider-mode',
+                    options=[{'label': 'Single Month', 'value': 'month'}, {'label': 'Range of Months', 'value': 'range'}],
+                    value='month',
+                    inline=True,
+                    inputStyle={'marginRight': '5px', 'marginLeft': '15px'},
+                    style={'textAlign': 'center', 'color': '#7F7F7F', 'marginBottom': '10px'}
+                ),
                 html.Div(
-                    create_date_slider(date_marks),
+                    month_slider,
+                    id='month-slider-container',
                     style={'width': '85%', 'margin': '0 auto'}  
                 ),
-                html.Div(id='map-container', children=generate_map('Madrid, Spain', 1, neighborhoods_geojson, neighborhood_stats), 
+                html.Div(
+                    month_range_slider,
+                    id='month-range-slider-container',
+                    style={'width': '85%', 'margin': '0 auto', 'display': 'none'}  
+                ),
+                # Slider values the callbacks depend on, set by a clientside debounce once the slider settles
+                dcc.Store(id='month-selection', data=month_slider.value),
+                dcc.Store(id='month-range-selection', data=month_range_slider.value),
+                # Statistic that colours the map
+                dcc.RadioItems(
+                    id='map-metric',
+                    options=[{'label': label, 'value': metric} for metric, label in map_metrics.items()],
+                    value='avg_price',
+                    inline=True,
+                    inputStyle={'marginRight': '5px', 'marginLeft': '15px'},
+                    style={'textAlign': 'center', 'color': '#7F7F7F', 'margin': '10px 0'}
+                ),
+                # Listing density rendered on the server as image tiles over the map
+                dcc.Checklist(
+                    id='density-toggle',
+                    options=[{'label': 'Show Listing Density', 'value': 'density'}],
+                    value=[],
+                    inputStyle={'marginRight': '5px'},
+                    style={'textAlign': 'center', 'color': '#7F7F7F', 'marginBottom': '10px'}
+                ),
+                # City and months currently shown on the map
+                dcc.Store(id='map-view'),
+                html.Div(id='map-container', children=initial_map, 
                 style={'transition': 'transform 1s', 'width': '80%', 'margin': '0 auto', 'display': 'flex', 'justify-content': 'center', 'boxShadow': '0px 4px 10px #0000001A', 'borderRadius': '10px'}),
+                # Hosts with the most listings in the selected city and month
+                html.H2("TOP HOSTS", style={'fontSize': '19px', 'fontWeight': '580', 'textAlign': 'center', 'color': '#7F7F7F', 'marginTop': '30px'}),
+                html.Div(id='top-hosts-container', style={'width': '80%', 'margin': '0 auto', 'display': 'flex', 'justify-content': 'center'}),
+                # Listings and monthly statistics of one of the top hosts
+                html.Div(
+                    [
+                        dcc.Dropdown(id='host-dropdown', placeholder='Show the portfolio of a top host'),
+                        html.Div(id='host-portfolio-container', style={'marginTop': '10px', 'maxHeight': '400px', 'overflowY': 'auto'}),
+                    ],
+                    style={'width': '50%', 'margin': '20px auto'}
+                ),
             ],
             style={'padding': '10px', 'backgroundColor': colors['background']}
         ),
@@ -163,7 +235,72 @@ def setup_layout(city_options, date_marks, neighborhoods_geojson, neighborhood_s
                                 ),
                             ], width=4),
                         ], style={'margin': '20px 0'}),
-                        html.Div(id='table-container', style={'padding': '20px', 'boxShadow': '0px 4px 10px #0000001A', 'borderRadius': '10px'})
+                        # Facet filters, the counts of each option are added by a callback
+                        dbc.Row([
+                            dbc.Col([
+                                html.H4("Room Type", style={'fontSize': '18px', 'marginTop': '10px', 'textAlign': 'center', 'color': colors['text']}),
+                                dcc.Checklist(
+                                    id='room-type-filter',
+                                    options=[],
+                                    value=[],
+                                    inputStyle={'marginRight': '5px'},
+                                    style={'fontSize': '15px', 'color': colors['text']}
+                                ),
+                            ], width=3),
+                            dbc.Col([
+                                html.H4("Price", style={'fontSize': '18px', 'marginTop': '10px', 'textAlign': 'center', 'color': colors['text']}),
+                                html.Div(
+                                    children=[
+                                        dcc.Input(id='price-min', type='number', min=0, placeholder='Min', debounce=True, style={'width': '45%', 'marginRight': '5%'}),
+                                        dcc.Input(id='price-max', type='number', min=0, placeholder='Max', debounce=True, style={'width': '45%'})
+                                    ],
+                                    style={'width': '100%', 'textAlign': 'center', 'margin': '10px auto'}
+                                ),
+                            ], width=3),
+                            dbc.Col([
+                                html.H4("Minimum Nights", style={'fontSize': '18px', 'marginTop': '10px', 'textAlign': 'center', 'color': colors['text']}),
+                                dcc.Dropdown(
+                                    id='nights-filter',
+                                    placeholder='Any',
+                                    style={'width': '100%', 'margin': '10px auto', 'borderRadius': '10px', 'padding': '1px', 'fontSize': '15px'},
+                                    searchable=False
+                                ),
+                            ], width=3),
+                            dbc.Col([
+                                html.H4("Rating", style={'fontSize': '18px', 'marginTop': '10px', 'textAlign': 'center', 'color': colors['text']}),
+                                dcc.Dropdown(
+                                    id='rating-filter',
+                                    placeholder='Any',
+                                    style={'width': '100%', 'margin': '10px auto', 'borderRadius': '10px', 'padding': '1px', 'fontSize': '15px'},
+                                    searchable=False
+                                ),
+                            ], width=3),
+                        ], style={'margin': '20px 0'}),
+                        html.Div(id='table-container', style={'padding': '20px', 'boxShadow': '0px 4px 10px #0000001A', 'borderRadius': '10px'}),
+                        # Export of the table selection, written in the background with its progress polled
+                        dbc.Row([
+                            dbc.Col([
+                                dcc.RadioItems(
+                                    id='export-format',
+                                    options=[{'label': export_format.upper(), 'value': export_format} for export_format in available_formats()],
+                                    value='csv',
+                                    inline=True,
+                                    inputStyle={'marginRight': '5px', 'marginLeft': '15px'},
+                                    style={'color': colors['text'], 'marginTop': '8px'}
+                                ),
+                            ], width=3),
+                            dbc.Col([
+                                dbc.Button("Export", id='export-button', n_clicks=0, style={'backgroundColor': '#FF5A5F','color': '#FFFFFF','border': '1px solid #FFFFFF','outline': 'none','boxShadow': 'none'}),
+                            ], width=2),
+                            dbc.Col([
+                                dbc.Progress(id='export-progress', value=0, color='danger', style={'height': '20px', 'marginTop': '8px'}),
+                            ], width=4),
+                            dbc.Col([
+                                html.Div(id='export-link', style={'marginTop': '8px', 'color': colors['text']}),
+                            ], width=3),
+                        ], style={'margin': '20px 0'}),
+                        dcc.Store(id='export-job'),
+                        dcc.Interval(id='export-poll', interval=500, disabled=True),
                     ]
                 ),
             ],
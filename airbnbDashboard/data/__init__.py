@@ -7,8 +7,12 @@ Imports:
 load_data : function
     A function to load the GeoJSON and CSV data for each city, grouping and 
     aggregating the data before creating a copy of the relevant columns
-    for later use.
+    for later use. With `chunksize`, the CSV files are streamed in chunks.
     
+join_listings : function
+    A function to join static listing attributes (name, host, room type, ...)
+    from the normalized listing dimension onto a slice of the monthly listings.
+
 city_paths : dict
     A dictionary that contains the city name as key and another 
     dictionary as value that contains the paths to the GeoJSON and CSV files.
@@ -25,16 +29,18 @@ Usage
 -----
 To load data for a specific city:
 
->>> from data import load_data, city_paths, clone_or_update_repo
->>> clone_or_update_repo()  # Ensure the latest data is available
+>>> from data import load_data, city_paths, setup_repo
+>>> from data.paths import repo_url, local_dir
+>>> setup_repo(repo_url, local_dir)  # Ensure the latest data is available
 >>> data = load_data(city_paths)
 
 The `__all__` list specifies the public API of the package, indicating that only
-`load_data`, `city_paths`, `clone_or_update_repo`, and `setup_repo` should be accessible when the package is imported.
+`load_data`, `join_listings`, `city_paths`, `clone_or_update_repo`, and `setup_repo` should be accessible when the package is imported.
 """
 
 from .loader import load_data
+from .normalize import join_listings
 from .paths import city_paths
 from .repo_manager import clone_or_update_repo, setup_repo
 
-__all__ = ['load_data', 'city_paths', 'clone_or_update_repo', 'setup_repo']
+__all__ = ['load_data', 'join_listings', 'city_paths', 'clone_or_update_repo', 'setup_repo']
@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+
+from airbnbDashboard.data.sketches import sketch_buckets, dense_quantiles, price_quantiles
+
+# Monthly values that are averaged for the map, keyed by the statistics column they fill
+range_metrics = {
+    'avg_price': 'price',
+    'avg_ratings': 'review_scores_rating',
+    'number_of_reviews': 'number_of_reviews',
+}
+
+def period_codes(dates):
+    """
+    Converts dates to consecutive month numbers (year * 12 + month - 1).
+
+    Parameters
+    ----------
+    dates : pd.Series or pd.DatetimeIndex
+        The dates to convert.
+
+    Returns
+    -------
+    np.ndarray
+        The month numbers.
+    """
+    dates = pd.DatetimeIndex(dates)
+    return np.asarray(dates.year * 12 + dates.month - 1, dtype=np.int64)
+
+def build_prefix_sums(listings, date_marks):
+    """
+    Builds cumulative sums and counts per neighbourhood over the ordered months of the date slider.
+
+    For every metric in `range_metrics`, the sums and counts of the monthly
+    values are accumulated into matrices of shape (neighbourhoods, months + 1),
+    where column k holds the total of the first k months. The totals of any
+    range of months are the difference of two columns (see `range_stats`).
+    The price quantile sketches are accumulated the same way, with one
+    cumulative bucket count per neighbourhood, month and bucket.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        The monthly listings of a city.
+    date_marks : dict
+        Dictionary containing the marks for the slider ('YYYY-MM' dates).
+
+    Returns
+    -------
+    dict
+        A dictionary with the keys 'neighbourhoods' (array of names),
+        'sums' and 'counts' (dictionaries of cumulative matrices keyed by
+        statistics column), 'rows' (cumulative row counts), 'listings'
+        (cumulative listing counts), 'sketches' (cumulative price sketches
+        of shape (neighbourhoods, months + 1, buckets)) and 'sketch_offset'
+        (the bucket index of the first bucket).
+    """
+    mark_codes = period_codes(pd.to_datetime([date_marks[i] for i in sorted(date_marks)]))
+    n_periods = len(mark_codes)
+
+    neighbourhood_codes, neighbourhoods = pd.factorize(listings['neighbourhood_cleansed'], sort=True)
+    month_codes = np.searchsorted(mark_codes, period_codes(listings['date']))
+    n_cells = len(neighbourhoods) * n_periods
+    cells = neighbourhood_codes * n_periods + month_codes
+
+    def cumulate(weights=None):
+        totals = np.bincount(cells, weights=weights, minlength=n_cells).reshape(len(neighbourhoods), n_periods)
+        return np.concatenate([np.zeros((len(neighbourhoods), 1)), np.cumsum(totals, axis=1)], axis=1)
+
+    sums = {}
+    counts = {}
+    for stat_column, column in range_metrics.items():
+        if column not in listings.columns:
+            continue
+        values = listings[column].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        sums[stat_column] = cumulate(np.where(valid, values, 0.0))
+        counts[stat_column] = cumulate(valid.astype(float))
+
+    prefix_sums = {
+        'neighbourhoods': np.asarray(neighbourhoods),
+        'sums': sums,
+        'counts': counts,
+        'rows': cumulate(),
+        'listings': cumulate(listings['id'].notna().to_numpy(dtype=float)),
+    }
+
+    prices = listings['price'].to_numpy(dtype=float)
+    valid = prices > 0
+    if valid.any():
+        buckets = sketch_buckets(prices[valid])
+        offset = buckets.min()
+        n_buckets = buckets.max() - offset + 1
+        sketches = np.bincount(cells[valid] * n_buckets + (buckets - offset), minlength=n_cells * n_buckets)
+        sketches = np.cumsum(sketches.reshape(len(neighbourhoods), n_periods, n_buckets), axis=1, dtype=np.int32)
+        prefix_sums['sketches'] = np.concatenate([np.zeros((len(neighbourhoods), 1, n_buckets), dtype=np.int32), sketches], axis=1)
+        prefix_sums['sketch_offset'] = int(offset)
+    return prefix_sums
+
+def range_stats(prefix_sums, start_index, end_index):
+    """
+    Computes the neighbourhood statistics over a range of months from the prefix sums.
+
+    Each mean is the difference of two cumulative sums divided by the
+    difference of two cumulative counts, regardless of the length of the range.
+
+    Parameters
+    ----------
+    prefix_sums : dict
+        The result of `build_prefix_sums`.
+    start_index : int
+        The slider index of the first month of the range.
+    end_index : int
+        The slider index of the last month of the range (inclusive).
+
+    Returns
+    -------
+    pd.DataFrame
+        The statistics in the same layout as `neighborhood_stats`:
+        'neighbourhood_cleansed', the mean columns of `range_metrics`,
+        'name' with the average number of listings per month and the price
+        quantiles of `price_quantiles`, estimated from the merged sketches.
+    """
+    start, end = min(start_index, end_index), max(start_index, end_index) + 1
+    stats = pd.DataFrame({'neighbourhood_cleansed': prefix_sums['neighbourhoods']})
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for stat_column, sums in prefix_sums['sums'].items():
+            counts = prefix_sums['counts'][stat_column]
+            stats[stat_column] = (sums[:, end] - sums[:, start]) / (counts[:, end] - counts[:, start])
+    listings = prefix_sums['listings']
+    stats['name'] = np.rint((listings[:, end] - listings[:, start]) / (end - start)).astype(int)
+
+    if 'sketches' in prefix_sums:
+        sketches = prefix_sums['sketches']
+        range_sketches = sketches[:, end] - sketches[:, start]
+        for stat_column, quantile in price_quantiles.items():
+            stats[stat_column] = dense_quantiles(range_sketches, prefix_sums['sketch_offset'], quantile)
+
+    # Neighbourhoods without rows in the range are left out, as for a single month
+    rows = prefix_sums['rows']
+    return stats[rows[:, end] - rows[:, start] > 0].reset_index(drop=True)
+
+def extend_prefix_sums(prefix_sums, n_periods):
+    """
+    Extends the prefix sums to more slider months, which have no rows yet.
+
+    Parameters
+    ----------
+    prefix_sums : dict
+        The result of `build_prefix_sums`.
+    n_periods : int
+        The new number of months of the date slider.
+
+    Returns
+    -------
+    dict
+        The prefix sums with the last cumulative column repeated for the new months.
+    """
+    def extend(cumulative):
+        missing = n_periods + 1 - cumulative.shape[1]
+        if missing <= 0:
+            return cumulative
+        return np.concatenate([cumulative, np.repeat(cumulative[:, -1:], missing, axis=1)], axis=1)
+
+    extended = dict(prefix_sums,
+                    sums={col: extend(sums) for col, sums in prefix_sums['sums'].items()},
+                    counts={col: extend(counts) for col, counts in prefix_sums['counts'].items()},
+                    rows=extend(prefix_sums['rows']),
+                    listings=extend(prefix_sums['listings']))
+    if 'sketches' in prefix_sums:
+        extended['sketches'] = extend(prefix_sums['sketches'])
+    return extended
+
+def merge_prefix_sums(prefix_sums, other, sign=1):
+    """
+    Adds (or subtracts) the prefix sums of other rows of the same city.
+
+    Cumulative sums are additive, so the prefix sums of a new month's rows can
+    be added to those of the history without recomputing them. Both must be
+    built with the same date marks.
+
+    Parameters
+    ----------
+    prefix_sums : dict
+        The result of `build_prefix_sums`.
+    other : dict
+        The result of `build_prefix_sums` for the rows to add.
+    sign : int, optional
+        1 to add the rows, -1 to remove them. The default is 1.
+
+    Returns
+    -------
+    dict
+        The merged prefix sums, with the union of the neighbourhoods.
+    """
+    neighbourhoods = np.union1d(prefix_sums['neighbourhoods'], other['neighbourhoods'])
+    rows = np.searchsorted(neighbourhoods, prefix_sums['neighbourhoods'])
+    other_rows = np.searchsorted(neighbourhoods, other['neighbourhoods'])
+
+    def merge(cumulative, other_cumulative):
+        merged = np.zeros((len(neighbourhoods),) + cumulative.shape[1:], dtype=cumulative.dtype)
+        merged[rows] = cumulative
+        merged[other_rows] += sign * other_cumulative
+        return merged
+
+    merged = {
+        'neighbourhoods': neighbourhoods,
+        'sums': {col: merge(sums, other['sums'][col]) if col in other['sums'] else merge(sums, 0)
+                 for col, sums in prefix_sums['sums'].items()},
+        'counts': {col: merge(counts, other['counts'][col]) if col in other['counts'] else merge(counts, 0)
+                   for col, counts in prefix_sums['counts'].items()},
+        'rows': merge(prefix_sums['rows'], other['rows']),
+        'listings': merge(prefix_sums['listings'], other['listings']),
+    }
+
+    sketches = [sums for sums in (prefix_sums, other) if 'sketches' in sums]
+    if sketches:
+        # Both sketches are placed on the union of their buckets
+        offset = min(sums['sketch_offset'] for sums in sketches)
+        n_buckets = max(sums['sketch_offset'] + sums['sketches'].shape[2] for sums in sketches) - offset
+        combined = np.zeros((len(neighbourhoods), prefix_sums['rows'].shape[1], n_buckets), dtype=np.int32)
+        for sums, positions, factor in ((prefix_sums, rows, 1), (other, other_rows, sign)):
+            if 'sketches' in sums:
+                first = sums['sketch_offset'] - offset
+                combined[positions, :, first:first + sums['sketches'].shape[2]] += factor * sums['sketches']
+        merged['sketches'] = combined
+        merged['sketch_offset'] = int(offset)
+    return merged
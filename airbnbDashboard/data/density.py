@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+
+from airbnbDashboard.data.aggregates import period_codes
+from airbnbDashboard.data.normalize import join_listings
+
+# Number of bins along each side of a density tile
+tile_bins = 64
+
+# Maximum number of tiles rendered for one view, the tile zoom is reduced above it
+max_tiles = 24
+
+def mercator(lon, lat):
+    """
+    Projects coordinates to Web Mercator, scaled to [0, 1] in both directions.
+
+    Parameters
+    ----------
+    lon, lat : np.ndarray
+        The longitudes and latitudes in degrees.
+
+    Returns
+    -------
+    x, y : np.ndarray
+        The projected coordinates. y grows from north to south, like tile rows.
+    """
+    lat = np.radians(np.clip(lat, -85.05112878, 85.05112878))
+    x = (np.asarray(lon) + 180) / 360
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2
+    return x, y
+
+def tile_coordinates(zoom, tile_x, tile_y):
+    """
+    Returns the corners of a tile as [lon, lat] pairs, clockwise from the top left.
+
+    Parameters
+    ----------
+    zoom, tile_x, tile_y : int
+        The zoom level and the column and row of the tile.
+
+    Returns
+    -------
+    list
+        The corners in the order expected by image layers of the map.
+    """
+    n = 2 ** zoom
+    lon_left, lon_right = tile_x / n * 360 - 180, (tile_x + 1) / n * 360 - 180
+    lat_top = float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * tile_y / n)))))
+    lat_bottom = float(np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (tile_y + 1) / n)))))
+    return [[lon_left, lat_top], [lon_right, lat_top], [lon_right, lat_bottom], [lon_left, lat_bottom]]
+
+def build_density_points(listings, listing_dim, date_marks):
+    """
+    Builds the projected listing coordinates of a city, ordered by the months of the date slider.
+
+    The points of any range of slider months are one contiguous slice.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        The monthly listings of a city.
+    listing_dim : pd.DataFrame
+        The static listing attributes of the city, with 'latitude' and 'longitude'.
+    date_marks : dict
+        Dictionary containing the marks for the slider ('YYYY-MM' dates).
+
+    Returns
+    -------
+    dict or None
+        A dictionary with the projected coordinates 'x' and 'y' and
+        'period_starts' (the first point of each slider month, plus the end).
+        None if the listings have no coordinates.
+    """
+    if listing_dim is None or not {'latitude', 'longitude'} <= set(listing_dim.columns):
+        return None
+
+    points = join_listings(listings[['id', 'date']], listing_dim, ['latitude', 'longitude'])
+    points = points.dropna(subset=['latitude', 'longitude'])
+    mark_codes = period_codes(pd.to_datetime([date_marks[i] for i in sorted(date_marks)]))
+    periods = np.searchsorted(mark_codes, period_codes(points['date']))
+    order = np.argsort(periods, kind='stable')
+
+    x, y = mercator(points['longitude'].to_numpy(dtype=float)[order], points['latitude'].to_numpy(dtype=float)[order])
+    return {
+        'x': x,
+        'y': y,
+        'period_starts': np.searchsorted(periods[order], np.arange(len(mark_codes) + 1)),
+    }
+
+def visible_tiles(corners, zoom):
+    """
+    Returns the tiles that cover a view of the map.
+
+    Parameters
+    ----------
+    corners : list
+        The [lon, lat] corners of the view.
+    zoom : float
+        The zoom level of the map. Map tiles are 512 pixels wide, so density
+        tiles one level deeper are about 256 pixels wide on screen.
+
+    Returns
+    -------
+    tile_zoom : int
+        The zoom level of the tiles.
+    tiles : list of tuple
+        The (column, row) of each tile.
+    """
+    lons, lats = zip(*corners)
+    x, y = mercator(np.array(lons, dtype=float), np.array(lats, dtype=float))
+    tile_zoom = int(np.clip(np.floor(zoom) + 1, 0, 20))
+    while True:
+        n = 2 ** tile_zoom
+        columns = range(int(np.floor(x.min() * n)), int(np.floor(x.max() * n)) + 1)
+        rows = range(max(int(np.floor(y.min() * n)), 0), min(int(np.floor(y.max() * n)), n - 1) + 1)
+        if len(columns) * len(rows) <= max_tiles or tile_zoom == 0:
+            return tile_zoom, [(column % n, row) for column in columns for row in rows]
+        tile_zoom -= 1
+
+def view_corners(center, zoom, width=1200, height=750):
+    """
+    Estimates the corners of the map view from its center and zoom.
+
+    Parameters
+    ----------
+    center : dict
+        The 'lat' and 'lon' of the center.
+    zoom : float
+        The zoom level of the map.
+    width, height : int, optional
+        The size of the map in pixels. The defaults match the map component.
+
+    Returns
+    -------
+    list
+        The [lon, lat] corners of the view.
+    """
+    x, y = mercator(np.array([center['lon']]), np.array([center['lat']]))
+    half_width, half_height = width / (512 * 2 ** zoom) / 2, height / (512 * 2 ** zoom) / 2
+    xs = np.array([x[0] - half_width, x[0] + half_width])
+    ys = np.clip([y[0] - half_height, y[0] + half_height], 0, 1)
+    lons = xs * 360 - 180
+    lats = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * ys))))
+    return [[lons[0], lats[0]], [lons[1], lats[0]], [lons[1], lats[1]], [lons[0], lats[1]]]
+
+def density_tile(density_points, start_index, end_index, zoom, tile_x, tile_y):
+    """
+    Counts the listings of a range of slider months in the bins of one tile.
+
+    Parameters
+    ----------
+    density_points : dict
+        The result of `build_density_points`.
+    start_index, end_index : int
+        The first and last slider index of the range (inclusive).
+    zoom, tile_x, tile_y : int
+        The zoom level and the column and row of the tile.
+
+    Returns
+    -------
+    np.ndarray
+        The counts of shape (`tile_bins`, `tile_bins`), rows from north to south.
+    """
+    start = density_points['period_starts'][start_index]
+    end = density_points['period_starts'][end_index + 1]
+    n = 2 ** zoom
+    x = density_points['x'][start:end] * n - tile_x
+    y = density_points['y'][start:end] * n - tile_y
+    inside = (x >= 0) & (x < 1) & (y >= 0) & (y < 1)
+    counts, _, _ = np.histogram2d(y[inside], x[inside], bins=tile_bins, range=[[0, 1], [0, 1]])
+    return counts
+
+def density_scale(density_points, start_index, end_index, zoom):
+    """
+    Returns the largest bin count of a range of slider months at a zoom level.
+
+    All tiles of the same zoom level are coloured relative to this count, so
+    neighbouring tiles share one colour scale.
+
+    Parameters
+    ----------
+    density_points : dict
+        The result of `build_density_points`.
+    start_index, end_index : int
+        The first and last slider index of the range (inclusive).
+    zoom : int
+        The zoom level of the tiles.
+
+    Returns
+    -------
+    int
+        The largest number of listings in a bin, at least 1.
+    """
+    start = density_points['period_starts'][start_index]
+    end = density_points['period_starts'][end_index + 1]
+    scale = 2 ** zoom * tile_bins
+    bins = np.floor(density_points['x'][start:end] * scale).astype(np.int64) * scale
+    bins += np.floor(density_points['y'][start:end] * scale).astype(np.int64)
+    if len(bins) == 0:
+        return 1
+    return int(np.unique(bins, return_counts=True)[1].max())
+
+def merge_density_points(density_points, other):
+    """
+    Adds the density points of other rows of the same city.
+
+    The new points are inserted at the end of their slider month, so the
+    points of every month stay one contiguous slice. Both must be built with
+    the same date marks (see `extend_density_points`).
+
+    Parameters
+    ----------
+    density_points : dict
+        The result of `build_density_points`.
+    other : dict
+        The result of `build_density_points` for the rows to add.
+
+    Returns
+    -------
+    dict
+        The merged density points.
+    """
+    # Every new point goes before the end of its month in the existing points
+    positions = np.repeat(density_points['period_starts'][1:], np.diff(other['period_starts']))
+    return {
+        'x': np.insert(density_points['x'], positions, other['x']),
+        'y': np.insert(density_points['y'], positions, other['y']),
+        'period_starts': density_points['period_starts'] + other['period_starts'],
+    }
+
+def extend_density_points(density_points, n_periods):
+    """
+    Extends the density points to more slider months, which have no points yet.
+
+    Parameters
+    ----------
+    density_points : dict
+        The result of `build_density_points`.
+    n_periods : int
+        The new number of months of the date slider.
+
+    Returns
+    -------
+    dict
+        The density points with empty slices for the new months.
+    """
+    period_starts = density_points['period_starts']
+    missing = n_periods + 1 - len(period_starts)
+    if missing <= 0:
+        return density_points
+    return dict(density_points, period_starts=np.append(period_starts, np.repeat(period_starts[-1], missing)))
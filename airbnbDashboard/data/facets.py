@@ -0,0 +1,296 @@
+import numpy as np
+
+from airbnbDashboard.data.normalize import join_listings
+
+# Facet options of the modal table: "rated at least" and "bookable for at most N nights"
+rating_thresholds = [3.0, 4.0, 4.5, 4.8]
+minimum_nights_bands = [1, 2, 7, 30]
+
+def build_facet_index(listings, listing_dim=None):
+    """
+    Builds the facet index of a city for filtering the modal table.
+
+    The rows are ordered by month and neighbourhood, so every partition shown
+    in the modal is a contiguous slice, and by price within each partition, so
+    a price range is a binary search. For every option of the other facets
+    (room type, rating threshold, minimum nights band) a bitmap over the same
+    order marks the matching rows, and combining facets is a bitwise AND.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        The monthly listings of a city.
+    listing_dim : pd.DataFrame, optional
+        The static listing attributes of the city, used for 'room_type' and
+        'minimum_nights' if they are not in `listings`.
+
+    Returns
+    -------
+    dict
+        A dictionary with the keys 'order' (row positions in `listings`),
+        'partitions' ((month, neighbourhood) -> (start, end)), 'prices'
+        (the prices in index order) and 'bitmaps' (facet -> option -> boolean
+        array in index order) for the facets 'room_type', 'rating' and
+        'minimum_nights'.
+    """
+    columns = join_listings(listings[['id', 'month', 'neighbourhood_cleansed', 'price', 'review_scores_rating']],
+                            listing_dim, ['room_type', 'minimum_nights'])
+    columns = columns.assign(position=np.arange(len(columns)))
+    columns = columns.sort_values(['month', 'neighbourhood_cleansed', 'price'], kind='stable')
+
+    keys = columns[['month', 'neighbourhood_cleansed']]
+    starts = np.flatnonzero(~keys.duplicated().to_numpy())
+    ends = np.append(starts[1:], len(columns))
+    partitions = {(int(month), neighbourhood): (int(start), int(end))
+                  for (month, neighbourhood), start, end in zip(keys.iloc[starts].itertuples(index=False), starts, ends)}
+
+    bitmaps = {'room_type': {}, 'rating': {}, 'minimum_nights': {}}
+    if 'room_type' in columns.columns:
+        room_types = columns['room_type'].to_numpy()
+        for room_type in sorted(columns['room_type'].dropna().unique()):
+            bitmaps['room_type'][room_type] = room_types == room_type
+    ratings = columns['review_scores_rating'].to_numpy(dtype=float)
+    for threshold in rating_thresholds:
+        bitmaps['rating'][threshold] = ratings >= threshold
+    if 'minimum_nights' in columns.columns:
+        minimum_nights = columns['minimum_nights'].to_numpy(dtype=float)
+        for band in minimum_nights_bands:
+            bitmaps['minimum_nights'][band] = minimum_nights <= band
+
+    return {
+        'order': columns['position'].to_numpy(),
+        'partitions': partitions,
+        'prices': columns['price'].to_numpy(dtype=float),
+        'bitmaps': bitmaps,
+    }
+
+def facet_masks(facet_index, start, end, selections):
+    """
+    Returns the bitmap of each selected facet over the rows from `start` to `end`.
+
+    Parameters
+    ----------
+    facet_index : dict
+        The result of `build_facet_index`.
+    start, end : int
+        The rows of the index to consider.
+    selections : dict
+        The selected options keyed by facet: a list of room types for
+        'room_type', a threshold for 'rating' and a band for 'minimum_nights'.
+        Facets without a selection (None or empty) are left out.
+
+    Returns
+    -------
+    dict
+        A boolean array per selected facet.
+    """
+    masks = {}
+    for facet, selected in selections.items():
+        if selected is None or selected == []:
+            continue
+        options = selected if isinstance(selected, list) else [selected]
+        bitmaps = facet_index['bitmaps'][facet]
+        mask = np.zeros(end - start, dtype=bool)
+        for option in options:
+            if option in bitmaps:
+                mask |= bitmaps[option][start:end]
+        masks[facet] = mask
+    return masks
+
+def price_bounds(facet_index, start, end, price_range):
+    """
+    Narrows the rows of a partition to a price range by binary search.
+
+    Parameters
+    ----------
+    facet_index : dict
+        The result of `build_facet_index`.
+    start, end : int
+        The rows of the partition.
+    price_range : tuple
+        The minimum and maximum price (inclusive). Either may be None.
+
+    Returns
+    -------
+    tuple of int
+        The rows of the partition within the price range.
+    """
+    min_price, max_price = price_range
+    prices = facet_index['prices'][start:end]
+    low = 0 if min_price is None else np.searchsorted(prices, min_price, side='left')
+    high = end - start if max_price is None else np.searchsorted(prices, max_price, side='right')
+    return start + int(low), start + max(int(low), int(high))
+
+def filter_facets(listings, facet_index, selected_month, selected_neighborhood, selections=None, price_range=(None, None)):
+    """
+    Filters the listings of a city by month, neighbourhood and facets using the facet index.
+
+    Without facets, the result is the same as `filter_listings`.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        The monthly listings of the city the index was built from.
+    facet_index : dict
+        The result of `build_facet_index`.
+    selected_month : int
+        The selected month from the slider.
+    selected_neighborhood : str
+        The selected neighborhood from the dropdown.
+    selections : dict, optional
+        The selected facet options (see `facet_masks`).
+    price_range : tuple, optional
+        The minimum and maximum price. The default is no price filter.
+
+    Returns
+    -------
+    pd.DataFrame
+        The matching listings, in their original order.
+    """
+    return listings.iloc[filter_positions(facet_index, selected_month, selected_neighborhood, selections, price_range)]
+
+def filter_positions(facet_index, selected_month, selected_neighborhood, selections=None, price_range=(None, None)):
+    """
+    Returns the row positions of the listings that match a month, neighbourhood and facets.
+
+    Parameters
+    ----------
+    facet_index : dict
+        The result of `build_facet_index`.
+    selected_month : int
+        The selected month from the slider.
+    selected_neighborhood : str
+        The selected neighborhood from the dropdown.
+    selections : dict, optional
+        The selected facet options (see `facet_masks`).
+    price_range : tuple, optional
+        The minimum and maximum price. The default is no price filter.
+
+    Returns
+    -------
+    np.ndarray
+        The sorted positions of the matching rows in the listings the index was built from.
+    """
+    partition = facet_index['partitions'].get((selected_month, selected_neighborhood))
+    if partition is None:
+        return np.array([], dtype=np.int64)
+    start, end = price_bounds(facet_index, *partition, price_range)
+    mask = np.ones(end - start, dtype=bool)
+    for facet_mask in facet_masks(facet_index, start, end, selections or {}).values():
+        mask &= facet_mask
+    return np.sort(facet_index['order'][start:end][mask])
+
+def facet_counts(facet_index, selected_month, selected_neighborhood, selections=None, price_range=(None, None)):
+    """
+    Counts the matching listings of every facet option.
+
+    The count of an option is the number of listings that match it and all
+    other selected facets, so it is the number of rows the table would show
+    when the option is selected instead of the current selection of its facet.
+
+    Parameters
+    ----------
+    facet_index : dict
+        The result of `build_facet_index`.
+    selected_month : int
+        The selected month from the slider.
+    selected_neighborhood : str
+        The selected neighborhood from the dropdown.
+    selections : dict, optional
+        The selected facet options (see `facet_masks`).
+    price_range : tuple, optional
+        The minimum and maximum price. The default is no price filter.
+
+    Returns
+    -------
+    dict
+        The counts keyed by facet and option.
+    """
+    partition = facet_index['partitions'].get((selected_month, selected_neighborhood))
+    if partition is None:
+        return {facet: {option: 0 for option in bitmaps} for facet, bitmaps in facet_index['bitmaps'].items()}
+    start, end = price_bounds(facet_index, *partition, price_range)
+    masks = facet_masks(facet_index, start, end, selections or {})
+
+    counts = {}
+    for facet, bitmaps in facet_index['bitmaps'].items():
+        others = np.ones(end - start, dtype=bool)
+        for other_facet, mask in masks.items():
+            if other_facet != facet:
+                others &= mask
+        counts[facet] = {option: int(np.count_nonzero(bitmap[start:end] & others)) for option, bitmap in bitmaps.items()}
+    return counts
+
+def update_facet_index(facet_index, listings, listing_dim, selected_month, removed=(), added=()):
+    """
+    Updates the facet index of a city after rows of one calendar month were removed or appended.
+
+    Only the rows of `selected_month` are sorted again, the other months keep
+    their order and bitmaps, shifted to the new row positions.
+
+    Parameters
+    ----------
+    facet_index : dict
+        The result of `build_facet_index` for the listings before the change.
+    listings : pd.DataFrame
+        The monthly listings of the city after the change: the previous
+        listings without the `removed` rows, followed by the new rows.
+    listing_dim : pd.DataFrame or None
+        The static listing attributes of the city.
+    selected_month : int
+        The calendar month of all removed and added rows.
+    removed : array-like, optional
+        The sorted positions of the removed rows in the previous listings.
+    added : array-like, optional
+        The positions of the added rows in `listings`.
+
+    Returns
+    -------
+    dict
+        The updated facet index.
+    """
+    removed = np.asarray(removed, dtype=np.int64)
+    order = facet_index['order']
+    partitions = facet_index['partitions']
+
+    # The rows of the month are one contiguous block of the index
+    block = [bounds for (month, _), bounds in partitions.items() if month == selected_month]
+    if block:
+        block_start, block_end = min(start for start, _ in block), max(end for _, end in block)
+    else:
+        later = [start for (month, _), (start, _) in partitions.items() if month > selected_month]
+        block_start = block_end = min(later) if later else len(order)
+
+    def shift(positions):
+        return positions - np.searchsorted(removed, positions)
+
+    block_rows = order[block_start:block_end]
+    block_rows = shift(block_rows[~np.isin(block_rows, removed)])
+    block_rows = np.concatenate([block_rows, np.asarray(added, dtype=block_rows.dtype)])
+    block_index = build_facet_index(listings.iloc[block_rows], listing_dim)
+    size_change = len(block_rows) - (block_end - block_start)
+
+    bitmaps = {}
+    for facet, options in facet_index['bitmaps'].items():
+        block_options = block_index['bitmaps'][facet]
+        bitmaps[facet] = {}
+        for option in sorted(set(options) | set(block_options)):
+            before = options.get(option, np.zeros(len(order), dtype=bool))
+            inside = block_options.get(option, np.zeros(len(block_rows), dtype=bool))
+            bitmaps[facet][option] = np.concatenate([before[:block_start], inside, before[block_end:]])
+
+    updated_partitions = {}
+    for (month, neighbourhood), (start, end) in partitions.items():
+        if month < selected_month:
+            updated_partitions[(month, neighbourhood)] = (start, end)
+        elif month > selected_month:
+            updated_partitions[(month, neighbourhood)] = (start + size_change, end + size_change)
+    for key, (start, end) in block_index['partitions'].items():
+        updated_partitions[key] = (block_start + start, block_start + end)
+
+    return {
+        'order': np.concatenate([shift(order[:block_start]), block_rows[block_index['order']], shift(order[block_end:])]),
+        'partitions': updated_partitions,
+        'prices': np.concatenate([facet_index['prices'][:block_start], block_index['prices'], facet_index['prices'][block_end:]]),
+        'bitmaps': bitmaps,
+    }
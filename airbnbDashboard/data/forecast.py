@@ -0,0 +1,294 @@
+from concurrent.futures import ProcessPoolExecutor
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+
+# Number of months forecast when the listings contain no forecast rows
+forecast_horizon = 2
+
+# Length of the seasonal cycle in months, for the seasonal naive model
+season_length = 12
+
+# Smoothing parameters tried for simple exponential smoothing
+smoothing_levels = np.linspace(0.1, 0.9, 9)
+
+# Coverage of the forecast intervals
+interval_level = 0.95
+
+def build_scatter_cube(listings):
+    """
+    Builds the neighbourhood x date matrices shown by the scatter plot of a city.
+
+    The rows with a listing id are the history. The rows without one are the
+    forecasts of the combined CSV files, one per neighbourhood and month after
+    the history; they only provide the forecast dates here, the values are
+    computed by `forecast_cube`.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        The monthly listings of a city.
+
+    Returns
+    -------
+    dict
+        A dictionary with the keys 'neighbourhoods' (sorted), 'dates' (history
+        and forecast dates), 'history' (the number of history dates),
+        'mean_price', 'mean_rating', 'conf_int_lower' and 'conf_int_upper'
+        (float arrays of shape (neighbourhoods, dates)) and 'best_model'
+        (the model of each neighbourhood, None before `forecast_cube`).
+    """
+    history = listings[listings['id'].notna()]
+    neighbourhood_codes, neighbourhoods = pd.factorize(listings['neighbourhood_cleansed'], sort=True)
+    history_dates = np.sort(history['date'].unique())
+    last_date = pd.Timestamp(history_dates[-1]) if len(history_dates) else pd.NaT
+    forecast_dates = np.sort(listings.loc[listings['date'] > last_date, 'date'].unique())
+    if not len(forecast_dates) and len(history_dates):
+        forecast_dates = pd.date_range(last_date.to_period('M').to_timestamp(), periods=forecast_horizon + 1, freq='MS')[1:].to_numpy()
+    dates = pd.DatetimeIndex(np.concatenate([history_dates, forecast_dates]))
+
+    # Means of the history per neighbourhood and date, as sums and counts over flat cells
+    n_neighbourhoods, n_dates = len(neighbourhoods), len(dates)
+    codes = neighbourhood_codes[listings['id'].notna().to_numpy()]
+    cells = codes * n_dates + np.searchsorted(history_dates, history['date'].to_numpy())
+
+    def mean(column):
+        values = history[column].to_numpy(dtype=float)
+        valid = ~np.isnan(values)
+        sums = np.bincount(cells[valid], weights=values[valid], minlength=n_neighbourhoods * n_dates)
+        counts = np.bincount(cells[valid], minlength=n_neighbourhoods * n_dates)
+        with np.errstate(invalid='ignore'):
+            return (sums / np.where(counts > 0, counts, np.nan)).reshape(n_neighbourhoods, n_dates)
+
+    return {
+        'neighbourhoods': np.asarray(neighbourhoods),
+        'dates': dates,
+        'history': len(history_dates),
+        'mean_price': mean('price'),
+        'mean_rating': mean('review_scores_rating'),
+        'conf_int_lower': np.full((n_neighbourhoods, n_dates), np.nan),
+        'conf_int_upper': np.full((n_neighbourhoods, n_dates), np.nan),
+        'best_model': np.full(n_neighbourhoods, None, dtype=object),
+    }
+
+def append_history(scatter_cube, listings):
+    """
+    Adds the history of a new month to a scatter cube, after its current history.
+
+    The forecast dates move on by one month and are left empty for `forecast_cube`.
+
+    Parameters
+    ----------
+    scatter_cube : dict
+        The result of `build_scatter_cube` or `forecast_cube`.
+    listings : pd.DataFrame
+        The monthly listings of the new month, all with a listing id.
+
+    Returns
+    -------
+    dict
+        The scatter cube with one more history date.
+
+    Raises
+    ------
+    ValueError
+        If the new month is not after the history of the cube.
+    """
+    month = pd.Timestamp(listings['date'].min())
+    history = scatter_cube['history']
+    if history and month.to_period('M') <= scatter_cube['dates'][history - 1].to_period('M'):
+        raise ValueError(f"{month:%Y-%m} is not after the last month of the history")
+    n_forecasts = len(scatter_cube['dates']) - history
+    forecast_dates = pd.date_range(month.to_period('M').to_timestamp(), periods=n_forecasts + 1, freq='MS')[1:]
+    dates = scatter_cube['dates'][:history].append(pd.DatetimeIndex([month])).append(forecast_dates)
+
+    new_month = build_scatter_cube(listings)
+    neighbourhoods = np.union1d(scatter_cube['neighbourhoods'], new_month['neighbourhoods'])
+    rows = np.searchsorted(neighbourhoods, scatter_cube['neighbourhoods'])
+    new_rows = np.searchsorted(neighbourhoods, new_month['neighbourhoods'])
+
+    def extend(column):
+        values = np.full((len(neighbourhoods), len(dates)), np.nan)
+        values[rows, :history] = scatter_cube[column][:, :history]
+        values[new_rows, history] = new_month[column][:, 0]
+        return values
+
+    return {
+        'neighbourhoods': neighbourhoods,
+        'dates': dates,
+        'history': history + 1,
+        'mean_price': extend('mean_price'),
+        'mean_rating': extend('mean_rating'),
+        'conf_int_lower': np.full((len(neighbourhoods), len(dates)), np.nan),
+        'conf_int_upper': np.full((len(neighbourhoods), len(dates)), np.nan),
+        'best_model': np.full(len(neighbourhoods), None, dtype=object),
+    }
+
+def one_step_errors(series):
+    """
+    Computes the in-sample one-step forecast errors of each model for all series at once.
+
+    The models are the naive forecast (the last observed value), the seasonal
+    naive forecast (the value one season earlier) and simple exponential
+    smoothing for every value in `smoothing_levels`. Missing values are
+    skipped: they produce no error and leave the smoothed level unchanged.
+
+    Parameters
+    ----------
+    series : np.ndarray
+        The observed values of shape (series, time), NaN where missing.
+
+    Returns
+    -------
+    errors : dict
+        The errors of shape (series, time), NaN where there is no forecast or
+        no observation, keyed by 'Naive', 'SeasonalNaive' and the index of the
+        smoothing level.
+    last : np.ndarray
+        The last observed value of each series.
+    levels : np.ndarray
+        The final smoothed level of each series, shape (smoothing levels, series).
+    """
+    n_series, n_times = series.shape
+    observed = ~np.isnan(series)
+
+    # The last observed value before each time step, carried forward over gaps
+    positions = np.where(observed, np.arange(n_times), -1)
+    np.maximum.accumulate(positions, axis=1, out=positions)
+    carried = np.where(positions >= 0, np.take_along_axis(series, np.maximum(positions, 0), axis=1), np.nan)
+    errors = {'Naive': np.full_like(series, np.nan)}
+    errors['Naive'][:, 1:] = series[:, 1:] - carried[:, :-1]
+
+    errors['SeasonalNaive'] = np.full_like(series, np.nan)
+    errors['SeasonalNaive'][:, season_length:] = series[:, season_length:] - series[:, :-season_length]
+
+    # Simple exponential smoothing for all series and smoothing levels, one time step at a time
+    alphas = smoothing_levels[:, None]
+    levels = np.full((len(smoothing_levels), n_series), np.nan)
+    smoothing_errors = np.full((len(smoothing_levels), n_series, n_times), np.nan)
+    for t in range(n_times):
+        value = series[:, t]
+        error = value - levels
+        smoothing_errors[:, :, t] = error
+        update = np.where(np.isnan(levels), value, levels + alphas * error)
+        levels = np.where(observed[:, t], update, levels)
+    for i in range(len(smoothing_levels)):
+        errors[i] = smoothing_errors[i]
+    return errors, carried[:, -1], levels
+
+def forecast_cube(cube):
+    """
+    Fits all neighbourhood price series of a city in one vectorized pass and
+    fills in the forecasts and their intervals.
+
+    For each neighbourhood, the model with the lowest in-sample mean squared
+    one-step error is chosen (see `one_step_errors`); the seasonal naive model
+    needs at least one full season of history. The intervals assume normal
+    errors with the standard deviation of the one-step errors, widened with
+    the horizon as usual for each model.
+
+    Parameters
+    ----------
+    cube : dict
+        The result of `build_scatter_cube`.
+
+    Returns
+    -------
+    dict
+        The cube with the forecast dates of 'mean_price', 'conf_int_lower',
+        'conf_int_upper' and 'best_model' filled in.
+    """
+    history = cube['history']
+    if history == 0:
+        return cube
+    series = cube['mean_price'][:, :history]
+    horizons = np.arange(1, cube['mean_price'].shape[1] - history + 1)
+    errors, last, levels = one_step_errors(series)
+
+    models = list(errors)
+    squared = np.stack([errors[model] for model in models]) ** 2
+    counts = (~np.isnan(squared)).sum(axis=2)
+    with np.errstate(invalid='ignore'):
+        mse = np.where(counts > 0, np.nansum(squared, axis=2) / counts, np.nan)
+    # Series with a single value have no errors and fall back to the naive forecast
+    best = np.where(np.isnan(mse).all(axis=0), 0, np.argmin(np.where(np.isnan(mse), np.inf, mse), axis=0))
+    sigma = np.sqrt(mse[best, np.arange(len(series))])
+
+    # Point forecasts and interval widths of every model, then the best one per series
+    points = np.empty((len(models), len(series), len(horizons)))
+    widths = np.empty_like(points)
+    points[0] = last[:, None]
+    widths[0] = np.sqrt(horizons)
+    if history >= season_length:
+        # A missing value one season earlier falls back to the naive forecast
+        seasonal = series[:, history - season_length + (horizons - 1) % season_length]
+        points[1] = np.where(np.isnan(seasonal), last[:, None], seasonal)
+    else:
+        points[1] = np.nan
+    widths[1] = np.sqrt((horizons - 1) // season_length + 1)
+    for i, alpha in enumerate(smoothing_levels):
+        points[2 + i] = levels[i][:, None]
+        widths[2 + i] = np.sqrt(1 + (horizons - 1) * alpha ** 2)
+    rows = np.arange(len(series))
+    point = points[best, rows]
+    margin = NormalDist().inv_cdf((1 + interval_level) / 2) * sigma[:, None] * widths[best, rows]
+
+    mean_price = cube['mean_price'].copy()
+    conf_int_lower = cube['conf_int_lower'].copy()
+    conf_int_upper = cube['conf_int_upper'].copy()
+    mean_price[:, history:] = point
+    conf_int_lower[:, history:] = point - margin
+    conf_int_upper[:, history:] = point + margin
+    names = np.array(['Naive', 'SeasonalNaive'] + ['ETS'] * len(smoothing_levels), dtype=object)
+    best_model = np.where(np.isnan(point).all(axis=1), None, names[best])
+    return dict(cube, mean_price=mean_price, conf_int_lower=conf_int_lower, conf_int_upper=conf_int_upper,
+                best_model=best_model)
+
+def forecast_cities(scatter_cubes, processes=None):
+    """
+    Runs `forecast_cube` for every city, in a process pool if there are several cities.
+
+    Parameters
+    ----------
+    scatter_cubes : dict
+        The result of `build_scatter_cube` for each city, keyed by city name.
+    processes : int, optional
+        The number of worker processes. The default is one per CPU. With a
+        single city or `processes=1`, the cities are forecast in this process.
+
+    Returns
+    -------
+    dict
+        The forecast cubes, keyed by city name.
+    """
+    cities = list(scatter_cubes)
+    if len(cities) <= 1 or processes == 1:
+        return {city: forecast_cube(scatter_cubes[city]) for city in cities}
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return dict(zip(cities, executor.map(forecast_cube, [scatter_cubes[city] for city in cities])))
+
+def neighbourhood_series(scatter_cube, neighbourhood):
+    """
+    Returns the scatter plot series of one neighbourhood.
+
+    Parameters
+    ----------
+    scatter_cube : dict
+        The result of `build_scatter_cube` or `forecast_cube`.
+    neighbourhood : str
+        The neighbourhood.
+
+    Returns
+    -------
+    pd.DataFrame
+        The columns 'date', 'mean_price', 'mean_rating', 'conf_int_lower' and
+        'conf_int_upper', one row per date. Empty if the neighbourhood is unknown.
+    """
+    columns = ['mean_price', 'mean_rating', 'conf_int_lower', 'conf_int_upper']
+    neighbourhoods = scatter_cube['neighbourhoods']
+    row = np.searchsorted(neighbourhoods, neighbourhood)
+    if row >= len(neighbourhoods) or neighbourhoods[row] != neighbourhood:
+        return pd.DataFrame(columns=['date'] + columns)
+    series = pd.DataFrame({col: scatter_cube[col][row] for col in columns})
+    series.insert(0, 'date', scatter_cube['dates'])
+    return series
@@ -0,0 +1,279 @@
+import numpy as np
+import pandas as pd
+
+from airbnbDashboard.data.normalize import join_listings
+
+def latest_neighbourhoods(listings):
+    """
+    Returns the neighbourhood of the most recent row of each listing.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        Monthly listings.
+
+    Returns
+    -------
+    pd.Series
+        The neighbourhood by listing id.
+    """
+    latest = listings.loc[listings['id'].notna(), ['id', 'date', 'neighbourhood_cleansed']]
+    latest = latest.sort_values('date', kind='stable').drop_duplicates('id', keep='last').set_index('id')
+    return latest['neighbourhood_cleansed']
+
+def host_listings(hosts, host_ids, neighbourhoods):
+    """
+    Stores the listings of each host host after host, with their latest neighbourhood.
+
+    Parameters
+    ----------
+    hosts : pd.DataFrame
+        The 'host_id' and 'host_name' of the listings with a host, indexed by listing id.
+    host_ids : np.ndarray
+        The sorted host ids.
+    neighbourhoods : pd.Series
+        The latest neighbourhood by listing id (see `latest_neighbourhoods`).
+
+    Returns
+    -------
+    dict
+        The keys of `build_host_index` that describe the listings of the hosts.
+    """
+    hosts = hosts.join(neighbourhoods.rename('neighbourhood_cleansed'))
+    listing_hosts = np.searchsorted(host_ids, hosts['host_id'].to_numpy())
+    order = np.argsort(listing_hosts, kind='stable')
+    neighbourhood_codes, neighbourhood_names = pd.factorize(hosts['neighbourhood_cleansed'], sort=True)
+    host_names = hosts.groupby('host_id')['host_name'].first().reindex(host_ids)
+    neighbourhood_counts = pd.DataFrame({'host': listing_hosts, 'neighbourhood': neighbourhood_codes})
+    neighbourhood_counts = neighbourhood_counts[neighbourhood_counts['neighbourhood'] >= 0].drop_duplicates()
+    return {
+        'host_ids': host_ids,
+        'host_names': host_names.to_numpy(),
+        'listing_starts': np.searchsorted(listing_hosts[order], np.arange(len(host_ids) + 1)),
+        'listing_ids': hosts.index.to_numpy()[order].astype(np.int64),
+        'listing_neighbourhoods': neighbourhood_codes[order].astype(np.int16),
+        'neighbourhoods': np.asarray(neighbourhood_names),
+        'neighbourhood_counts': np.bincount(neighbourhood_counts['host'], minlength=len(host_ids)).astype(np.int16),
+    }
+
+def host_statistics(listings, listing_dim, host_ids):
+    """
+    Computes the monthly statistics of the hosts.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        Monthly listings.
+    listing_dim : pd.DataFrame
+        The static listing attributes of the city, indexed by listing id.
+    host_ids : np.ndarray
+        The sorted host ids.
+
+    Returns
+    -------
+    listing_counts, avg_price, reviews : np.ndarray
+        Matrices of shape (hosts, 12), indexed by host number and calendar month.
+    """
+    # One row per listing and calendar month
+    rows = join_listings(listings[['id', 'month', 'price', 'number_of_reviews']], listing_dim, ['host_id'])
+    rows = rows[rows['host_id'].notna()]
+    rows = rows.groupby(['host_id', 'id', 'month'], sort=False).mean().reset_index()
+    cells = np.searchsorted(host_ids, rows['host_id'].to_numpy()) * 12 + rows['month'].to_numpy(dtype=np.int64) - 1
+
+    def monthly(weights=None):
+        return np.bincount(cells, weights=weights, minlength=len(host_ids) * 12).reshape(len(host_ids), 12)
+
+    prices = rows['price'].to_numpy(dtype=float)
+    listing_counts = monthly().astype(np.int32)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_price = (monthly(np.nan_to_num(prices)) / monthly(~np.isnan(prices) * 1.0)).astype(np.float32)
+    reviews = monthly(np.nan_to_num(rows['number_of_reviews'].to_numpy(dtype=float))).astype(np.float32)
+    return listing_counts, avg_price, reviews
+
+def rank_hosts(counts, top):
+    """
+    Ranks the hosts with more than one listing by number of listings (ties by host id).
+
+    Parameters
+    ----------
+    counts : np.ndarray
+        The number of listings of each host in a month.
+    top : int
+        The number of hosts ranked.
+
+    Returns
+    -------
+    np.ndarray
+        The numbers of the first `top` hosts.
+    """
+    multi_listing = np.flatnonzero(counts > 1)
+    ranking = multi_listing[np.argsort(-counts[multi_listing], kind='stable')]
+    return ranking[:top].astype(np.int32)
+
+def build_host_index(listings, listing_dim, top=50):
+    """
+    Builds the host portfolio index of a city.
+
+    Hosts are numbered by sorted host id. Their listings are stored host after
+    host in one array with an offset per host, and the monthly statistics are
+    matrices of shape (hosts, 12) indexed by host number and calendar month,
+    the same month that the slider selects. The ranking of the hosts with the
+    most listings is computed per month, so the top hosts view is a lookup.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        The monthly listings of a city.
+    listing_dim : pd.DataFrame
+        The static listing attributes of the city, indexed by listing id.
+    top : int, optional
+        The number of hosts ranked per month. The default is 50.
+
+    Returns
+    -------
+    dict or None
+        A dictionary with the keys 'host_ids', 'host_names', 'listing_starts'
+        (offset of each host's listings, plus the end), 'listing_ids',
+        'listing_neighbourhoods' (codes into 'neighbourhoods'),
+        'neighbourhood_counts', 'listing_counts', 'avg_price' and 'reviews'
+        (monthly matrices) and 'top_hosts' (month -> host numbers). None if the
+        listings have no host ids.
+    """
+    if listing_dim is None or 'host_id' not in listing_dim.columns:
+        return None
+
+    hosts = listing_dim.loc[listing_dim['host_id'].notna(), ['host_id', 'host_name']]
+    host_ids = np.sort(hosts['host_id'].unique())
+    host_index = host_listings(hosts, host_ids, latest_neighbourhoods(listings))
+    listing_counts, avg_price, reviews = host_statistics(listings, listing_dim, host_ids)
+    host_index.update({
+        'listing_counts': listing_counts,
+        'avg_price': avg_price,
+        'reviews': reviews,
+        'top_hosts': {month: rank_hosts(listing_counts[:, month - 1], top) for month in range(1, 13)},
+    })
+    return host_index
+
+def update_host_index(host_index, listings, new_listings, previous_dim, listing_dim, top=50):
+    """
+    Updates the host portfolio index of a city after a month was added.
+
+    The listings of the hosts are stored again from the listing attributes and
+    the latest neighbourhoods, which the rows of the new month replace for
+    their listings. Of the monthly statistics, only the calendar month of the
+    new rows is computed again, from the rows of that calendar month; the
+    other months are copied to the rows of their hosts. If a listing that was
+    loaded before changed its host, its earlier months belong to another host
+    and the index is rebuilt from all listings.
+
+    Parameters
+    ----------
+    host_index : dict or None
+        The result of `build_host_index` before the month was added.
+    listings : pd.DataFrame
+        The monthly listings of the city, including the new month.
+    new_listings : pd.DataFrame
+        The rows of the new month.
+    previous_dim, listing_dim : pd.DataFrame
+        The static listing attributes of the city before and after the month was added.
+    top : int, optional
+        The number of hosts ranked per month. The default is 50.
+
+    Returns
+    -------
+    dict or None
+        The updated index (see `build_host_index`), the given one is not changed.
+    """
+    if host_index is None or previous_dim is None or 'host_id' not in previous_dim.columns:
+        return build_host_index(listings, listing_dim, top)
+    kept = previous_dim.index.intersection(listing_dim.index)
+    before, after = previous_dim.loc[kept, 'host_id'], listing_dim.loc[kept, 'host_id']
+    if not ((before == after) | (before.isna() & after.isna())).all():
+        return build_host_index(listings, listing_dim, top)
+
+    hosts = listing_dim.loc[listing_dim['host_id'].notna(), ['host_id', 'host_name']]
+    host_ids = np.sort(hosts['host_id'].unique())
+    # No host loses its listings, so the hosts of the index keep their order among the new ones
+    rows = np.searchsorted(host_ids, host_index['host_ids'])
+
+    codes = host_index['listing_neighbourhoods']
+    neighbourhoods = pd.Series(pd.Categorical.from_codes(codes, host_index['neighbourhoods']), index=host_index['listing_ids'],
+                               dtype=object)
+    new_neighbourhoods = latest_neighbourhoods(new_listings)
+    new_neighbourhoods.index = new_neighbourhoods.index.astype(np.int64)
+    neighbourhoods = pd.concat([neighbourhoods.drop(new_neighbourhoods.index, errors='ignore'), new_neighbourhoods])
+    neighbourhoods.index = neighbourhoods.index.astype(hosts.index.dtype)
+    updated = host_listings(hosts, host_ids, neighbourhoods)
+
+    month = int(new_listings['month'].iloc[0])
+    same_month = listings[listings['month'].to_numpy() == month]
+    month_statistics = [matrix[:, month - 1] for matrix in host_statistics(same_month, listing_dim, host_ids)]
+    for name, values in zip(['listing_counts', 'avg_price', 'reviews'], month_statistics):
+        matrix = np.full((len(host_ids), 12), np.nan if name == 'avg_price' else 0, dtype=host_index[name].dtype)
+        matrix[rows] = host_index[name]
+        matrix[:, month - 1] = values
+        updated[name] = matrix
+    updated['top_hosts'] = {other: rows[ranking].astype(np.int32) for other, ranking in host_index['top_hosts'].items()}
+    updated['top_hosts'][month] = rank_hosts(updated['listing_counts'][:, month - 1], top)
+    return updated
+
+def top_hosts(host_index, selected_month, limit=10):
+    """
+    Returns the hosts with the most listings in a month.
+
+    Parameters
+    ----------
+    host_index : dict
+        The result of `build_host_index`.
+    selected_month : int
+        The selected month from the slider.
+    limit : int, optional
+        The number of hosts. The default is 10.
+
+    Returns
+    -------
+    pd.DataFrame
+        The host name and id, the number of listings and of neighbourhoods,
+        the average price and the number of reviews in the month, one row per host.
+    """
+    hosts = host_index['top_hosts'].get(selected_month, np.array([], dtype=np.int32))[:limit]
+    month = selected_month - 1
+    return pd.DataFrame({
+        'Host': host_index['host_names'][hosts],
+        'Host ID': host_index['host_ids'][hosts].astype(np.int64),
+        'Listings': host_index['listing_counts'][hosts, month],
+        'Neighbourhoods': host_index['neighbourhood_counts'][hosts],
+        'Avg. Price': np.round(host_index['avg_price'][hosts, month].astype(float), 2),
+        'Reviews': host_index['reviews'][hosts, month].astype(np.int64),
+    })
+
+def host_portfolio(host_index, host_id):
+    """
+    Returns the portfolio of a host: its listings and monthly statistics.
+
+    Parameters
+    ----------
+    host_index : dict
+        The result of `build_host_index`.
+    host_id : int
+        The id of the host.
+
+    Returns
+    -------
+    dict or None
+        The 'listing_ids' and their 'neighbourhoods', and the 'listing_counts',
+        'avg_price' and 'reviews' per calendar month (arrays of length 12).
+        None if the host is unknown.
+    """
+    host = np.searchsorted(host_index['host_ids'], host_id)
+    if host >= len(host_index['host_ids']) or host_index['host_ids'][host] != host_id:
+        return None
+    start, end = host_index['listing_starts'][host], host_index['listing_starts'][host + 1]
+    codes = host_index['listing_neighbourhoods'][start:end]
+    return {
+        'listing_ids': host_index['listing_ids'][start:end],
+        'neighbourhoods': np.where(codes >= 0, host_index['neighbourhoods'][np.maximum(codes, 0)], None),
+        'listing_counts': host_index['listing_counts'][host],
+        'avg_price': host_index['avg_price'][host],
+        'reviews': host_index['reviews'][host],
+    }
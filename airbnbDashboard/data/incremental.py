@@ -0,0 +1,343 @@
+import hashlib
+import os
+import re
+import threading
+import numpy as np
+import pandas as pd
+
+from airbnbDashboard.data.loader import listing_columns, aggregate_chunk, merge_aggregates, finalize_aggregates
+from airbnbDashboard.data.normalize import fact_columns, split_listings, build_listing_dim
+from airbnbDashboard.data.sketches import sketch_chunk, merge_sketches
+from airbnbDashboard.data.aggregates import period_codes, build_prefix_sums, extend_prefix_sums, merge_prefix_sums
+from airbnbDashboard.data.density import build_density_points, extend_density_points, merge_density_points
+from airbnbDashboard.data.facets import update_facet_index
+from airbnbDashboard.data.search import build_search_index, update_search_index
+from airbnbDashboard.data.hosts import update_host_index
+from airbnbDashboard.data.forecast import append_history, forecast_cube
+from airbnbDashboard.data.validation import validate_listings
+from airbnbDashboard.data.neighbourhoods import feature_ids
+from airbnbDashboard.plots.generate_map import get_color_ranges
+
+# Prefix of the arrays that mark missing values of text columns in a delta file
+missing_prefix = '__missing__'
+
+# Held while `append_month` publishes the new state of a city, see `city_snapshot`
+publish_lock = threading.Lock()
+
+def delta_path(delta_dir, city, month):
+    """
+    Returns the path of the delta file of a city and month.
+
+    Parameters
+    ----------
+    delta_dir : str
+        The directory of the delta files.
+    city : str
+        The city name.
+    month : pd.Timestamp
+        The month of the delta.
+
+    Returns
+    -------
+    str
+        The path '<delta_dir>/<city>/<YYYY-MM>.npz', with the city name reduced to word characters.
+    """
+    return os.path.join(delta_dir, re.sub(r'\W+', '_', city).strip('_'), f'{month:%Y-%m}.npz')
+
+def write_delta(delta_dir, city, listings):
+    """
+    Stores the rows of a new month column by column in a compressed NumPy archive.
+
+    Numeric and date columns are stored as they are. Text columns are stored
+    as fixed-width strings with a separate array that marks missing values.
+
+    Parameters
+    ----------
+    delta_dir : str
+        The directory of the delta files.
+    city : str
+        The city name.
+    listings : pd.DataFrame
+        The rows of one month.
+
+    Returns
+    -------
+    str
+        The path of the written file.
+    """
+    path = delta_path(delta_dir, city, pd.Timestamp(listings['date'].min()))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    columns = {}
+    for col in listings.columns:
+        values = listings[col]
+        if values.dtype == object:
+            columns[missing_prefix + col] = values.isna().to_numpy()
+            columns[col] = values.fillna('').astype(str).to_numpy(dtype=str)
+        else:
+            columns[col] = values.to_numpy()
+    np.savez_compressed(path, **columns)
+    return path
+
+def read_deltas(delta_dir, city):
+    """
+    Reads the delta files of a city, oldest month first.
+
+    Parameters
+    ----------
+    delta_dir : str
+        The directory of the delta files.
+    city : str
+        The city name.
+
+    Returns
+    -------
+    list of pd.DataFrame
+        The rows of each stored month.
+    """
+    city_dir = os.path.dirname(delta_path(delta_dir, city, pd.Timestamp(0)))
+    if not os.path.isdir(city_dir):
+        return []
+
+    deltas = []
+    for file_name in sorted(os.listdir(city_dir)):
+        if not file_name.endswith('.npz'):
+            continue
+        with np.load(os.path.join(city_dir, file_name), allow_pickle=False) as archive:
+            columns = {col: archive[col] for col in archive.files if not col.startswith(missing_prefix)}
+            listings = pd.DataFrame(columns)
+            for col in columns:
+                if missing_prefix + col in archive.files:
+                    listings[col] = listings[col].astype(object).mask(archive[missing_prefix + col])
+        deltas.append(listings)
+    return deltas
+
+def month_fingerprint(fingerprint, listings):
+    """
+    Returns the fingerprint of a city's data after a month was added to it.
+
+    Parameters
+    ----------
+    fingerprint : str
+        The fingerprint before (see `data_fingerprint`).
+    listings : pd.DataFrame
+        The rows of the added month.
+
+    Returns
+    -------
+    str
+        A hex digest of 16 characters that depends on the previous fingerprint and the content of the rows.
+    """
+    digest = hashlib.sha1(fingerprint.encode('utf8'))
+    digest.update(pd.util.hash_pandas_object(listings, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+def city_snapshot(city, listings_data, listing_dims, city_indexes):
+    """
+    Returns the listings, listing attributes and indexes of a city from the same state.
+
+    The facet index refers to the listings by position, so a callback that
+    uses both must not see the listings of a new month with the index of the
+    month before. `append_month` publishes the new state while holding
+    `publish_lock`, which is taken here as well.
+
+    Parameters
+    ----------
+    city : str
+        The city name.
+    listings_data, listing_dims, city_indexes : dict
+        See `append_month`.
+
+    Returns
+    -------
+    listings : pd.DataFrame
+        The monthly listings of the city.
+    listing_dim : pd.DataFrame or None
+        The static listing attributes of the city.
+    indexes : dict
+        The indexes of the city, empty if it has none.
+
+    Raises
+    ------
+    KeyError
+        If the listings of the city are not loaded.
+    """
+    with publish_lock:
+        return listings_data[city], listing_dims.get(city), city_indexes.get(city, {})
+
+def append_month(city, listings, neighborhood_stats, listings_data, listing_dims, date_marks, city_indexes,
+                 neighborhood_totals, delta_dir=None):
+    """
+    Adds the rows of a new month of a city without reloading its history.
+
+    The statistics are merged from their sums, counts and price sketches, the
+    prefix sums and density points of the new month are added to those of the
+    history, the facet index is sorted again only for the calendar month of
+    the new rows and the scatter cube gets one more month, after which the
+    forecasts of the city are refitted. The forecast rows of the CSV files
+    for the new month are replaced by the actual rows. The search index only
+    tokenizes the listings of the month whose name or host name changed and
+    the host index only computes the calendar month of the new rows again
+    (see `update_search_index` and `update_host_index`).
+    Invalid rows are dropped by the same rules as at startup (see
+    `validate_listings`), except that new neighbourhood names are accepted;
+    they are matched to the GeoJSON features known from the statistics.
+
+    The dictionaries are updated in place, so running callbacks see the new
+    month. The new state of the city is published while holding
+    `publish_lock`, so `city_snapshot` returns the listings and indexes of
+    the same month. The data version of the city in `city_indexes` is increased, which
+    invalidates the figures cached for it, and its fingerprint is extended
+    with the new rows (see `month_fingerprint`).
+
+    Parameters
+    ----------
+    city : str
+        The city name.
+    listings : pd.DataFrame
+        The rows of the new month, in the format of the combined CSV files.
+    neighborhood_stats, listings_data, listing_dims : dict
+        The data returned by `load_data`.
+    date_marks : dict
+        Dictionary containing the marks for the slider. Months after the last
+        mark are appended to it.
+    city_indexes : dict
+        The result of `build_city_indexes`.
+    neighborhood_totals : dict
+        The sums, counts and sketches per city, filled in by `load_data`.
+    delta_dir : str, optional
+        If given, the rows are also stored there (see `write_delta`), so
+        they are added again at the next start until the CSV files include them.
+
+    Raises
+    ------
+    ValueError
+        If the rows span several months, if the month is not after the
+        history of the city or if it would be inserted between existing marks
+        of the slider. Nothing is changed in that case.
+    """
+    listings, _, _ = validate_listings(listings[listings['id'].notna()].copy())
+    listings['id'] = listings['id'].astype('int64')
+    listings['date'] = pd.to_datetime(listings['date'])
+    if listings['date'].dt.to_period('M').nunique() != 1:
+        raise ValueError("The new rows must belong to exactly one month")
+    listings['month'] = listings['date'].dt.month
+    month = pd.Timestamp(listings['date'].min())
+    indexes = city_indexes[city]
+
+    # The checks come first, so a rejected month leaves everything unchanged
+    scatter_cube = forecast_cube(append_history(indexes['scatter'], listings))
+    mark_dates = [date_marks[i] for i in sorted(date_marks)]
+    new_marks = sorted({date.strftime('%Y-%m') for date in scatter_cube['dates']} - set(mark_dates))
+    if new_marks and mark_dates and new_marks[0] < mark_dates[-1]:
+        raise ValueError(f"{new_marks[0]} would be inserted between the months of the slider")
+
+    # Months after the last mark are appended to the slider of every city
+    if new_marks:
+        date_marks.update({len(mark_dates) + i: date for i, date in enumerate(new_marks)})
+        for other_city, other_indexes in list(city_indexes.items()):
+            extended = dict(other_indexes)
+            if other_indexes.get('prefix_sums') is not None:
+                extended['prefix_sums'] = extend_prefix_sums(other_indexes['prefix_sums'], len(date_marks))
+            if other_indexes.get('density') is not None:
+                extended['density'] = extend_density_points(other_indexes['density'], len(date_marks))
+            city_indexes[other_city] = extended
+        indexes = city_indexes[city]
+
+    # The forecast rows of the CSV file for the new month are replaced
+    facts = listings_data[city]
+    superseded = np.flatnonzero((period_codes(facts['date']) == period_codes([month])[0]) & facts['id'].isna().to_numpy())
+    removed_rows = facts.iloc[superseded]
+
+    listings = listings.reindex(columns=list(dict.fromkeys(list(listings.columns) + fact_columns)))
+    new_facts, attributes = split_listings(listings[[col for col in listing_columns if col in listings.columns]])
+    kept_facts = facts.drop(facts.index[superseded]) if len(superseded) else facts
+    updated_facts = pd.concat([kept_facts, new_facts], ignore_index=True)
+    added = np.arange(len(kept_facts), len(updated_facts))
+
+    listing_dim = listing_dims.get(city)
+    new_dim = build_listing_dim([attributes])
+    if listing_dim is not None:
+        new_dim.index = new_dim.index.astype(listing_dim.index.dtype)
+        new_dim = pd.concat([listing_dim.drop(new_dim.index, errors='ignore'), new_dim])
+
+    # Statistics from merged sums, counts and sketches
+    totals, sketch = neighborhood_totals[city]
+    totals = merge_aggregates(totals, aggregate_chunk(listings))
+    new_sketch = sketch_chunk(listings)
+    sketch = new_sketch if sketch is None else merge_sketches(sketch, new_sketch)
+    if len(removed_rows):
+        totals = totals.sub(aggregate_chunk(removed_rows), fill_value=0)
+        totals = totals[(totals.filter(like='_count') > 0).any(axis=1)]
+        removed_sketch = sketch_chunk(removed_rows)
+        if removed_sketch is not None:
+            sketch = sketch.sub(removed_sketch, fill_value=0)
+            sketch = sketch[sketch > 0]
+    stats = finalize_aggregates(totals, sketch)
+    if 'feature_index' in indexes:
+        stats['feature_id'] = feature_ids(stats['neighbourhood_cleansed'], indexes['feature_index'])
+
+    updated = dict(indexes, scatter=scatter_cube, version=indexes.get('version', 0) + 1,
+                   fingerprint=month_fingerprint(indexes.get('fingerprint', ''), listings))
+    if indexes.get('prefix_sums') is not None:
+        prefix_sums = merge_prefix_sums(indexes['prefix_sums'], build_prefix_sums(listings, date_marks))
+        if len(removed_rows):
+            prefix_sums = merge_prefix_sums(prefix_sums, build_prefix_sums(removed_rows, date_marks), sign=-1)
+        updated['prefix_sums'] = prefix_sums
+    if indexes.get('density') is not None:
+        new_points = build_density_points(listings, new_dim, date_marks)
+        if new_points is not None:
+            updated['density'] = merge_density_points(indexes['density'], new_points)
+    updated['facets'] = update_facet_index(indexes['facets'], updated_facts, new_dim, int(month.month), superseded, added)
+    if indexes.get('search') is not None:
+        updated['search'] = update_search_index(indexes['search'], new_facts, new_dim)
+    else:
+        updated['search'] = build_search_index(updated_facts, new_dim)
+    updated['hosts'] = update_host_index(indexes.get('hosts'), updated_facts, new_facts, listing_dim, new_dim)
+    if 'color_ranges' in indexes:
+        updated['color_ranges'] = get_color_ranges(stats)
+
+    known = {option['value'] for option in indexes['metadata']['neighborhood_options']}
+    new_neighborhoods = [neighborhood for neighborhood in listings['neighbourhood_cleansed'].unique() if neighborhood not in known]
+    updated['metadata'] = dict(indexes['metadata'], neighborhood_options=indexes['metadata']['neighborhood_options'] +
+                               [{'label': neighborhood, 'value': neighborhood} for neighborhood in new_neighborhoods])
+
+    with publish_lock:
+        neighborhood_totals[city] = (totals, sketch)
+        neighborhood_stats[city] = stats
+        listing_dims[city] = new_dim
+        listings_data[city] = updated_facts
+        city_indexes[city] = updated
+
+    if delta_dir is not None:
+        write_delta(delta_dir, city, listings.drop(columns='month'))
+
+def replay_deltas(delta_dir, neighborhood_stats, listings_data, listing_dims, date_marks, city_indexes, neighborhood_totals):
+    """
+    Adds the stored months that are not yet part of the loaded history of each city.
+
+    Months that the CSV files already contain are skipped, so delta files
+    can stay in place after the CSV files were regenerated.
+
+    Parameters
+    ----------
+    delta_dir : str
+        The directory of the delta files.
+    neighborhood_stats, listings_data, listing_dims, date_marks, city_indexes, neighborhood_totals : dict
+        See `append_month`.
+
+    Returns
+    -------
+    int
+        The number of months added.
+    """
+    added = 0
+    for city in list(listings_data):
+        for listings in read_deltas(delta_dir, city):
+            scatter_cube = city_indexes[city]['scatter']
+            history = scatter_cube['dates'][:scatter_cube['history']]
+            if len(history) and pd.Timestamp(listings['date'].min()).to_period('M') <= history[-1].to_period('M'):
+                continue
+            append_month(city, listings, neighborhood_stats, listings_data, listing_dims, date_marks, city_indexes,
+                         neighborhood_totals)
+            added += 1
+    return added
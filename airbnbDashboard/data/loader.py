@@ -1,11 +1,72 @@
+import hashlib
 import json
+import os
 import pandas as pd
 
 from airbnbDashboard.data.paths import city_paths
+from airbnbDashboard.data.normalize import split_listings, build_listing_dim
+from airbnbDashboard.data.sketches import sketch_chunk, merge_sketches, sketch_quantiles
+from airbnbDashboard.data.validation import (validate_listings, merge_reports, quarantine_path, write_quarantine, validated_path,
+                                             staged_path, write_validated, finish_validated, validation_summary)
+from airbnbDashboard.data.neighbourhoods import index_features, feature_ids, unused_features
+from airbnbDashboard.data.tracing import phase
 
-def load_data(city_paths):
+# Columns read from the CSV files for each city
+listing_columns = ['date', 'month', 'price', 'neighbourhood_cleansed', 'review_scores_rating', 'name', 'host_total_listings_count',
+                   'number_of_reviews', 'id', 'room_type', 'host_name', 'minimum_nights', 'host_id', 'reviews_per_month',
+                   'conf_int_upper', 'conf_int_lower', 'best_model', 'latitude', 'longitude']
+
+# Columns to aggregate and their aggregation functions
+# Dictionary: Key = column name, Value = aggregation function
+agg_columns = {
+    'price': 'mean',
+    'review_scores_rating': 'mean',
+    'number_of_reviews': 'mean',
+    'name': 'count'
+}
+
+# Manually variable types for certain variables
+# The forecast rows have no id, so the ids are parsed as nullable integers rather than floats
+dtype_spec = {  
+    'id': 'Int64',
+    'bathrooms': float,  
+    'bedrooms': float,  
+    'city': str,  
+    'best_model': str   
+}
+
+def load_data(city_paths, chunksize=None, neighborhood_totals=None, quarantine_dir=None, validation_reports=None, validated_dir=None,
+              trace=None):
     """
     Load the GeoJSON and CSV data for each city.
+
+    By default, each CSV file is read as a whole. If `chunksize` is given, the
+    files are streamed instead: only the needed columns are parsed, and each
+    chunk is filtered and projected before the next one is read, while the
+    neighbourhood statistics are accumulated as sums and counts chunk by chunk.
+    The unused columns and the rejected rows are then never held in memory,
+    but the projected rows of all chunks are kept and concatenated at the end,
+    so peak memory still grows with the length of the file.
+
+    The median and 90th percentile price are estimated from quantile sketches
+    (see `data/sketches.py`) that are merged chunk by chunk in the same way.
+
+    The rows are validated before they are aggregated (see
+    `data/validation.py`): rows with a missing, malformed or impossible
+    value, an extreme price or a neighbourhood that is not in the GeoJSON
+    file of the city are rejected, and the number of rows breaking each rule
+    is printed per city.
+
+    The neighbourhoods are joined to the GeoJSON features once here: every
+    feature gets an integer 'id' (its position in the file) and the
+    statistics the matching 'feature_id', with names compared regardless of
+    case and accents (see `data/neighbourhoods.py`). The map refers to the
+    features by these ids. Names without a feature and features without
+    listings are printed per city.
+
+    The listings of each city are normalized: static attributes such as the
+    name or host are stored once per listing in `listing_dims`, and
+    `listings_data` only holds the monthly values (see `data/normalize.py`).
     
     Parameters
     ----------
@@ -14,21 +75,56 @@ def load_data(city_paths):
         The key is the city name while the value is another dictionary that contains
         the paths to the GeoJSON and CSV files.
 
+    chunksize : int, optional
+        The number of CSV rows to read at once in streaming mode. The default
+        is None, which reads each file at once.
+
+    neighborhood_totals : dict, optional
+        If given, the sums and counts and the price sketches behind the
+        statistics are stored in it as a (totals, sketch) tuple per city, so
+        that new months can be merged later (see `data/incremental.py`).
+
+    quarantine_dir : str, optional
+        If given, the rejected rows of each city are written to a CSV file in
+        this directory (see `quarantine_path`), with the broken rules in a
+        'rejected_by' column. Files of earlier runs are replaced.
+
+    validation_reports : dict, optional
+        If given, the validation report of each city is stored in it (see
+        `validate_listings`).
+
+    validated_dir : str, optional
+        If given, the valid rows of each city are written to a Parquet file
+        in this directory (see `validated_path` and `finish_validated`)
+        instead of being kept, and `listings_data` and `listing_dims` stay
+        empty. The DuckDB query backend scans these files (see
+        `data/query.py`), so it answers from the same rows as the pandas
+        backend.
+
+    trace : StartupTrace, optional
+        If given, the reading of the GeoJSON and CSV file and the steps of
+        each chunk are recorded in it per city (see `utils/tracing.py`).
+
     Returns
     -------
     neighbourhoods_geojson : dict
-        Dictionary containing the GeoJSON data for each city.
+        Dictionary containing the GeoJSON data for each city, with the feature ids.
         The key is the city name while the value is the GeoJSON data.
 
     neighbourhood_stats : dict
         Dictionary containing the aggregated statistics for each city.
         The key is the city name while the value is a DataFrame containing the 
-        statistics.
+        statistics and the 'feature_id' of each neighbourhood.
 
     listings_data : dict
-        Dictionary containing the raw listing data for each city.
+        Dictionary containing the monthly listing data (fact table) for each city.
         The key is the city name while the value is a DataFrame containing the
-        raw listing data.
+        monthly listing data.
+
+    listing_dims : dict
+        Dictionary containing the static listing attributes for each city.
+        The key is the city name while the value is a DataFrame indexed by the
+        listing id.
 
     Raises
     ------
@@ -38,57 +134,314 @@ def load_data(city_paths):
     neighborhoods_geojson = {}
     neighborhood_stats = {}
     listings_data = {}
+    listing_dims = {}
 
     # Iterate through each city and load the corresponding CSV and GeoJSON file
     for city, paths in city_paths.items():
         try:
-            with open(paths['geojson'], 'r', encoding='utf8') as file:
+            with phase(trace, 'read_geojson', city=city), open(paths['geojson'], 'r', encoding='utf8') as file:
                 neighborhoods_geojson[city] = json.load(file)
         except FileNotFoundError:
             print(f"GeoJSON file for {city} not found at {paths['geojson']}") 
             continue
 
+        quarantine = None
+        if quarantine_dir is not None:
+            quarantine = quarantine_path(quarantine_dir, city)
+            if os.path.exists(quarantine):
+                os.remove(quarantine)
+        validated = None
+        if validated_dir is not None:
+            validated = validated_path(validated_dir, city)
+            for path in (validated, staged_path(validated)):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        feature_index = index_features(neighborhoods_geojson[city])
         try:
-            # Manually variable types for certain variables
-            dtype_spec = {  
-                'bathrooms': float,  
-                'bedrooms': float,  
-                'city': str,  
-                'best_model': str   
-            }
-            with open(paths['listings'], 'r', encoding='utf-8', errors='replace') as file:
-                listings = pd.read_csv(file, parse_dates=['date'], dtype=dtype_spec, low_memory=False).dropna(subset=['neighbourhood_cleansed', 'price'])
+            with phase(trace, 'read_listings', city=city):
+                if chunksize is None:
+                    facts, listing_dim, totals, sketch, report = read_listings(paths['listings'], feature_index, quarantine,
+                                                                               validated, trace)
+                else:
+                    facts, listing_dim, totals, sketch, report = stream_listings(paths['listings'], chunksize, feature_index,
+                                                                                 quarantine, validated, trace)
         except FileNotFoundError:
             print(f"Listings CSV file for {city} not found at {paths['listings']}")
             continue
+        if validated is not None:
+            with phase(trace, 'write_parquet', city=city):
+                finish_validated(validated)
 
-        listings['month'] = listings['date'].dt.month
+        if validation_reports is not None:
+            validation_reports[city] = report
 
-        # Columns to aggregate and their aggregation functions
-        # Dictionary: Key = column name, Value = aggregation function
-        agg_columns = {
-            'price': 'mean',
-            'review_scores_rating': 'mean',
-            'number_of_reviews': 'mean',
-            'name': 'count'
-        }
-
-        # Check if columns from agg_columns exist in listings data of each city
-        available_columns = [col for col in agg_columns.keys() if col in listings.columns]
-        if not available_columns:
+        if totals is None:
+            print(validation_summary(city, report))
             print(f"No columns to aggregate in listings for {city}")
             continue
 
-        # Group and aggregate listings data & rename columns for map tooltip
-        neighborhood_stats[city] = listings.groupby(['neighbourhood_cleansed', 'month'])[available_columns].agg(agg_columns).reset_index()
-        if 'price' in neighborhood_stats[city].columns:
-            neighborhood_stats[city] = neighborhood_stats[city].rename(columns={'price': 'avg_price'})
-        if 'review_scores_rating' in neighborhood_stats[city].columns:
-            neighborhood_stats[city] = neighborhood_stats[city].rename(columns={'review_scores_rating': 'avg_ratings'})
+        with phase(trace, 'finalize_stats', city=city):
+            stats = finalize_aggregates(totals, sketch)
+            stats['feature_id'] = feature_ids(stats['neighbourhood_cleansed'], feature_index)
+            report['unused_features'] = unused_features(neighborhoods_geojson[city], stats['feature_id'])
+        print(validation_summary(city, report))
+
+        neighborhood_stats[city] = stats
+        if neighborhood_totals is not None:
+            neighborhood_totals[city] = (totals, sketch)
+        if validated is None:
+            listings_data[city] = facts
+            listing_dims[city] = listing_dim
+
+    return neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims
+
+def data_fingerprint(paths):
+    """
+    Returns a fingerprint of the files of a city.
+
+    It is built from the path, size and modification time of each file, so
+    it is cheap to compute and changes when a file is replaced, e.g. when the
+    data repository was updated before a start.
+
+    Parameters
+    ----------
+    paths : dict
+        The paths of the files of the city (see `city_paths`).
+
+    Returns
+    -------
+    str
+        A hex digest of 16 characters.
+    """
+    digest = hashlib.sha1()
+    for name, path in sorted(paths.items()):
+        try:
+            stat = os.stat(path)
+            digest.update(f'{name}={path}:{stat.st_size}:{stat.st_mtime_ns};'.encode('utf8'))
+        except FileNotFoundError:
+            digest.update(f'{name}={path}:missing;'.encode('utf8'))
+    return digest.hexdigest()[:16]
+
+def read_listings(path, feature_index=None, quarantine=None, validated=None, trace=None):
+    """
+    Reads a listings CSV file at once.
+
+    Parameters
+    ----------
+    path : str
+        The path to the combined listings CSV file.
+    feature_index : dict, optional
+        The GeoJSON features by normalized neighbourhood name (see `validate_listings`).
+    quarantine : str, optional
+        The path of the file for the rejected rows. The default is to drop them.
+    validated : str, optional
+        The path of the file for the valid rows. If given, the rows are written
+        there instead of being normalized and returned.
+    trace : StartupTrace, optional
+        If given, the parsing, validation, aggregation and normalization are recorded in it.
+
+    Returns
+    -------
+    facts : pd.DataFrame or None
+        The monthly values of the valid listings, None if they were written to `validated`.
+    listing_dim : pd.DataFrame or None
+        The static listing attributes, indexed by listing id, None if the rows were written to `validated`.
+    totals : pd.DataFrame or None
+        The aggregate sums and counts (see `aggregate_chunk`), or None if
+        none of the `agg_columns` exist in the file.
+    sketch : pd.Series or None
+        The price quantile sketches (see `sketch_chunk`).
+    report : dict
+        The validation report (see `validate_listings`).
+    """
+    with phase(trace, 'parse_csv'), open(path, 'r', encoding='utf-8', errors='replace') as file:
+        listings = pd.read_csv(file, parse_dates=['date'], dtype=dtype_spec, low_memory=False)
+
+    with phase(trace, 'validate'):
+        listings, rejected, report = validate_listings(listings, feature_index)
+        if quarantine is not None and len(rejected):
+            write_quarantine(quarantine, rejected)
+
+    with phase(trace, 'aggregate'):
+        listings['month'] = listings['date'].dt.month
+        totals = aggregate_chunk(listings)
+        sketch = sketch_chunk(listings)
+
+    listings = listings[[col for col in listing_columns if col in listings.columns]]
+    if validated is not None:
+        with phase(trace, 'write_validated'):
+            write_validated(validated, listings)
+            return None, None, totals, sketch, report
+
+    # Split the relevant columns into monthly facts and static attributes
+    with phase(trace, 'normalize'):
+        facts, attributes = split_listings(listings)
+        return facts.copy(), build_listing_dim([attributes]), totals, sketch, report
+
+def stream_listings(path, chunksize, feature_index=None, quarantine=None, validated=None, trace=None):
+    """
+    Reads a listings CSV file in chunks, holding only the columns it keeps.
+
+    Only `listing_columns` are parsed. Each chunk is validated, aggregated and
+    split into facts and static attributes before the next chunk is read. The
+    facts of all chunks are kept and concatenated at the end, so memory grows
+    with the number of rows, and briefly holds both the chunks and the result.
+    If `validated` is given, the valid rows of each chunk are appended to that
+    file instead, and memory only holds one chunk and the aggregates.
+
+    Parameters
+    ----------
+    path : str
+        The path to the combined listings CSV file.
+    chunksize : int
+        The number of rows per chunk.
+    feature_index : dict, optional
+        The GeoJSON features by normalized neighbourhood name (see `validate_listings`).
+    quarantine : str, optional
+        The path of the file for the rejected rows. The default is to drop them.
+    validated : str, optional
+        The path of the file for the valid rows. If given, the rows are written
+        there instead of being normalized and returned.
+    trace : StartupTrace, optional
+        If given, the parsing, validation, aggregation and normalization of
+        each chunk are recorded in it.
+
+    Returns
+    -------
+    facts : pd.DataFrame or None
+        The monthly values of the valid listings, None if they were written to `validated`.
+    listing_dim : pd.DataFrame or None
+        The static listing attributes, indexed by listing id, None if the rows were written to `validated`.
+    totals : pd.DataFrame or None
+        The aggregate sums and counts accumulated over all chunks, or None if
+        none of the `agg_columns` exist in the file.
+    sketch : pd.Series or None
+        The price quantile sketches merged over all chunks.
+    report : dict
+        The validation report merged over all chunks.
+    """
+    needed_columns = set(listing_columns) - {'month'}
+    fact_chunks = []
+    attribute_chunks = []
+    totals = None
+    sketch = None
+    report = {'rows': 0, 'rejected': 0, 'rules': {}}
+    with open(path, 'r', encoding='utf-8', errors='replace') as file:
+        reader = pd.read_csv(file, usecols=lambda col: col in needed_columns, parse_dates=['date'],
+                             dtype={col: dtype for col, dtype in dtype_spec.items() if col in needed_columns},
+                             chunksize=chunksize)
+        while True:
+            # The chunks are parsed as they are read, so reading the next one is the parsing step
+            with phase(trace, 'parse_csv'):
+                chunk = next(reader, None)
+            if chunk is None:
+                break
+            with phase(trace, 'validate'):
+                chunk, rejected, chunk_report = validate_listings(chunk, feature_index)
+                report = merge_reports(report, chunk_report)
+                if quarantine is not None and len(rejected):
+                    write_quarantine(quarantine, rejected, append=True)
+            with phase(trace, 'aggregate'):
+                chunk['month'] = chunk['date'].dt.month
+                chunk_totals = aggregate_chunk(chunk)
+                if chunk_totals is not None:
+                    totals = chunk_totals if totals is None else merge_aggregates(totals, chunk_totals)
+                chunk_sketch = sketch_chunk(chunk)
+                if chunk_sketch is not None:
+                    sketch = chunk_sketch if sketch is None else merge_sketches(sketch, chunk_sketch)
+            if validated is not None:
+                with phase(trace, 'write_validated'):
+                    write_validated(validated, chunk[[col for col in listing_columns if col in chunk.columns]], append=True)
+                continue
+            with phase(trace, 'normalize'):
+                facts, attributes = split_listings(chunk)
+                fact_chunks.append(facts)
+                attribute_chunks.append(attributes)
+
+    if validated is not None:
+        return None, None, totals, sketch, report
+    with phase(trace, 'concat'):
+        return pd.concat(fact_chunks, ignore_index=True), build_listing_dim(attribute_chunks), totals, sketch, report
+
+def aggregate_chunk(listings):
+    """
+    Aggregates listings per neighbourhood and month as sums and counts.
+
+    Sums and counts can be merged across chunks (or months) by adding them,
+    unlike means. `finalize_aggregates` turns them into the statistics shown on the map.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        Listings with 'neighbourhood_cleansed' and 'month' columns.
+
+    Returns
+    -------
+    pd.DataFrame or None
+        A DataFrame indexed by ('neighbourhood_cleansed', 'month') with a
+        '<column>_sum' and '<column>_count' column for each available mean
+        column and a '<column>_count' column for each count column. None if
+        none of the `agg_columns` exist in the listings.
+    """
+    available_columns = [col for col in agg_columns if col in listings.columns]
+    if not available_columns:
+        return None
+
+    grouped = listings.groupby(['neighbourhood_cleansed', 'month'])
+    counts = grouped[available_columns].count().add_suffix('_count')
+    mean_columns = [col for col in available_columns if agg_columns[col] == 'mean']
+    sums = grouped[mean_columns].sum().add_suffix('_sum')
+    return pd.concat([sums, counts], axis=1)
+
+def merge_aggregates(totals, other):
+    """
+    Merges two results of `aggregate_chunk` by adding their sums and counts.
+
+    Parameters
+    ----------
+    totals : pd.DataFrame
+        The aggregates accumulated so far.
+    other : pd.DataFrame
+        The aggregates to add.
+
+    Returns
+    -------
+    pd.DataFrame
+        The merged aggregates.
+    """
+    return totals.add(other, fill_value=0)
+
+def finalize_aggregates(totals, sketch=None):
+    """
+    Turns accumulated sums and counts into the neighbourhood statistics used by the map.
+
+    Parameters
+    ----------
+    totals : pd.DataFrame
+        The aggregates returned by `aggregate_chunk` or `merge_aggregates`.
+    sketch : pd.Series, optional
+        The price quantile sketches returned by `sketch_chunk` or `merge_sketches`.
+
+    Returns
+    -------
+    pd.DataFrame
+        The statistics with the columns 'neighbourhood_cleansed', 'month', and,
+        if available, 'avg_price', 'avg_ratings', 'number_of_reviews' (mean),
+        'name' (number of listings) and 'median_price', 'p90_price' (from the sketches).
+    """
+    stats = pd.DataFrame(index=totals.index)
+    for col, func in agg_columns.items():
+        if f'{col}_count' not in totals.columns:
+            continue
+        if func == 'mean':
+            # Groups without any value get NaN, like DataFrame.mean
+            stats[col] = totals[f'{col}_sum'] / totals[f'{col}_count'].where(totals[f'{col}_count'] > 0)
+        else:
+            stats[col] = totals[f'{col}_count'].astype(int)
 
-        # Create a copy of listings data for each city containing the relevant columns
-        listings_data[city] = listings[['date', 'month', 'price', 'neighbourhood_cleansed', 'review_scores_rating', 'name', 'host_total_listings_count',
-                                        'number_of_reviews', 'id', 'room_type', 'host_name', 'minimum_nights', 'host_id', 'reviews_per_month',
-                                        'conf_int_upper', 'conf_int_lower', 'city', 'best_model']].copy()
+    if sketch is not None and len(sketch):
+        stats = stats.join(sketch_quantiles(sketch))
 
-    return neighborhoods_geojson, neighborhood_stats, listings_data
+    # Rename columns for map tooltip
+    return stats.reset_index().rename(columns={'price': 'avg_price', 'review_scores_rating': 'avg_ratings'})
@@ -0,0 +1,111 @@
+import unicodedata
+import numpy as np
+import pandas as pd
+
+def normalize_name(name):
+    """
+    Normalizes a neighbourhood name for matching: accents are removed, the
+    case is folded and runs of whitespace are reduced to single spaces.
+
+    Parameters
+    ----------
+    name : str
+        The neighbourhood name.
+
+    Returns
+    -------
+    str
+        The normalized name, e.g. 'nunez' for 'Ñúñez '.
+    """
+    decomposed = unicodedata.normalize('NFKD', str(name))
+    return ' '.join(''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().split())
+
+def index_features(geojson):
+    """
+    Numbers the features of a GeoJSON file and indexes them by normalized neighbourhood name.
+
+    The position of each feature in the file is stored as its top-level 'id',
+    so map figures can refer to the features by integer (plotly matches
+    locations to the feature 'id' by default). The GeoJSON data is modified
+    in place.
+
+    Parameters
+    ----------
+    geojson : dict
+        The GeoJSON data of a city.
+
+    Returns
+    -------
+    dict
+        The feature id of each normalized `properties.neighbourhood`. If
+        several features have the same name, the first one is used.
+    """
+    feature_index = {}
+    for feature_id, feature in enumerate(geojson.get('features', [])):
+        feature['id'] = feature_id
+        name = (feature.get('properties') or {}).get('neighbourhood')
+        if name is not None:
+            feature_index.setdefault(normalize_name(name), feature_id)
+    return feature_index
+
+def feature_ids(names, feature_index):
+    """
+    Looks up the feature ids of neighbourhood names.
+
+    Each distinct name is normalized once, so the cost for a column of
+    listing rows is one factorization plus a lookup per neighbourhood.
+
+    Parameters
+    ----------
+    names : pd.Series
+        The neighbourhood names.
+    feature_index : dict
+        The feature id of each normalized name (see `index_features`).
+
+    Returns
+    -------
+    np.ndarray
+        The feature id of each name, -1 for missing or unknown names.
+    """
+    codes, uniques = pd.factorize(names)
+    unique_ids = np.array([feature_index.get(normalize_name(name), -1) for name in uniques] + [-1], dtype=np.int64)
+    # Missing names have the code -1, which selects the final -1
+    return unique_ids[codes]
+
+def unused_features(geojson, used_ids):
+    """
+    Returns the neighbourhoods of a GeoJSON file that no listing refers to.
+
+    Parameters
+    ----------
+    geojson : dict
+        The GeoJSON data of a city, numbered by `index_features`.
+    used_ids : array-like
+        The feature ids of the neighbourhood statistics.
+
+    Returns
+    -------
+    list
+        The sorted `properties.neighbourhood` of the features without listings.
+    """
+    used = set(np.asarray(used_ids).tolist())
+    return sorted(str((feature.get('properties') or {}).get('neighbourhood'))
+                  for feature in geojson.get('features', []) if feature.get('id') not in used)
+
+def stats_feature_index(neighborhood_stats_selected):
+    """
+    Rebuilds the feature index of a city from the feature ids of its statistics.
+
+    Parameters
+    ----------
+    neighborhood_stats_selected : pd.DataFrame
+        The neighborhood statistics of a city, with 'feature_id' (see `load_data`).
+
+    Returns
+    -------
+    dict
+        The feature id of each normalized neighbourhood name with a feature.
+    """
+    matched = neighborhood_stats_selected[neighborhood_stats_selected['feature_id'] >= 0]
+    return {normalize_name(name): int(feature_id)
+            for name, feature_id in zip(matched['neighbourhood_cleansed'], matched['feature_id'])}
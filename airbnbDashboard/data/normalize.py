@@ -0,0 +1,80 @@
+import pandas as pd
+
+# Static listing attributes, repeated in every monthly row of the combined CSV files
+listing_attributes = ['name', 'host_name', 'host_id', 'room_type', 'minimum_nights', 'host_total_listings_count',
+                      'latitude', 'longitude']
+
+# Columns that change from month to month and stay in the fact table
+fact_columns = ['date', 'month', 'id', 'neighbourhood_cleansed', 'price', 'review_scores_rating', 'number_of_reviews',
+                'reviews_per_month', 'conf_int_upper', 'conf_int_lower', 'best_model']
+
+def split_listings(listings):
+    """
+    Splits monthly listing rows into a narrow fact table and the static listing attributes.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        Listings with one row per listing and month, containing `fact_columns`
+        and `listing_attributes`. Missing attributes (e.g. the coordinates in
+        older files) are left out.
+
+    Returns
+    -------
+    facts : pd.DataFrame
+        The monthly values, restricted to `fact_columns`.
+    attributes : pd.DataFrame
+        The static attributes with 'id' and 'date', one row per listing id
+        (the most recent one). Forecast rows without an id are left out.
+    """
+    facts = listings[fact_columns]
+    attributes = listings.loc[listings['id'].notna(), ['id', 'date'] + [col for col in listing_attributes if col in listings.columns]]
+    attributes = attributes.sort_values('date', kind='stable').drop_duplicates('id', keep='last')
+    return facts, attributes
+
+def build_listing_dim(attribute_frames):
+    """
+    Builds the deduplicated listing dimension from one or more results of `split_listings`.
+
+    Parameters
+    ----------
+    attribute_frames : list of pd.DataFrame
+        The attributes returned by `split_listings`, e.g. one frame per chunk.
+
+    Returns
+    -------
+    pd.DataFrame
+        The listing attributes indexed by 'id', one row per listing, taken from
+        the most recent month in which the listing appears.
+    """
+    attributes = pd.concat(attribute_frames, ignore_index=True)
+    attributes = attributes.sort_values('date', kind='stable').drop_duplicates('id', keep='last')
+    return attributes.drop(columns='date').set_index('id')
+
+def join_listings(facts, listing_dim, columns):
+    """
+    Joins the requested static attributes onto a (filtered) slice of the fact table.
+
+    Only the attributes in `columns` that are not already in `facts` are joined,
+    so callers that only need monthly values pay nothing.
+
+    Parameters
+    ----------
+    facts : pd.DataFrame
+        A slice of the fact table with an 'id' column.
+    listing_dim : pd.DataFrame or None
+        The listing dimension of the city, indexed by 'id'.
+    columns : list
+        The columns the caller needs.
+
+    Returns
+    -------
+    pd.DataFrame
+        The facts with the requested attributes added.
+    """
+    if listing_dim is None:
+        return facts
+    missing_columns = [col for col in dict.fromkeys(columns) if col not in facts.columns and col in listing_dim.columns]
+    if not missing_columns:
+        return facts
+    return facts.join(listing_dim[missing_columns], on='id')
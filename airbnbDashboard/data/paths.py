@@ -1,13 +1,11 @@
 import os
-from .repo_manager import clone_or_update_repo
 
 # Dynamically set the local directory based on the user's home directory
 home_dir = os.path.expanduser("~")
 local_dir = os.path.join(home_dir, 'webapp')
 
-# Clone or update the repository
+# The repository with the data, cloned or updated by `setup_repo` when the app starts (see app.py)
 repo_url = 'https://github.com/aleksandar42/webapp.git'
-clone_or_update_repo(repo_url, local_dir)
 
 # Locate where the current file is in the directory
 base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -15,6 +13,44 @@ base_dir = os.path.dirname(os.path.abspath(__file__))
 # Set up your paths using the local directory
 dataset_dir = os.path.join(local_dir, 'data')
 
+# Months appended after the CSV files were generated (see data/incremental.py)
+delta_dir = os.path.join(dataset_dir, 'deltas')
+
+# Rows rejected by the validation at startup (see data/validation.py)
+quarantine_dir = os.path.join(dataset_dir, 'quarantine')
+
+# Rows accepted by the validation, scanned by the DuckDB query backend instead of being loaded (see data/loader.py)
+validated_dir = os.path.join(dataset_dir, 'validated')
+
+# Files of the table exports (see utils/export.py), the files of earlier runs are removed at startup
+export_dir = os.path.join(dataset_dir, 'exports')
+
+# Profiles of requests that were sampled or asked for one with the admin token (see utils/profiling.py),
+# the files of earlier runs are removed at startup
+profile_dir = os.path.join(dataset_dir, 'profiles')
+
+# Fraction of requests profiled without an X-Profile header or ?profile flag, 0 to profile only on request
+profile_sample_rate = 0.0
+
+# Timeline of the startup phases (see utils/tracing.py), written as 'json' or in the Chrome trace-event format ('chrome')
+trace_path = os.path.join(dataset_dir, 'startup_trace.json')
+trace_format = 'json'
+
+# Threads that warm the caches with the likely next views while the server is idle (see utils/prefetch.py), 0 for none
+prefetch_workers = 1
+
+# Token of the admin routes that change the data or expose the server internals, sent in the
+# X-Admin-Token header (see utils/admin.py). The routes are not registered while it is not set
+admin_token = os.environ.get('AIRBNB_DASHBOARD_ADMIN_TOKEN')
+
+# Backend of the listing queries (see data/query.py): 'pandas' for the loaded
+# DataFrames or 'duckdb' to scan the validated Parquet files without loading them
+# (requires the duckdb package). The search, host portfolios, density layer,
+# month ranges, exports, listings API and new months need the loaded DataFrames,
+# so they are not available with 'duckdb', which also refuses to start while
+# there are months in `delta_dir`
+query_engine = 'pandas'
+
 
 # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # # #
 # Dictionaries
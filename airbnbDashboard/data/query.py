@@ -0,0 +1,385 @@
+import threading
+import pandas as pd
+
+from airbnbDashboard.data.normalize import fact_columns, join_listings
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Aggregation functions of `aggregate`, with their SQL names
+aggregations_sql = {
+    'mean': 'avg',
+    'sum': 'sum',
+    'count': 'count',
+    'min': 'min',
+    'max': 'max',
+}
+
+class PandasBackend:
+    """
+    Answers the queries of the dashboard from the DataFrames returned by `load_data`.
+
+    All query backends provide the same methods: `cities`, `columns`, `slice`,
+    `aggregate`, `top_k` and `distinct`. Filters are dictionaries keyed by
+    column: a list selects the rows with any of its values, a `slice(low, high)`
+    an inclusive range (either bound may be None) and any other value the rows
+    equal to it. Static listing attributes can be used like monthly columns.
+
+    Parameters
+    ----------
+    listings_data : dict
+        The monthly listings of each city.
+    listing_dims : dict, optional
+        The static listing attributes of each city.
+
+    Usage
+    -----
+    >>> backend = PandasBackend(listings_data, listing_dims)
+    >>> backend.top_k('Madrid, Spain', 'price', 5, filters={'month': 6, 'room_type': ['Private room']})
+    """
+
+    def __init__(self, listings_data, listing_dims=None):
+        self.listings_data = listings_data
+        self.listing_dims = listing_dims or {}
+
+    def cities(self):
+        """Returns the names of the cities."""
+        return list(self.listings_data)
+
+    def columns(self, city):
+        """Returns the columns of a city: the monthly values followed by the static attributes."""
+        columns = list(self.listings_data[city].columns)
+        if city in self.listing_dims:
+            columns += [col for col in self.listing_dims[city].columns if col not in columns]
+        return columns
+
+    def slice(self, city, filters=None, columns=None):
+        """
+        Returns the rows of a city that match the filters.
+
+        Parameters
+        ----------
+        city : str
+            The city name.
+        filters : dict, optional
+            The filters (see the class description).
+        columns : list, optional
+            The columns to return. The default is all monthly columns.
+
+        Returns
+        -------
+        pd.DataFrame
+            The matching rows, in their stored order.
+
+        Raises
+        ------
+        KeyError
+            If the city or a column is unknown.
+        """
+        filters = filters or {}
+        self._check_columns(city, list(filters) + list(columns or []))
+        listing_dim = self.listing_dims.get(city)
+        listings = join_listings(self.listings_data[city], listing_dim, list(filters))
+        mask = pd.Series(True, index=listings.index)
+        for col, value in filters.items():
+            if isinstance(value, list):
+                mask &= listings[col].isin(value)
+            elif isinstance(value, slice):
+                if value.start is not None:
+                    mask &= listings[col] >= value.start
+                if value.stop is not None:
+                    mask &= listings[col] <= value.stop
+            else:
+                mask &= listings[col] == value
+        listings = listings[mask]
+        if columns is None:
+            return listings[list(self.listings_data[city].columns)]
+        return join_listings(listings, listing_dim, columns)[columns]
+
+    def aggregate(self, city, by, aggregations, filters=None):
+        """
+        Aggregates the matching rows of a city by groups.
+
+        Parameters
+        ----------
+        city : str
+            The city name.
+        by : list
+            The columns to group by.
+        aggregations : dict
+            The result columns, each a (column, function) tuple with a function
+            of `aggregations_sql`. Missing values are ignored, and so are rows
+            with a missing value in a `by` column.
+        filters : dict, optional
+            The filters (see the class description).
+
+        Returns
+        -------
+        pd.DataFrame
+            The `by` columns and the result columns, one row per group, sorted by `by`.
+        """
+        columns = list(dict.fromkeys(list(by) + [col for col, _ in aggregations.values()]))
+        listings = self.slice(city, filters, columns)
+        return listings.groupby(by).agg(**aggregations).reset_index()
+
+    def top_k(self, city, sort_by, k=None, ascending=True, filters=None, columns=None):
+        """
+        Returns the matching rows of a city with the lowest or highest values of a column.
+
+        Parameters
+        ----------
+        city : str
+            The city name.
+        sort_by : str
+            The column to sort by. Missing values come last.
+        k : int, optional
+            The number of rows. The default is all matching rows.
+        ascending : bool, optional
+            Whether the lowest values come first. The default is True.
+        filters : dict, optional
+            The filters (see the class description).
+        columns : list, optional
+            The columns to return. The default is all monthly columns.
+
+        Returns
+        -------
+        pd.DataFrame
+            At most `k` rows, sorted by `sort_by`.
+        """
+        selected = list(dict.fromkeys((columns or list(self.listings_data[city].columns)) + [sort_by]))
+        listings = self.slice(city, filters, selected)
+        listings = listings.sort_values(sort_by, ascending=ascending, kind='stable', na_position='last')
+        if k is not None:
+            listings = listings.head(k)
+        return listings[columns or list(self.listings_data[city].columns)]
+
+    def distinct(self, city, column, filters=None):
+        """
+        Returns the sorted distinct values of a column of a city, without missing values.
+
+        Parameters
+        ----------
+        city : str
+            The city name.
+        column : str
+            The column.
+        filters : dict, optional
+            The filters (see the class description).
+
+        Returns
+        -------
+        list
+            The distinct values.
+        """
+        return sorted(self.slice(city, filters, [column])[column].dropna().unique().tolist())
+
+    def _check_columns(self, city, columns):
+        if city not in self.listings_data:
+            raise KeyError(f"Unknown city: {city}")
+        unknown = set(columns) - set(self.columns(city))
+        if unknown:
+            raise KeyError(f"Unknown columns for {city}: {sorted(unknown)}")
+
+class DuckDBBackend:
+    """
+    Answers the queries of the dashboard with DuckDB, directly from the listings files.
+
+    The files are scanned by DuckDB on every query, in parallel and without
+    loading them into memory, so the queries also work for files larger than
+    the available memory. Rows without a neighbourhood or price are left out
+    and 'month' is the month of 'date'. The app passes the Parquet files of
+    valid rows written by `load_data` (see its `validated_dir`), so the rows
+    are those of the pandas backend, and a query only reads the columns it
+    selects. The static attributes are the values of each row, not those of
+    the latest month.
+
+    It provides the same methods as `PandasBackend`. DuckDB is optional and
+    only needed for this backend.
+
+    Parameters
+    ----------
+    city_paths : dict
+        Dictionary containing the paths to the listings files for each city,
+        Parquet files (ending in '.parquet') or CSV files.
+
+    Raises
+    ------
+    ImportError
+        If the `duckdb` package is not installed.
+    """
+
+    def __init__(self, city_paths):
+        if duckdb is None:
+            raise ImportError("The DuckDB query backend requires the duckdb package")
+        self._connection = duckdb.connect()
+        self._local = threading.local()
+        self._views = {}
+        self._columns = {}
+        for number, (city, paths) in enumerate(city_paths.items()):
+            path = literal(paths['listings'])
+            if paths['listings'].endswith('.parquet'):
+                # The column types are stored in the file
+                source = f"read_parquet({path})"
+                described = self._connection.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()
+            else:
+                # The column types are detected once from the whole file (sparse columns such as the
+                # forecast intervals would look like text in a sample) and fixed for all queries
+                described = self._connection.execute(
+                    f"DESCRIBE SELECT * FROM read_csv_auto({path}, header=true, sample_size=-1)").fetchall()
+                types = ', '.join(f"{literal(name)}: {literal(column_type)}" for name, column_type, *_ in described)
+                source = f"read_csv({path}, header=true, columns={{{types}}})"
+            columns = [row[0] for row in described]
+            selected = ', '.join(quote(col) for col in columns if col != 'month')
+            view = f'listings_{number}'
+            self._connection.execute(
+                f"CREATE VIEW {view} AS SELECT {selected}, month(date) AS month FROM {source} "
+                f"WHERE neighbourhood_cleansed IS NOT NULL AND price IS NOT NULL")
+            self._views[city] = view
+            columns = [col for col in columns if col != 'month'] + ['month']
+            self._columns[city] = [col for col in fact_columns if col in columns] + [col for col in columns if col not in fact_columns]
+
+    def cities(self):
+        """Returns the names of the cities."""
+        return list(self._views)
+
+    def columns(self, city):
+        """Returns the columns of a city: the monthly values followed by the static attributes."""
+        return list(self._columns[city])
+
+    def slice(self, city, filters=None, columns=None):
+        """Returns the rows of a city that match the filters (see `PandasBackend.slice`)."""
+        where, params = self._where(city, filters)
+        return self._query(f"SELECT {self._select(city, columns)} FROM {self._views[city]}{where}", params)
+
+    def aggregate(self, city, by, aggregations, filters=None):
+        """Aggregates the matching rows of a city by groups (see `PandasBackend.aggregate`)."""
+        self._check_columns(city, list(by) + [col for col, _ in aggregations.values()])
+        where, params = self._where(city, filters)
+        where += (' AND ' if where else ' WHERE ') + ' AND '.join(f"{quote(col)} IS NOT NULL" for col in by)
+        groups = ', '.join(quote(col) for col in by)
+        results = ', '.join(f"{aggregations_sql[function]}({quote(col)}) AS {quote(name)}"
+                            for name, (col, function) in aggregations.items())
+        return self._query(f"SELECT {groups}, {results} FROM {self._views[city]}{where} GROUP BY {groups} ORDER BY {groups}", params)
+
+    def top_k(self, city, sort_by, k=None, ascending=True, filters=None, columns=None):
+        """Returns the matching rows with the lowest or highest values of a column (see `PandasBackend.top_k`)."""
+        self._check_columns(city, [sort_by])
+        where, params = self._where(city, filters)
+        order = f"{quote(sort_by)} {'ASC' if ascending else 'DESC'} NULLS LAST"
+        limit = '' if k is None else f" LIMIT {int(k)}"
+        return self._query(f"SELECT {self._select(city, columns)} FROM {self._views[city]}{where} ORDER BY {order}{limit}", params)
+
+    def distinct(self, city, column, filters=None):
+        """Returns the sorted distinct values of a column of a city (see `PandasBackend.distinct`)."""
+        self._check_columns(city, [column])
+        where, params = self._where(city, filters)
+        condition = f"{' AND' if where else ' WHERE'} {quote(column)} IS NOT NULL"
+        result = self._query(f"SELECT DISTINCT {quote(column)} FROM {self._views[city]}{where}{condition} ORDER BY 1", params)
+        return result[column].tolist()
+
+    def _query(self, sql, params):
+        # DuckDB connections must not be shared between threads, each thread uses its own cursor
+        cursor = getattr(self._local, 'cursor', None)
+        if cursor is None:
+            cursor = self._local.cursor = self._connection.cursor()
+        return cursor.execute(sql, params).df()
+
+    def _select(self, city, columns):
+        # The default projection is that of the pandas backend, the monthly fact columns
+        columns = columns or [col for col in fact_columns if col in self._columns[city]]
+        self._check_columns(city, columns)
+        return ', '.join(quote(col) for col in columns)
+
+    def _where(self, city, filters):
+        conditions = []
+        params = []
+        for col, value in (filters or {}).items():
+            self._check_columns(city, [col])
+            if isinstance(value, list):
+                if not value:
+                    conditions.append('false')
+                    continue
+                conditions.append(f"{quote(col)} IN ({', '.join('?' for _ in value)})")
+                params.extend(value)
+            elif isinstance(value, slice):
+                if value.start is not None:
+                    conditions.append(f"{quote(col)} >= ?")
+                    params.append(value.start)
+                if value.stop is not None:
+                    conditions.append(f"{quote(col)} <= ?")
+                    params.append(value.stop)
+            else:
+                conditions.append(f"{quote(col)} = ?")
+                params.append(value)
+        return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+    def _check_columns(self, city, columns):
+        if city not in self._views:
+            raise KeyError(f"Unknown city: {city}")
+        unknown = set(columns) - set(self._columns[city])
+        if unknown:
+            raise KeyError(f"Unknown columns for {city}: {sorted(unknown)}")
+
+def quote(identifier):
+    """
+    Quotes a column name for SQL.
+
+    Parameters
+    ----------
+    identifier : str
+        The column name.
+
+    Returns
+    -------
+    str
+        The name in double quotes, with inner double quotes doubled.
+    """
+    return '"' + identifier.replace('"', '""') + '"'
+
+def literal(text):
+    """
+    Quotes a text (e.g. a file path) as an SQL string literal.
+
+    Parameters
+    ----------
+    text : str
+        The text.
+
+    Returns
+    -------
+    str
+        The text in single quotes, with inner single quotes doubled.
+    """
+    return "'" + text.replace("'", "''") + "'"
+
+def create_query_backend(name, listings_data=None, listing_dims=None, city_paths=None):
+    """
+    Creates the query backend of the data-access API.
+
+    Parameters
+    ----------
+    name : str
+        'pandas' to query the loaded DataFrames or 'duckdb' to query the
+        listings files with DuckDB.
+    listings_data, listing_dims : dict, optional
+        The data returned by `load_data`, for the pandas backend.
+    city_paths : dict, optional
+        The paths of the files of each city, for the DuckDB backend.
+
+    Returns
+    -------
+    PandasBackend or DuckDBBackend
+        The backend.
+
+    Raises
+    ------
+    ValueError
+        If the name is unknown.
+    """
+    if name == 'pandas':
+        return PandasBackend(listings_data, listing_dims)
+    if name == 'duckdb':
+        return DuckDBBackend(city_paths)
+    raise ValueError(f"Unknown query backend: {name}")
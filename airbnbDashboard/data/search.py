@@ -0,0 +1,237 @@
+import numpy as np
+import pandas as pd
+
+# Attributes of a listing that are searchable
+search_columns = ['name', 'host_name']
+
+def tokenize(texts):
+    """
+    Splits texts into lower case tokens without accents.
+
+    Parameters
+    ----------
+    texts : pd.Series
+        The texts to split.
+
+    Returns
+    -------
+    pd.Series
+        A list of tokens per text.
+    """
+    texts = texts.fillna('').astype(str).str.normalize('NFKD').str.replace(r'[\u0300-\u036f]', '', regex=True)
+    return texts.str.lower().str.findall(r'\w+')
+
+def build_search_index(listings, listing_dim):
+    """
+    Builds an inverted index over the names and host names of the listings of a city.
+
+    The vocabulary of all tokens is sorted and the postings (listing positions)
+    are stored token after token in one array. The listings of every token that
+    starts with a given prefix are therefore one contiguous slice of the
+    postings, found by two binary searches in the vocabulary.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        The monthly listings of a city, used for the latest neighbourhood and month.
+    listing_dim : pd.DataFrame
+        The static listing attributes of the city, indexed by listing id.
+
+    Returns
+    -------
+    dict or None
+        A dictionary with the keys 'vocabulary' (sorted tokens), 'starts'
+        (offset of each token's postings, plus the end), 'postings' (listing
+        positions) and 'listings' (id, name, host name, latest neighbourhood and
+        month of each position). None if none of the `search_columns` exist.
+    """
+    columns = [col for col in search_columns if listing_dim is not None and col in listing_dim.columns]
+    if not columns:
+        return None
+
+    documents = search_documents(listings, listing_dim, columns)
+    postings = document_tokens(documents, columns).sort_values(['token', 'position'], kind='stable')
+
+    vocabulary, starts = np.unique(postings['token'].to_numpy(dtype=str), return_index=True)
+    return {
+        'vocabulary': vocabulary,
+        'starts': np.append(starts, len(postings)),
+        'postings': postings['position'].to_numpy(dtype=np.int32),
+        'listings': documents,
+    }
+
+def search_documents(listings, listing_dim, columns):
+    """
+    Returns the searchable attributes and the latest neighbourhood and month of the listings.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        Monthly listings.
+    listing_dim : pd.DataFrame
+        The static listing attributes of the city, indexed by listing id.
+    columns : list
+        The searchable columns of `listing_dim`.
+
+    Returns
+    -------
+    pd.DataFrame
+        The id, the `columns` and the neighbourhood and month ('YYYY-MM') of
+        the most recent row of every listing of `listing_dim` with rows.
+    """
+    latest = listings.loc[listings['id'].notna(), ['id', 'date', 'neighbourhood_cleansed']]
+    latest = latest.sort_values('date', kind='stable').drop_duplicates('id', keep='last').set_index('id')
+    documents = listing_dim[columns].join(latest, how='inner').reset_index()
+    documents['id'] = documents['id'].astype('int64')
+    # Formatted once per distinct date, the listings share a few dates
+    codes, dates = pd.factorize(documents.pop('date'), use_na_sentinel=False)
+    documents['month'] = np.asarray(dates.strftime('%Y-%m'), dtype=object)[codes]
+    return documents[['id'] + columns + ['neighbourhood_cleansed', 'month']]
+
+def document_tokens(documents, columns):
+    """
+    Splits the searchable columns of documents into tokens.
+
+    Parameters
+    ----------
+    documents : pd.DataFrame
+        Rows of the 'listings' of a search index, indexed by position.
+    columns : list
+        The searchable columns.
+
+    Returns
+    -------
+    pd.DataFrame
+        The distinct pairs of 'token' and 'position'.
+    """
+    tokens = pd.concat([tokenize(documents[col]) for col in columns]).explode().dropna()
+    return pd.DataFrame({'token': tokens.to_numpy(dtype=str), 'position': tokens.index.to_numpy()}).drop_duplicates()
+
+def update_search_index(search_index, listings, listing_dim):
+    """
+    Updates the search index of a city with the rows of a new month.
+
+    The rows of the new month are the latest rows of their listings. Listings
+    that are indexed already keep their position and take the neighbourhood
+    and month of the new rows, and only those whose name or host name changed
+    are tokenized again. New listings are added after the others. The postings
+    of the tokenized listings replace their old ones by a merge into the
+    sorted postings, without tokenizing or sorting the other listings again.
+
+    Parameters
+    ----------
+    search_index : dict
+        The result of `build_search_index` before the month was added.
+    listings : pd.DataFrame
+        The rows of the new month.
+    listing_dim : pd.DataFrame
+        The static listing attributes of the city after the month was added.
+
+    Returns
+    -------
+    dict
+        The updated index, the given one is not changed.
+    """
+    documents = search_index['listings']
+    columns = [col for col in search_columns if col in documents.columns]
+    new_documents = search_documents(listings, listing_dim, columns)
+    if not len(new_documents):
+        return search_index
+
+    positions = pd.Index(documents['id']).get_indexer(new_documents['id'])
+    known = positions >= 0
+    changed = np.zeros(known.sum(), dtype=bool)
+    for col in columns:
+        before, after = documents[col].to_numpy()[positions[known]], new_documents[col].to_numpy()[known]
+        changed |= ~((before == after) | (pd.isna(before) & pd.isna(after)))
+    n_documents = len(documents) + (~known).sum()
+    positions[~known] = np.arange(len(documents), n_documents)
+    documents = pd.concat([documents, new_documents[~known]], ignore_index=True)
+    documents.loc[positions[known], new_documents.columns[1:]] = new_documents.loc[known, new_documents.columns[1:]].to_numpy()
+
+    # Postings are merged as sorted keys (token number * documents + position) of the combined vocabulary
+    tokenized = np.concatenate([positions[known][changed], positions[~known]])
+    tokens = document_tokens(documents.iloc[tokenized], columns)
+    vocabulary = np.union1d(search_index['vocabulary'], tokens['token'].to_numpy(dtype=str))
+    old_tokens = np.repeat(np.searchsorted(vocabulary, search_index['vocabulary']), np.diff(search_index['starts']))
+    postings = search_index['postings']
+    kept = ~np.isin(postings, tokenized)
+    keys = old_tokens[kept].astype(np.int64) * n_documents + postings[kept]
+    new_keys = np.sort(np.searchsorted(vocabulary, tokens['token'].to_numpy(dtype=str)).astype(np.int64) * n_documents
+                       + tokens['position'].to_numpy(dtype=np.int64))
+    keys = np.insert(keys, np.searchsorted(keys, new_keys), new_keys)
+
+    # Tokens whose listings were all tokenized again may have no postings left
+    counts = np.bincount(keys // n_documents, minlength=len(vocabulary))
+    return {
+        'vocabulary': vocabulary[counts > 0],
+        'starts': np.append(0, np.cumsum(counts[counts > 0])),
+        'postings': (keys % n_documents).astype(np.int32),
+        'listings': documents,
+    }
+
+def search_listings(search_index, query, limit=20):
+    """
+    Finds the listings whose name or host name contains all tokens of a query.
+
+    Every query token matches the indexed tokens it is a prefix of, so results
+    appear while the user is typing. The postings of all indexed tokens that a
+    query token matches are one slice of the postings array, merged once into
+    a sorted array of listings. The query token with the fewest postings gives
+    the candidates, which are then looked up by one binary search per other
+    query token. Short prefixes (e.g. "a") match many indexed tokens, but cost
+    one merge of their slice rather than a search per matched token.
+
+    Parameters
+    ----------
+    search_index : dict
+        The result of `build_search_index`.
+    query : str
+        The search text.
+    limit : int, optional
+        The maximum number of results. The default is 20.
+
+    Returns
+    -------
+    pd.DataFrame
+        The id, name, host name, latest neighbourhood and month of the matching
+        listings, at most `limit` rows.
+    """
+    query_tokens = tokenize(pd.Series([query])).iloc[0]
+    if not query_tokens:
+        return search_index['listings'].iloc[0:0]
+
+    vocabulary = search_index['vocabulary']
+    starts = search_index['starts']
+    postings = search_index['postings']
+
+    # The range of indexed tokens matched by each query token, smallest postings first
+    token_ranges = []
+    for token in set(query_tokens):
+        first = np.searchsorted(vocabulary, token, side='left')
+        last = np.searchsorted(vocabulary, token + '\uffff', side='left')
+        token_ranges.append((starts[last] - starts[first], first, last))
+    token_ranges.sort()
+    if token_ranges[0][0] == 0:
+        return search_index['listings'].iloc[0:0]
+
+    # The listings of each query token, sorted; a single indexed token's postings are sorted already
+    token_postings = []
+    for size, first, last in token_ranges:
+        matched = postings[starts[first]:starts[last]]
+        token_postings.append(np.unique(matched) if last - first > 1 else matched)
+    candidates = token_postings[0]
+
+    # Candidates are checked block by block until enough results are found
+    results = []
+    block_size = max(8 * limit, 1024)
+    for block_start in range(0, len(candidates), block_size):
+        matches = candidates[block_start:block_start + block_size]
+        for listings in token_postings[1:]:
+            indices = np.minimum(np.searchsorted(listings, matches), len(listings) - 1)
+            matches = matches[listings[indices] == matches]
+        results.append(matches)
+        if sum(len(block) for block in results) >= limit:
+            break
+    matches = np.concatenate(results) if results else candidates
+    return search_index['listings'].iloc[matches[:limit]]
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+
+# Relative accuracy of the quantile sketches: a returned quantile is within 1% of the true value
+sketch_relative_accuracy = 0.01
+_gamma = (1 + sketch_relative_accuracy) / (1 - sketch_relative_accuracy)
+_log_gamma = np.log(_gamma)
+
+# Price quantiles shown on the map, keyed by the statistics column they fill
+price_quantiles = {
+    'median_price': 0.5,
+    'p90_price': 0.9,
+}
+
+def sketch_buckets(values):
+    """
+    Maps positive values to the logarithmic buckets of the quantile sketch.
+
+    Bucket i holds the values in (gamma^(i-1), gamma^i], so every value in a
+    bucket is within `sketch_relative_accuracy` of the bucket's representative
+    value (see `bucket_values`).
+
+    Parameters
+    ----------
+    values : np.ndarray
+        The positive values to map.
+
+    Returns
+    -------
+    np.ndarray
+        The bucket index of each value.
+    """
+    return np.ceil(np.log(values) / _log_gamma).astype(np.int64)
+
+def bucket_values(buckets):
+    """
+    Returns the representative value of sketch buckets.
+
+    Parameters
+    ----------
+    buckets : np.ndarray
+        Bucket indices returned by `sketch_buckets`.
+
+    Returns
+    -------
+    np.ndarray
+        The representative value of each bucket.
+    """
+    return 2 * _gamma ** np.asarray(buckets, dtype=float) / (_gamma + 1)
+
+def sketch_chunk(listings, column='price'):
+    """
+    Builds the quantile sketches of a column per neighbourhood and month.
+
+    A sketch is a histogram over logarithmic buckets. Sketches are merged by
+    adding their bucket counts, so they can be accumulated across chunks,
+    months or ranges of months without keeping the rows.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        Listings with 'neighbourhood_cleansed', 'month' and `column` columns.
+    column : str, optional
+        The column to sketch. The default is 'price'.
+
+    Returns
+    -------
+    pd.Series or None
+        The bucket counts indexed by ('neighbourhood_cleansed', 'month',
+        'bucket'), or None if the column does not exist. Non-positive and
+        missing values are left out.
+    """
+    if column not in listings.columns:
+        return None
+    values = listings[column].to_numpy(dtype=float)
+    valid = values > 0
+    keys = listings.loc[valid, ['neighbourhood_cleansed', 'month']]
+    keys = keys.assign(bucket=sketch_buckets(values[valid]))
+    return keys.groupby(['neighbourhood_cleansed', 'month', 'bucket']).size()
+
+def merge_sketches(sketch, other):
+    """
+    Merges two results of `sketch_chunk` by adding their bucket counts.
+
+    Parameters
+    ----------
+    sketch : pd.Series
+        The sketches accumulated so far.
+    other : pd.Series
+        The sketches to add.
+
+    Returns
+    -------
+    pd.Series
+        The merged sketches.
+    """
+    return sketch.add(other, fill_value=0)
+
+def sketch_quantiles(sketch, quantiles=price_quantiles):
+    """
+    Estimates quantiles from sketches indexed by group and bucket.
+
+    Parameters
+    ----------
+    sketch : pd.Series
+        Bucket counts whose last index level is the bucket, e.g. the result
+        of `sketch_chunk` or `merge_sketches`.
+    quantiles : dict, optional
+        The quantiles to estimate, keyed by the name of the result column.
+        The default is `price_quantiles`.
+
+    Returns
+    -------
+    pd.DataFrame
+        One column per quantile, indexed by the remaining index levels.
+    """
+    sketch = sketch.sort_index()
+    group_levels = list(range(sketch.index.nlevels - 1))
+    grouped = sketch.groupby(level=group_levels)
+    cumulative = grouped.cumsum()
+    totals = grouped.transform('sum')
+    buckets = pd.Series(sketch.index.get_level_values(-1), index=sketch.index)
+
+    result = {}
+    for column, quantile in quantiles.items():
+        # The first bucket whose cumulative count passes the rank of the quantile
+        reached = buckets[cumulative > quantile * (totals - 1)].groupby(level=group_levels).first()
+        result[column] = pd.Series(bucket_values(reached), index=reached.index)
+    return pd.DataFrame(result)
+
+def dense_quantiles(counts, offset, quantile):
+    """
+    Estimates a quantile from dense sketches, one row of bucket counts per group.
+
+    Parameters
+    ----------
+    counts : np.ndarray
+        The bucket counts of shape (groups, buckets), e.g. the difference of
+        two cumulative sketches.
+    offset : int
+        The bucket index of the first column.
+    quantile : float
+        The quantile to estimate.
+
+    Returns
+    -------
+    np.ndarray
+        The estimated quantile of each group, NaN for empty groups.
+    """
+    cumulative = np.cumsum(counts, axis=1)
+    totals = cumulative[:, -1]
+    first = np.argmax(cumulative > quantile * (totals[:, None] - 1), axis=1)
+    return np.where(totals > 0, bucket_values(first + offset), np.nan)
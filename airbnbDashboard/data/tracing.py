@@ -0,0 +1,31 @@
+from contextlib import nullcontext
+
+def phase(trace, name, **kwargs):
+    """
+    Records a phase in a trace, if there is one.
+
+    The functions of the startup take the trace as an optional argument and
+    wrap their steps in this context manager, so they need not check for it.
+    It lives in the data package rather than next to `StartupTrace` in
+    `utils/tracing.py`, so the loading and the plots can use it too.
+
+    Parameters
+    ----------
+    trace : StartupTrace or None
+        The trace, or None to record nothing.
+    name : str
+        The name of the phase, e.g. 'read_listings'.
+    **kwargs
+        Passed on to `StartupTrace.phase`, e.g. the `city` the phase is about.
+
+    Returns
+    -------
+    context manager
+        The phase of the trace, or a context manager that does nothing.
+
+    Usage
+    -----
+    >>> with phase(trace, 'read_listings', city='Madrid, Spain'):
+    ...     listings = pd.read_csv(path)
+    """
+    return trace.phase(name, **kwargs) if trace is not None else nullcontext()
@@ -0,0 +1,308 @@
+import os
+import re
+import numpy as np
+import pandas as pd
+
+from airbnbDashboard.data.neighbourhoods import feature_ids
+from airbnbDashboard.data.query import literal
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+# Prices per night outside this range (exclusive lower, inclusive upper bound) are rejected as impossible or extreme
+price_range = (0, 10000)
+
+# Review ratings are given on a scale of 0 to 5
+rating_range = (0, 5)
+
+# Columns that must be numbers, if present
+numeric_columns = ['price', 'review_scores_rating', 'number_of_reviews', 'reviews_per_month', 'minimum_nights',
+                   'host_total_listings_count', 'latitude', 'longitude', 'conf_int_upper', 'conf_int_lower']
+
+# Columns that cannot be negative, if present
+count_columns = ['number_of_reviews', 'reviews_per_month', 'minimum_nights', 'host_total_listings_count']
+
+# Validation rules in the order they are checked, a rejected row is reported under every rule it breaks
+validation_rules = ['missing_neighbourhood', 'missing_price', 'malformed_value', 'invalid_date', 'price_out_of_range',
+                    'rating_out_of_range', 'negative_count', 'invalid_coordinates', 'unknown_neighbourhood']
+
+def parse_numbers(values):
+    """
+    Converts a column to numbers, accepting prices written with currency symbols and thousands separators.
+
+    Parameters
+    ----------
+    values : pd.Series
+        The column as read from the CSV file.
+
+    Returns
+    -------
+    pd.Series
+        The column as floats (unchanged if it is numeric already), NaN where a value is not a number.
+    """
+    if values.dtype != object:
+        return values
+    # '$1,234.00' -> '1234.00'
+    cleaned = values.astype(str).str.replace(r'[$€£,\s]', '', regex=True)
+    return pd.to_numeric(cleaned, errors='coerce')
+
+def validate_listings(listings, feature_index=None):
+    """
+    Checks the listing rows of a city against `validation_rules` and cleanses the valid ones.
+
+    Every rule is a column-wise comparison over the whole frame, so the cost
+    is a few array operations per rule regardless of the number of rows.
+    Numeric columns read as text (e.g. '$1,234.00') are converted to numbers
+    and a text date column to dates. Numbers that cannot be converted break
+    the 'malformed_value' rule, missing or malformed dates 'invalid_date'.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        The rows read from a listings CSV file (or a chunk of them). It is
+        modified in place.
+    feature_index : dict, optional
+        The GeoJSON features of the city by normalized neighbourhood name (see
+        `airbnbDashboard.data.neighbourhoods.index_features`). Rows of
+        neighbourhoods without a feature could not be shown on the map and are
+        rejected; names are matched regardless of case and accents. The
+        default is to accept any name.
+
+    Returns
+    -------
+    valid : pd.DataFrame
+        The rows that pass all rules, with the converted columns.
+    rejected : pd.DataFrame
+        The rejected rows as they were read, with a 'rejected_by' column
+        naming the rules they break.
+    report : dict
+        The number of 'rows' checked, the number of 'rejected' rows and, under
+        'rules', the number of rows breaking each of the `validation_rules`,
+        and the sorted neighbourhood names without a feature under 'unmatched'.
+    """
+    converted = {col: parse_numbers(listings[col]) for col in numeric_columns if col in listings.columns}
+    if 'date' in listings.columns and not pd.api.types.is_datetime64_any_dtype(listings['date']):
+        converted['date'] = pd.to_datetime(listings['date'], errors='coerce')
+
+    def column(col):
+        return converted[col] if col in converted else listings[col]
+
+    def malformed(col):
+        return (listings[col].notna() & column(col).isna()).to_numpy()
+
+    n_rows = len(listings)
+    no_rows = np.zeros(n_rows, dtype=bool)
+    price = column('price')
+    missing_neighbourhood = listings['neighbourhood_cleansed'].isna().to_numpy()
+    masks = {
+        'missing_neighbourhood': missing_neighbourhood,
+        'missing_price': listings['price'].isna().to_numpy(),
+        'malformed_value': np.logical_or.reduce([malformed(col) for col in converted if col != 'date'] + [no_rows]),
+        'invalid_date': column('date').isna().to_numpy() if 'date' in listings.columns else no_rows,
+        # Comparisons with NaN are False, so missing values only break the rules about missing values
+        'price_out_of_range': ((price <= price_range[0]) | (price > price_range[1])).to_numpy(),
+        'rating_out_of_range': no_rows,
+        'negative_count': np.logical_or.reduce([(column(col) < 0).to_numpy() for col in count_columns
+                                                if col in listings.columns] + [no_rows]),
+        'invalid_coordinates': no_rows,
+        'unknown_neighbourhood': no_rows,
+    }
+    if 'review_scores_rating' in listings.columns:
+        rating = column('review_scores_rating')
+        masks['rating_out_of_range'] = ((rating < rating_range[0]) | (rating > rating_range[1])).to_numpy()
+    if {'latitude', 'longitude'} <= set(listings.columns):
+        latitude, longitude = column('latitude'), column('longitude')
+        masks['invalid_coordinates'] = ((latitude.abs() > 90) | (longitude.abs() > 180)).to_numpy()
+    if feature_index is not None:
+        masks['unknown_neighbourhood'] = ~missing_neighbourhood & (feature_ids(listings['neighbourhood_cleansed'], feature_index) < 0)
+
+    broken = np.stack([masks[rule] for rule in validation_rules])
+    rejected_rows = broken.any(axis=0)
+
+    rejected = listings[rejected_rows]
+    if len(rejected):
+        # The names of the broken rules, e.g. 'missing_price;price_out_of_range', built once per combination of rules
+        codes = np.packbits(broken[:, rejected_rows], axis=0, bitorder='little')
+        codes = codes.astype(np.int64).T @ (256 ** np.arange(len(codes), dtype=np.int64))
+        combinations, inverse = np.unique(codes, return_inverse=True)
+        labels = np.array([';'.join(rule for i, rule in enumerate(validation_rules) if code >> i & 1) for code in combinations],
+                          dtype=object)
+        rejected = rejected.assign(rejected_by=labels[inverse])
+
+    for col, values in converted.items():
+        listings[col] = values
+    valid = listings[~rejected_rows] if rejected_rows.any() else listings
+    report = {
+        'rows': n_rows,
+        'rejected': len(rejected),
+        'rules': dict(zip(validation_rules, broken.sum(axis=1).tolist())),
+        'unmatched': sorted(listings.loc[masks['unknown_neighbourhood'], 'neighbourhood_cleansed'].unique().tolist()),
+    }
+    return valid, rejected, report
+
+def merge_reports(report, other):
+    """
+    Adds the validation reports of two chunks of rows.
+
+    Parameters
+    ----------
+    report, other : dict
+        Results of `validate_listings` or `merge_reports`.
+
+    Returns
+    -------
+    dict
+        The report of both chunks.
+    """
+    return {
+        'rows': report['rows'] + other['rows'],
+        'rejected': report['rejected'] + other['rejected'],
+        'rules': {rule: report['rules'].get(rule, 0) + other['rules'].get(rule, 0) for rule in validation_rules},
+        'unmatched': sorted(set(report.get('unmatched', [])) | set(other.get('unmatched', []))),
+    }
+
+def quarantine_path(quarantine_dir, city):
+    """
+    Returns the path of the quarantine file of a city.
+
+    Parameters
+    ----------
+    quarantine_dir : str
+        The directory of the quarantine files.
+    city : str
+        The city name.
+
+    Returns
+    -------
+    str
+        The path '<quarantine_dir>/<city>.csv', with the city name reduced to word characters.
+    """
+    return os.path.join(quarantine_dir, re.sub(r'\W+', '_', city).strip('_') + '.csv')
+
+def write_quarantine(path, rejected, append=False):
+    """
+    Writes rejected rows to a quarantine file.
+
+    Parameters
+    ----------
+    path : str
+        The path of the quarantine file.
+    rejected : pd.DataFrame
+        The rejected rows returned by `validate_listings`.
+    append : bool, optional
+        Whether to add the rows to an existing file (e.g. for later chunks of
+        the same CSV file). The default is to replace the file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    append = append and os.path.exists(path)
+    rejected.to_csv(path, mode='a' if append else 'w', header=not append, index=False)
+
+def validated_path(validated_dir, city):
+    """
+    Returns the path of the file with the valid rows of a city.
+
+    Parameters
+    ----------
+    validated_dir : str
+        The directory of the validated files.
+    city : str
+        The city name.
+
+    Returns
+    -------
+    str
+        The path '<validated_dir>/<city>.parquet', with the city name reduced to word characters.
+    """
+    return os.path.splitext(quarantine_path(validated_dir, city))[0] + '.parquet'
+
+def staged_path(path):
+    """
+    Returns the path of the CSV file that collects the valid rows until `finish_validated` converts it.
+
+    Parameters
+    ----------
+    path : str
+        The path of the validated file.
+
+    Returns
+    -------
+    str
+        The path '<path>.csv'.
+    """
+    return path + '.csv'
+
+def write_validated(path, listings, append=False):
+    """
+    Writes valid rows to the staged file of a validated file, see `finish_validated`.
+
+    Parameters
+    ----------
+    path : str
+        The path of the validated file.
+    listings : pd.DataFrame
+        The valid rows returned by `validate_listings`.
+    append : bool, optional
+        Whether to add the rows to an existing file (e.g. for later chunks of
+        the same CSV file). The default is to replace the file.
+    """
+    write_quarantine(staged_path(path), listings, append)
+
+def finish_validated(path):
+    """
+    Converts the rows written by `write_validated` to the Parquet validated file, for queries that scan it (see `data/query.py`).
+
+    The column types are detected once from all rows, so sparse columns such
+    as the forecast intervals get the type of their values. A Parquet file
+    stores these types and its columns separately, so the queries read the
+    types from its footer instead of sniffing a CSV file and only decode the
+    columns they select. The staged CSV file is removed afterwards.
+
+    Parameters
+    ----------
+    path : str
+        The path of the validated file.
+
+    Raises
+    ------
+    ImportError
+        If the `duckdb` package is not installed.
+    """
+    if duckdb is None:
+        raise ImportError("Writing the validated files requires the duckdb package")
+    staged = staged_path(path)
+    connection = duckdb.connect()
+    try:
+        connection.execute(f"COPY (SELECT * FROM read_csv_auto({literal(staged)}, header=true, sample_size=-1)) "
+                           f"TO {literal(path)} (FORMAT parquet)")
+    finally:
+        connection.close()
+    os.remove(staged)
+
+def validation_summary(city, report):
+    """
+    Formats the validation report of a city for the startup log.
+
+    Parameters
+    ----------
+    city : str
+        The city name.
+    report : dict
+        The validation report (see `validate_listings`).
+
+    Returns
+    -------
+    str
+        A line with the number of rows checked and rejected and the counts of
+        the broken rules, followed by lines with the neighbourhood names that
+        are not in the GeoJSON file and, if reported, the GeoJSON features
+        without listings ('unused_features').
+    """
+    broken = ', '.join(f"{rule}={count}" for rule, count in report['rules'].items() if count)
+    lines = [f"Rejected {report['rejected']} of {report['rows']} rows for {city}" + (f" ({broken})" if broken else '')]
+    if report.get('unmatched'):
+        lines.append(f"  Neighbourhoods not in the GeoJSON file: {', '.join(report['unmatched'])}")
+    if report.get('unused_features'):
+        lines.append(f"  GeoJSON features without listings: {', '.join(report['unused_features'])}")
+    return '\n'.join(lines)
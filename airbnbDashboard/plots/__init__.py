@@ -11,6 +11,15 @@ Imports:
 generate_map
     A function to generate the choropleth map based on the selected city and the aggregated statistics for each city.
 
+create_map_figure
+    A function to create the choropleth figure without wrapping it into a Dash component.
+
+create_choropleth
+    A function to create the choropleth figure from statistics filtered to a month or aggregated over a range.
+
+map_graph
+    A function to wrap a (possibly pre-serialized) map figure into the map's `dcc.Graph` component.
+
 generate_table
     A function to generate and customize the table that is embedded in the modal which pops up after clicking a neighborhood in the map.
 
@@ -29,6 +38,9 @@ update_scatter_plot
 create_date_slider
     A function to create a Dash slider using the dcc.slider component.
 
+create_date_range_slider
+    A function to create a Dash range slider for selecting a range of months.
+
 generate_date_marks
     A function to create a dictionary for the marks of the date slider.
 
@@ -47,7 +59,7 @@ To generate the table:
 
 To generate the scatter plot:
 >>> from plots import update_scatter_plot
->>> fig, title = update_scatter_plot(selected_city, selected_neighborhood, n_clicks_price, n_clicks_rating, listings_data)
+>>> fig, title = update_scatter_plot(selected_city, selected_neighborhood, n_clicks_price, n_clicks_rating, query_backend)
 
 To create a date slider:
 >>> from plots import create_date_slider
@@ -58,22 +70,26 @@ To generate date marks:
 >>> date_marks = generate_date_marks(unique_dates)
 
 The `__all__` list specifies the public API of the package, indicating that only
-`generate_map`, `generate_table`, `generate_sorted_table`, `get_sort_options`, `get_column_options`, `update_scatter_plot`, `create_date_slider`, `generate_date_marks`, and `get_unique_dates` should be accessible when the package is imported.
+`generate_map`, `create_map_figure`, `create_choropleth`, `map_graph`, `generate_table`, `generate_sorted_table`, `get_sort_options`, `get_column_options`, `update_scatter_plot`, `create_date_slider`, `create_date_range_slider`, `generate_date_marks`, and `get_unique_dates` should be accessible when the package is imported.
 """
 
-from airbnbDashboard.plots.generate_map import generate_map
+from airbnbDashboard.plots.generate_map import generate_map, create_map_figure, create_choropleth, map_graph
 from airbnbDashboard.plots.generate_table import generate_table, generate_sorted_table, get_sort_options, get_column_options
 from airbnbDashboard.plots.generate_scatter import update_scatter_plot
-from airbnbDashboard.plots.slider import get_unique_dates, generate_date_marks, create_date_slider
+from airbnbDashboard.plots.slider import get_unique_dates, generate_date_marks, create_date_slider, create_date_range_slider
 
 __all__ = [
     'generate_map', 
+    'create_map_figure', 
+    'create_choropleth', 
+    'map_graph', 
     'generate_table', 
     'generate_sorted_table', 
     'get_sort_options', 
     'get_column_options', 
     'update_scatter_plot', 
     'create_date_slider', 
+    'create_date_range_slider', 
     'generate_date_marks', 
     'get_unique_dates'
 ]
@@ -0,0 +1,81 @@
+import base64
+import struct
+import zlib
+import numpy as np
+
+from airbnbDashboard.data.paths import colors
+
+def encode_png(rgba):
+    """
+    Encodes an RGBA image as PNG with the standard library only.
+
+    Parameters
+    ----------
+    rgba : np.ndarray
+        The image of shape (height, width, 4) and dtype uint8.
+
+    Returns
+    -------
+    bytes
+        The PNG file.
+    """
+    height, width, _ = rgba.shape
+    # Every row starts with filter type 0 (None)
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)], axis=1).tobytes()
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw, 6)) + chunk(b'IEND', b'')
+
+def density_image(counts, scale):
+    """
+    Renders the listing counts of a tile as a transparent PNG data URI.
+
+    Bins are drawn in the primary colour with an opacity that grows with the
+    logarithm of the count relative to `scale`. Empty bins are transparent.
+
+    Parameters
+    ----------
+    counts : np.ndarray
+        The counts of a tile (see `airbnbDashboard.data.density.density_tile`).
+    scale : int
+        The count shown fully opaque.
+
+    Returns
+    -------
+    str or None
+        The data URI of the image, or None if the tile is empty.
+    """
+    if not counts.any():
+        return None
+    red, green, blue = (int(colors['primary'].lstrip('#')[i:i + 2], 16) for i in (0, 2, 4))
+    rgba = np.empty(counts.shape + (4,), dtype=np.uint8)
+    rgba[..., 0], rgba[..., 1], rgba[..., 2] = red, green, blue
+    rgba[..., 3] = np.where(counts > 0, 60 + 195 * np.log1p(counts) / np.log1p(max(scale, 1)), 0).clip(0, 255)
+    return 'data:image/png;base64,' + base64.b64encode(encode_png(rgba)).decode('ascii')
+
+def density_layer(image, coordinates):
+    """
+    Creates a map layer that shows a density image over a tile.
+
+    Parameters
+    ----------
+    image : str
+        The data URI of the image (see `density_image`).
+    coordinates : list
+        The [lon, lat] corners of the tile (see `airbnbDashboard.data.density.tile_coordinates`).
+
+    Returns
+    -------
+    dict
+        The layer for `layout.mapbox.layers`.
+    """
+    return {
+        'sourcetype': 'image',
+        'source': image,
+        'coordinates': coordinates,
+        'type': 'raster',
+        'opacity': 0.9,
+    }
@@ -3,13 +3,24 @@ from dash import dcc, html
 
 from airbnbDashboard.data.paths import colors, city_data
 
-def generate_map(selected_city, selected_month, neighborhoods_geojson, neighborhood_stats):
+# Statistics that can colour the map and their labels, in the order of the tooltip
+map_metrics = {
+    'avg_price': 'Average Price',
+    'median_price': 'Median Price',
+    'p90_price': '90th Percentile Price',
+    'avg_ratings': 'Average Ratings',
+    'name': 'Number of Listings', # name is declared in loader.py and counts the listings
+    'number_of_reviews': 'Average Number of Reviews',
+}
+
+def generate_map(selected_city, selected_month, neighborhoods_geojson, neighborhood_stats, metric='avg_price'):
     """
     Generates an interactive map visualization for a selected city and month using Plotly.
 
     This function creates a choropleth map of neighborhood average prices within a city, filtered by the selected month.
     The map is centered and zoomed based on predefined city data, and the color scale represents the average price in 
-    each neighborhood.
+    each neighborhood. The figure itself is built by `create_map_figure` and wrapped into a Dash component
+    by `map_graph`.
 
     Parameters
     ----------
@@ -26,6 +37,9 @@ def generate_map(selected_city, selected_month, neighborhoods_geojson, neighborh
         A dictionary containing DataFrames with neighborhood statistics (including 'avg_price' and 'avg_ratings'), 
         keyed by city name.
 
+    metric : str, optional
+        The statistic that colours the map, one of `map_metrics`. The default is 'avg_price'.
+
     Returns
     -------
     dcc.Graph or html.Div
@@ -37,45 +51,158 @@ def generate_map(selected_city, selected_month, neighborhoods_geojson, neighborh
     KeyError
         If the selected city is not found in the `neighborhoods_geojson` or `city_data` dictionaries.
     """
-    if selected_city not in neighborhoods_geojson:
+    fig = create_map_figure(selected_city, selected_month, neighborhoods_geojson, neighborhood_stats, metric)
+    if fig is None:
         return html.Div("Invalid city selected")
+    return map_graph(fig)
+
+def create_map_figure(selected_city, selected_month, neighborhoods_geojson, neighborhood_stats, metric='avg_price', color_ranges=None):
+    """
+    Creates the choropleth figure of neighborhood average prices for a selected city and month.
+
+    Parameters
+    ----------
+    selected_city : str
+        The name of the city for which to generate the map.
+    
+    selected_month : int
+        The month for which to filter neighborhood statistics.
+    
+    neighborhoods_geojson : dict
+        A dictionary containing GeoJSON data for neighborhoods, keyed by city name.
+    
+    neighborhood_stats : dict
+        A dictionary containing DataFrames with neighborhood statistics, keyed by city name.
+
+    metric : str, optional
+        The statistic that colours the map, one of `map_metrics`. The default is 'avg_price'.
+
+    color_ranges : dict, optional
+        The precomputed colour ranges of the city (see `get_color_ranges`). If not
+        given, they are computed from the statistics of the city.
+
+    Returns
+    -------
+    plotly.graph_objects.Figure or None
+        The choropleth figure, or None if the city is invalid.
+    """
+    if selected_city not in neighborhoods_geojson:
+        return None
     
-    neighborhoods_geojson_selected = neighborhoods_geojson[selected_city]
     neighborhood_stats_selected = neighborhood_stats[selected_city]
+    if color_ranges is None:
+        color_ranges = get_color_ranges(neighborhood_stats_selected)
     
     # Filter by the selected month
     neighborhood_stats_filtered = neighborhood_stats_selected[neighborhood_stats_selected['month'] == selected_month]
+    return create_choropleth(selected_city, neighborhood_stats_filtered, neighborhoods_geojson, metric, color_ranges)
+
+def get_color_ranges(neighborhood_stats_selected):
+    """
+    Computes the colour range of every map metric over all months of a city.
+
+    The ranges are computed once per city, so the colour scale stays the same
+    across months and switching the metric does not scan the statistics.
+
+    Parameters
+    ----------
+    neighborhood_stats_selected : pd.DataFrame
+        The neighborhood statistics of a city.
+
+    Returns
+    -------
+    dict
+        The [min, max] of each available metric, keyed by metric.
+    """
+    return {
+        metric: [float(neighborhood_stats_selected[metric].min()), float(neighborhood_stats_selected[metric].max())]
+        for metric in map_metrics if metric in neighborhood_stats_selected.columns
+    }
+
+def create_choropleth(selected_city, neighborhood_stats_filtered, neighborhoods_geojson, metric='avg_price', color_ranges=None):
+    """
+    Creates the choropleth figure from neighborhood statistics that are already
+    filtered to one month or aggregated over a range of months.
+
+    The values of all metrics are embedded in the trace's `customdata`, and the
+    metric order, labels and colour ranges in `layout.meta`. The map metric can
+    therefore be switched in the browser (see `METRIC_SWITCH_JS`) without
+    sending the figure and its geometry again.
+
+    With a 'feature_id' column (see `load_data`), the neighbourhoods are
+    located by the integer ids of the GeoJSON features, so plotly does not
+    match names on every render; neighbourhoods without a feature are left
+    out. The names are shown in the tooltip and returned as 'hovertext' in
+    the click data.
+
+    Parameters
+    ----------
+    selected_city : str
+        The name of the city for which to generate the map.
+
+    neighborhood_stats_filtered : pd.DataFrame
+        The statistics to show, one row per neighborhood, with the columns
+        'neighbourhood_cleansed', 'avg_price', 'avg_ratings' and 'name' and
+        optionally 'feature_id'.
+
+    neighborhoods_geojson : dict
+        A dictionary containing GeoJSON data for neighborhoods, keyed by city name.
+
+    metric : str, optional
+        The statistic that colours the map, one of `map_metrics`. The default is 'avg_price'.
+
+    color_ranges : dict, optional
+        The colour range of each metric (see `get_color_ranges`). The default is
+        None, which uses the range of the given statistics.
+
+    Returns
+    -------
+    plotly.graph_objects.Figure or None
+        The choropleth figure, or None if the city is invalid or the metric is not available.
+    """
+    if selected_city not in neighborhoods_geojson or metric not in neighborhood_stats_filtered.columns:
+        return None
+
+    neighborhoods_geojson_selected = neighborhoods_geojson[selected_city]
 
     # Use the city_data dictionary to get center and zoom level
     if selected_city in city_data:
         center = city_data[selected_city]["center"]
         zoom_level = city_data[selected_city]["zoom_level"]
     else:
-        return html.Div("Invalid city selected")
+        return None
+
+    metrics = [col for col in map_metrics if col in neighborhood_stats_filtered.columns]
+    if color_ranges is None:
+        color_ranges = get_color_ranges(neighborhood_stats_filtered)
+
+    if 'feature_id' in neighborhood_stats_filtered.columns:
+        neighborhood_stats_filtered = neighborhood_stats_filtered[neighborhood_stats_filtered['feature_id'] >= 0]
+        locations = {'locations': 'feature_id'}
+    else:
+        locations = {'locations': 'neighbourhood_cleansed', 'featureidkey': 'properties.neighbourhood'}
 
     fig = px.choropleth_mapbox(
         neighborhood_stats_filtered,
         geojson=neighborhoods_geojson_selected,
-        locations='neighbourhood_cleansed',
-        featureidkey="properties.neighbourhood",
-        color="avg_price",
+        **locations,
+        color=metric,
+        range_color=color_ranges[metric],
         mapbox_style="carto-positron",
         zoom=zoom_level,
         center=center,
         opacity=0.6,
         title=" ",
-        hover_data={ # tooltip
-            'neighbourhood_cleansed': True,
-            'avg_price': ':.2f', #display avg_price in tooltips
-            'avg_ratings': ':.2f', #displayavg_ratings in tooltip
-            'name': True, # name is declared in loader.py:72 and counts number of names in filtered data
-        },
-        labels={
-            'avg_price': 'Average Price',
-            'neighbourhood_cleansed': 'Neighborhood',
-            'avg_ratings': 'Average Ratings',
-            'name': 'Number of Listings', # rename name to Number of Listings, as it is the count of names
-        }
+    )
+
+    # Tooltip with all metrics, read from customdata so it does not depend on the coloured metric
+    fig.update_traces(
+        customdata=neighborhood_stats_filtered[metrics].to_numpy(),
+        hovertext=neighborhood_stats_filtered['neighbourhood_cleansed'].to_numpy(),
+        hovertemplate='<br>'.join(
+            ['Neighborhood=%{hovertext}'] +
+            [f"{map_metrics[col]}=%{{customdata[{i}]{'' if col == 'name' else ':.2f'}}}" for i, col in enumerate(metrics)]
+        ) + '<extra></extra>',
     )
 
     fig.update_layout(
@@ -86,9 +213,10 @@ def generate_map(selected_city, selected_month, neighborhoods_geojson, neighborh
             font_color="#7F7F7F"
         ),
         margin={"r": 0, "t": 0, "l": 0, "b": 0},
+        meta={'metric': metric, 'metrics': metrics, 'labels': map_metrics, 'color_ranges': color_ranges},
         coloraxis_colorbar=dict(
-            title="Average Price",
-            tickvals=[neighborhood_stats_filtered['avg_price'].min(), neighborhood_stats_filtered['avg_price'].max()],
+            title=map_metrics[metric],
+            tickvals=color_ranges[metric],
             ticktext=["Low", "High"],
             tickcolor="#7F7F7F",
             tickfont=dict(
@@ -107,8 +235,49 @@ def generate_map(selected_city, selected_month, neighborhoods_geojson, neighborh
         ),
     )
 
+    return fig
+
+# Recolours the map in the browser from the metric values embedded by `create_choropleth`
+METRIC_SWITCH_JS = """
+function(metric, figure) {
+    const noUpdate = window.dash_clientside.no_update;
+    if (!figure || !figure.layout || !figure.layout.meta) {
+        return noUpdate;
+    }
+    const meta = figure.layout.meta;
+    const index = meta.metrics.indexOf(metric);
+    if (index < 0 || meta.metric === metric) {
+        return noUpdate;
+    }
+    const trace = Object.assign({}, figure.data[0], {z: figure.data[0].customdata.map(row => row[index])});
+    const range = meta.color_ranges[metric];
+    const coloraxis = Object.assign({}, figure.layout.coloraxis, {cmin: range[0], cmax: range[1]});
+    coloraxis.colorbar = Object.assign({}, coloraxis.colorbar, {
+        title: Object.assign({}, coloraxis.colorbar.title, {text: meta.labels[metric]}),
+        tickvals: range
+    });
+    const layout = Object.assign({}, figure.layout, {coloraxis: coloraxis, meta: Object.assign({}, meta, {metric: metric})});
+    return Object.assign({}, figure, {data: [trace].concat(figure.data.slice(1)), layout: layout});
+}
+"""
+
+def map_graph(figure):
+    """
+    Wraps a map figure into the `dcc.Graph` component shown in the map container.
+
+    Parameters
+    ----------
+    figure : plotly.graph_objects.Figure, dict or orjson.Fragment
+        The map figure, either as figure object or already serialized
+        (see `airbnbDashboard.utils.serialization.pre_serialized`).
+
+    Returns
+    -------
+    dcc.Graph
+        A Dash `dcc.Graph` component containing the map.
+    """
     return dcc.Graph(
         id='map',
-        figure=fig,
+        figure=figure,
         style={'width': '100%', 'height': '750px', 'borderRadius': '10px', 'boxShadow': '0px 4px 10px #0000001A'}
     )
@@ -1,6 +1,8 @@
 import plotly.graph_objects as go  # Ensure this is at the top of generate_scatter.py
 import warnings
 
+from airbnbDashboard.data.forecast import neighbourhood_series
+
 # Suppress FutureWarning messages to avoid console clutter.
 # FutureWarning messages often inform about upcoming changes in future library versions.
 # They do not affect the current execution of the code, but we suppress them here
@@ -19,12 +21,16 @@ warnings.filterwarnings("ignore", category=FutureWarning)
 
 
 
-def update_scatter_plot(selected_city, selected_neighborhood, n_clicks_price, n_clicks_rating, listings_data):
+def update_scatter_plot(selected_city, selected_neighborhood, n_clicks_price, n_clicks_rating, query_backend, scatter_cube=None):
     """
     Generates a plotly figure (fig), based on the selected city and the neighbourhood
     that was selected in the map. With buttons the user can switch
     between a price over time graph and a rating over time graph.
 
+    If the scatter cube of the city is given, the series are read from it,
+    including the forecasts of `data/forecast.py`. Otherwise they are
+    aggregated by the query backend, with the forecasts of the CSV files.
+
     Parameters
     ----------
     selected_city : str
@@ -39,25 +45,31 @@ def update_scatter_plot(selected_city, selected_neighborhood, n_clicks_price, n_
     n_clicks_rating : int
         The number of times the rating button was clicked.
 
-    listings_data : dict
-        A dictionary containing the raw listing data for each city.
-        The key is the city name while the value is a DataFrame containing the
-        raw listing data.
+    query_backend : PandasBackend or DuckDBBackend
+        The query backend of the listings (see `data/query.py`).
+
+    scatter_cube : dict, optional
+        The forecast scatter cube of the selected city (see `data/forecast.py`).
     """
     # Check if the selected city is in the data
-    if selected_city not in listings_data:
+    if selected_city not in query_backend.cities():
         return go.Figure(), ""
 
-    # Filter for the selected city
-    listings_filtered = listings_data[selected_city][listings_data[selected_city]['neighbourhood_cleansed'] == selected_neighborhood]
+    if scatter_cube is not None:
+        series = neighbourhood_series(scatter_cube, selected_neighborhood)
+    else:
+        # Only the rows of the selected neighbourhood are aggregated
+        neighbourhood_filter = {'neighbourhood_cleansed': selected_neighborhood}
 
     # Either show the price or the rating over time, based on clicked button
     if n_clicks_rating > n_clicks_price:
-        ratings_filtered = listings_filtered[~((listings_filtered['date'].dt.year == 2024) & (listings_filtered['date'].dt.month.isin([10, 11])))]
-
-        listings_aggregated = ratings_filtered.groupby('date').agg(
-            mean_rating=('review_scores_rating', 'mean')
-        ).reset_index()
+        if scatter_cube is not None:
+            listings_aggregated = series.iloc[:scatter_cube['history']][['date', 'mean_rating']]
+        else:
+            # The forecast months have no ratings
+            listings_aggregated = query_backend.aggregate(selected_city, ['date'], {
+                'mean_rating': ('review_scores_rating', 'mean')
+            }, neighbourhood_filter).dropna(subset=['mean_rating'])
 
         fig = go.Figure()
 
@@ -108,12 +120,15 @@ def update_scatter_plot(selected_city, selected_neighborhood, n_clicks_price, n_
         return fig, "Rating Over Time"
 
     else:
-        # Group data in listings_aggregated and calculate mean price and confidence interval
-        listings_aggregated = listings_filtered.groupby('date').agg(
-            mean_price=('price', 'mean'),
-            conf_int_lower=('conf_int_lower', 'mean'),
-            conf_int_upper=('conf_int_upper', 'mean')
-        ).reset_index()
+        if scatter_cube is not None:
+            listings_aggregated = series[['date', 'mean_price', 'conf_int_lower', 'conf_int_upper']]
+        else:
+            # Group data in listings_aggregated and calculate mean price and confidence interval
+            listings_aggregated = query_backend.aggregate(selected_city, ['date'], {
+                'mean_price': ('price', 'mean'),
+                'conf_int_lower': ('conf_int_lower', 'mean'),
+                'conf_int_upper': ('conf_int_upper', 'mean')
+            }, neighbourhood_filter)
 
         fig = go.Figure()
 
@@ -1,7 +1,12 @@
+import calendar
+import numpy as np
+import pandas as pd
 import plotly.graph_objects as go
-from dash import dcc
+from dash import dcc, html
+import dash_bootstrap_components as dbc
 
 from airbnbDashboard.data.paths import colors, default_columns, column_display_names, additional_columns_list
+from airbnbDashboard.data.normalize import join_listings
 
 def generate_table(dataframe, width=1000, height=600):
     """
@@ -74,10 +79,14 @@ def generate_table(dataframe, width=1000, height=600):
 
     return dcc.Graph(figure=fig)
 
-def generate_sorted_table(listings_filtered, sort_by, selected_columns, n_clicks_asc, n_clicks_desc):
+def generate_sorted_table(listings_filtered, sort_by, selected_columns, n_clicks_asc, n_clicks_desc, listing_dim=None):
     """
     Processes the filtered listings, sorts the data, and generates a table.
 
+    Static attributes (e.g. name or host) that are not part of the filtered
+    monthly listings are joined from `listing_dim`, only for the displayed
+    and sorted columns.
+
     Parameters
     ----------
     listings_filtered : pd.DataFrame
@@ -90,6 +99,8 @@ def generate_sorted_table(listings_filtered, sort_by, selected_columns, n_clicks
         The number of times the ascending button was clicked.
     n_clicks_desc : int
         The number of times the descending button was clicked.
+    listing_dim : pd.DataFrame, optional
+        The static listing attributes of the city, indexed by listing id.
 
     Returns
     -------
@@ -110,18 +121,37 @@ def generate_sorted_table(listings_filtered, sort_by, selected_columns, n_clicks
     columns_to_display = list(dict.fromkeys(default_columns + selected_columns))
 
     order = 'asc' if n_clicks_asc > n_clicks_desc else 'desc'
+    listings_filtered = join_listings(listings_filtered, listing_dim, table_columns(sort_by, selected_columns))
     table_listings = listings_filtered.sort_values(by=sort_by, ascending=(order == 'asc'))
     table_listings = table_listings[columns_to_display]
     return generate_table(table_listings)
 
-def get_sort_options(listings_data, selected_city):
+def table_columns(sort_by, selected_columns):
+    """
+    Returns the columns that `generate_sorted_table` needs, for querying only those.
+
+    Parameters
+    ----------
+    sort_by : str
+        The variable/column to sort the data by, None for the rating.
+    selected_columns : list
+        A list of column names to display in the table, or None.
+
+    Returns
+    -------
+    list
+        The displayed columns followed by the sort column, without duplicates.
+    """
+    return list(dict.fromkeys(default_columns + (selected_columns or []) + [sort_by or 'review_scores_rating']))
+
+def get_sort_options(query_backend, selected_city):
     """
     Generates sorting options for the dropdown menu in the table figure.
 
     Parameters
     ----------
-    listings_data : dict
-        A dictionary containing the raw listing data for each city.
+    query_backend : PandasBackend or DuckDBBackend
+        The query backend of the listings (see `data/query.py`).
     selected_city : str
         The selected city from the dropdown.
 
@@ -135,20 +165,21 @@ def get_sort_options(listings_data, selected_city):
     KeyError
         If the selected city is not in the listings data.
     """
-    if selected_city in listings_data:
+    if selected_city in query_backend.cities():
         columns = ['price', 'review_scores_rating', 'name'] + additional_columns_list
-        available_columns = [col for col in columns if col in listings_data[selected_city].columns]
+        all_columns = get_available_columns(query_backend, selected_city)
+        available_columns = [col for col in columns if col in all_columns]
         return [{'label': column_display_names.get(col, col), 'value': col} for col in available_columns]
     return []
 
-def get_column_options(listings_data, selected_city):
+def get_column_options(query_backend, selected_city):
     """
     Generates column options for the dropdown menu in the table figure.
 
     Parameters
     ----------
-    listings_data : dict
-        A dictionary containing the raw listing data for each city.
+    query_backend : PandasBackend or DuckDBBackend
+        The query backend of the listings (see `data/query.py`).
     selected_city : str
         The selected city from the dropdown.
 
@@ -157,8 +188,100 @@ def get_column_options(listings_data, selected_city):
     list
         A list of column options for the dropdown menu.
     """
-    if selected_city in listings_data:
-        all_columns = listings_data[selected_city].columns
+    if selected_city in query_backend.cities():
+        all_columns = get_available_columns(query_backend, selected_city)
         additional_columns = [col for col in additional_columns_list if col in all_columns]
         return [{'label': column_display_names.get(col, col), 'value': col} for col in additional_columns]
     return []
+
+def get_available_columns(query_backend, selected_city):
+    """
+    Returns the columns available for a city, from its monthly listings and its listing attributes.
+
+    Parameters
+    ----------
+    query_backend : PandasBackend or DuckDBBackend
+        The query backend of the listings (see `data/query.py`).
+    selected_city : str
+        The selected city from the dropdown.
+
+    Returns
+    -------
+    list
+        The available column names.
+    """
+    return query_backend.columns(selected_city)
+
+def get_facet_options(counts):
+    """
+    Generates the options of the facet filters, labelled with the number of matching listings.
+
+    Parameters
+    ----------
+    counts : dict
+        The counts keyed by facet and option, as returned by
+        `airbnbDashboard.data.facets.facet_counts`.
+
+    Returns
+    -------
+    list
+        The options of the room type checklist.
+    list
+        The options of the minimum nights dropdown.
+    list
+        The options of the rating dropdown.
+    """
+    room_type_options = [{'label': f"{room_type} ({count})", 'value': room_type}
+                         for room_type, count in counts['room_type'].items()]
+    nights_options = [{'label': f"At most {band} night{'s' if band > 1 else ''} ({count})", 'value': band}
+                      for band, count in counts['minimum_nights'].items()]
+    rating_options = [{'label': f"{threshold}+ ({count})", 'value': threshold}
+                      for threshold, count in counts['rating'].items()]
+    return room_type_options, nights_options, rating_options
+
+def generate_search_results(results):
+    """
+    Generates the table of listings found by the search box.
+
+    Parameters
+    ----------
+    results : pd.DataFrame
+        The listings returned by `airbnbDashboard.data.search.search_listings`.
+
+    Returns
+    -------
+    dbc.Table or html.Div
+        A table with the id, name, host, latest neighbourhood and month of each
+        listing, or a message if nothing was found.
+    """
+    if results.empty:
+        return html.Div("No listings found", style={'textAlign': 'center', 'color': colors['text']})
+    return dbc.Table.from_dataframe(results.rename(columns=column_display_names), striped=True, hover=True, size='sm')
+
+def generate_host_portfolio(portfolio):
+    """
+    Generates the tables of the portfolio of a host.
+
+    Parameters
+    ----------
+    portfolio : dict
+        The portfolio returned by `airbnbDashboard.data.hosts.host_portfolio`.
+
+    Returns
+    -------
+    html.Div
+        A table with the number of listings, average price and reviews of the
+        host in each calendar month with listings, followed by a table of its
+        listings with their latest neighbourhood.
+    """
+    months = pd.DataFrame({
+        'Month': calendar.month_abbr[1:],
+        'Listings': portfolio['listing_counts'],
+        'Avg. Price': np.round(portfolio['avg_price'].astype(float), 2),
+        'Reviews': portfolio['reviews'].astype(np.int64),
+    })
+    listings = pd.DataFrame({'ID': portfolio['listing_ids'], 'Neighbourhood': portfolio['neighbourhoods']})
+    return html.Div([
+        dbc.Table.from_dataframe(months[months['Listings'] > 0], striped=True, hover=True, size='sm'),
+        dbc.Table.from_dataframe(listings, striped=True, hover=True, size='sm'),
+    ])
@@ -2,7 +2,9 @@ from dash import dcc
 import pandas as pd
 from datetime import datetime
 
-def get_unique_dates(city_paths):
+from airbnbDashboard.data.tracing import phase
+
+def get_unique_dates(city_paths, trace=None):
     """
     Iterates through all the cities and returns a sorted list of unique dates.
 
@@ -12,6 +14,8 @@ def get_unique_dates(city_paths):
         A dictionary containing the paths to the data for each city.
         The key is the city name, while the value is a dictionary containing the
         paths to the listings and calendar data for the city.
+    trace : StartupTrace, optional
+        If given, the scan of each city's CSV file is recorded in it (see `utils/tracing.py`).
 
     Returns:
     --------
@@ -25,8 +29,10 @@ def get_unique_dates(city_paths):
     """
     unique_dates = []
     for city, paths in city_paths.items():
-        listings = pd.read_csv(paths['listings'], encoding='utf-8', parse_dates=['date'], low_memory=False)  # utf-8 encoding for foreign alphabets
-        unique_dates.extend(listings['date'].unique())
+        with phase(trace, 'scan_dates', city=city):
+            # Only the dates are parsed, the listings themselves are loaded (or scanned by DuckDB) elsewhere
+            listings = pd.read_csv(paths['listings'], encoding='utf-8', usecols=['date'], parse_dates=['date'])  # utf-8 encoding for foreign alphabets
+            unique_dates.extend(listings['date'].unique())
     unique_dates = pd.to_datetime(unique_dates).drop_duplicates().sort_values()
     return unique_dates
 
@@ -94,3 +100,49 @@ def create_date_slider(date_marks):
         step=1,
         className='slider-style'
     )
+
+def create_date_range_slider(date_marks):
+    """
+    Create a Dash range slider using the dcc.RangeSlider component.
+    In range mode, the map shows the statistics aggregated over all
+    months between the two selected marks (inclusive).
+
+    Parameters
+    ----------
+    date_marks : dict
+        Dictionary containing the marks for the slider.
+        The key is the index of the mark, while the value is the date.
+    
+    Returns
+    -------
+    dcc.RangeSlider
+        A Dash range slider that allows the user to select a range of months.
+    """
+    last_index = len(date_marks) - 3  # The last two months in the data only contain 2 rows with the forecasts
+    return dcc.RangeSlider(
+        id='month-range-slider',
+        min=0,
+        max=last_index,
+        marks=date_marks,
+        value=[0, min(2, last_index)],
+        step=1,
+        allowCross=False,
+        className='slider-style'
+    )
+
+# Milliseconds a slider value has to stay unchanged before it is sent to the server
+slider_debounce_ms = 250
+
+# Copies a slider value to its selection store once no newer value followed within `slider_debounce_ms`,
+# so the server callbacks only run for the month the user settles on, not for every step in between
+SLIDER_DEBOUNCE_JS = """
+function(value) {
+    const key = window.dash_clientside.callback_context.triggered_id;
+    const pending = window.sliderDebounce = window.sliderDebounce || {};
+    const generation = (pending[key] || 0) + 1;
+    pending[key] = generation;
+    return new Promise(resolve => setTimeout(() => {
+        resolve(pending[key] === generation ? value : window.dash_clientside.no_update);
+    }, %d));
+}
+""" % slider_debounce_ms
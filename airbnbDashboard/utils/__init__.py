@@ -12,12 +12,45 @@ get_neighborhood_options
 filter_listings
     A function to filter listings data based on selected city, month, and neighborhood.
 
+build_city_indexes
+    A function to precompute the per-city dropdown options and lookup structures.
+
 initialize_app
     A function to initialize the Dash app with Bootstrap styling.
 
 load_and_prepare_data
     A function to load data and prepare necessary variables for the app.
 
+LRUCache
+    A thread-safe least-recently-used cache for rendered callback results.
+
+register_response_middleware
+    A function to add response compression and ETags to the Flask server.
+ExportJobs
+    A background pool of export jobs that write the table selection to CSV or Parquet files.
+register_export_routes
+    A function to add the export endpoints to the Flask server.
+register_api_routes
+    A function to add the cached read-only JSON API to the Flask server.
+RequestProfiles
+    A store of cProfile profiles of requests that were sampled or asked for one.
+register_profiling
+    A function to add the request profiling hooks and endpoints to the Flask server.
+memory_report
+    A function to report the memory used by the data, indexes and caches of each city.
+register_memory_routes
+    A function to add the memory report endpoint to the Flask server.
+register_month_routes
+    A function to add the endpoint that appends a new month of listings to the Flask server.
+StartupTrace
+    A recorder of the duration and peak memory of each startup phase per city.
+RequestGenerations
+    A tracker of the latest callback request per browser tab, which skips superseded requests.
+Prefetcher
+    A background runner that warms the callback caches with the likely next views while the server is idle.
+register_prefetching
+    A function to pause the prefetching while the Flask server serves requests.
+
 
 Usage:
 ------
@@ -27,11 +60,11 @@ To generate city options:
 
 To generate neighborhood options:
 >>> from utils import get_neighborhood_options
->>> neighborhood_options = get_neighborhood_options(listings_data, selected_city)
+>>> neighborhood_options = get_neighborhood_options(query_backend, selected_city)
 
 To filter listings data:
 >>> from utils import filter_listings
->>> filtered_data = filter_listings(listings_data, selected_city, selected_month, selected_neighborhood)
+>>> filtered_data = filter_listings(query_backend, selected_city, selected_month, selected_neighborhood)
 
 To initialize the Dash app:
 >>> from utils import initialize_app
@@ -39,16 +72,42 @@ To initialize the Dash app:
 
 To load and prepare data:
 >>> from utils import load_and_prepare_data
->>> neighborhoods_geojson, neighborhood_stats, listings_data, city_options, date_marks = load_and_prepare_data()
+>>> (neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims, city_options, date_marks, city_indexes,
+...  neighborhood_totals, query_backend) = load_and_prepare_data()
 """
 
-from airbnbDashboard.utils.helpers import get_city_options, get_neighborhood_options, filter_listings
+from airbnbDashboard.utils.helpers import get_city_options, get_neighborhood_options, filter_listings, build_city_indexes
 from airbnbDashboard.utils.app_initializer import initialize_app, load_and_prepare_data
+from airbnbDashboard.utils.cache import LRUCache
+from airbnbDashboard.utils.middleware import register_response_middleware
+from airbnbDashboard.utils.export import ExportJobs, register_export_routes
+from airbnbDashboard.utils.api import register_api_routes
+from airbnbDashboard.utils.profiling import RequestProfiles, register_profiling
+from airbnbDashboard.utils.memory import memory_report, register_memory_routes
+from airbnbDashboard.utils.months import register_month_routes
+from airbnbDashboard.utils.tracing import StartupTrace
+from airbnbDashboard.utils.generations import RequestGenerations
+from airbnbDashboard.utils.prefetch import Prefetcher, register_prefetching
 
 __all__ = [
     'get_city_options', 
     'get_neighborhood_options', 
     'filter_listings',
+    'build_city_indexes',
     'initialize_app',
-    'load_and_prepare_data'
+    'load_and_prepare_data',
+    'LRUCache',
+    'register_response_middleware',
+    'ExportJobs',
+    'register_export_routes',
+    'register_api_routes',
+    'RequestProfiles',
+    'register_profiling',
+    'memory_report',
+    'register_memory_routes',
+    'register_month_routes',
+    'StartupTrace',
+    'RequestGenerations',
+    'Prefetcher',
+    'register_prefetching'
 ]
@@ -0,0 +1,44 @@
+"""
+Access to the admin routes.
+
+The routes that change the loaded data or expose the internals of the server
+are only registered when an admin token is configured (`admin_token` in
+`data/paths.py`), and answer 403 to requests that do not send it in the
+`X-Admin-Token` header.
+"""
+import hmac
+from flask import jsonify, request
+
+# Header with the admin token
+admin_header = 'X-Admin-Token'
+
+def is_admin(admin_token):
+    """
+    Checks whether the current request sends the admin token.
+
+    Parameters
+    ----------
+    admin_token : str or None
+        The configured token. Without one, no request is an admin request.
+
+    Returns
+    -------
+    bool
+        Whether the `admin_header` of the request equals the token.
+    """
+    given = request.headers.get(admin_header)
+    if not admin_token or given is None:
+        return False
+    # Compared in constant time, so the token cannot be guessed from response times
+    return hmac.compare_digest(given.encode('utf8'), admin_token.encode('utf8'))
+
+def forbidden():
+    """
+    Returns the response to a request without the admin token.
+
+    Returns
+    -------
+    tuple
+        A JSON error and the status 403.
+    """
+    return jsonify(error=f"This route requires the admin token in the {admin_header} header"), 403
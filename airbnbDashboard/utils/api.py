@@ -0,0 +1,310 @@
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from flask import Response, jsonify, request
+
+from airbnbDashboard.data.aggregates import range_stats
+from airbnbDashboard.data.forecast import neighbourhood_series
+from airbnbDashboard.data.incremental import city_snapshot
+from airbnbDashboard.data.normalize import join_listings
+from airbnbDashboard.data.paths import default_columns
+from airbnbDashboard.utils.cache import LRUCache
+from airbnbDashboard.utils.export import export_positions
+from airbnbDashboard.utils.middleware import choose_encoding, compress
+from airbnbDashboard.utils.serialization import to_json
+
+# Prefix of all API routes, increased when a response format changes incompatibly
+api_prefix = '/api/v1'
+
+# Default and maximum number of listings per page
+default_page_size = 100
+max_page_size = 1000
+
+class ResponseCache:
+    """
+    Keeps the serialized API responses and their compressed variants.
+
+    Every response is identified by a key that includes the data version of
+    the city it is built from (with the fingerprint of its files, so the
+    versions of different starts differ), so its ETag is known before the
+    response is built: a client that polls with `If-None-Match` is answered with `304 Not
+    Modified` from the key alone, and the body of any other request is built,
+    serialized and compressed once per data version. Entries of older data
+    versions are never requested again and age out of the cache.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The maximum number of cached responses. The default is 1024.
+    min_size : int, optional
+        The minimum body size in bytes for compression. The default is 1024.
+    compress_level : int, optional
+        The gzip compression level. The default is 6.
+
+    Usage
+    -----
+    >>> response_cache = ResponseCache()
+    >>> response_cache.respond(('cities', 3), lambda: [{'name': 'Madrid, Spain'}])
+    """
+
+    def __init__(self, maxsize=1024, min_size=1024, compress_level=6):
+        self.min_size = min_size
+        self.compress_level = compress_level
+        self._bodies = LRUCache(maxsize=maxsize, name='api_responses')
+        self._lock = threading.Lock()
+
+    def respond(self, key, build):
+        """
+        Returns the JSON response of a key, built by `build` on the first request.
+
+        Parameters
+        ----------
+        key : tuple
+            The endpoint, the data version and the parameters of the response.
+        build : callable
+            Returns the response data; called without arguments.
+
+        Returns
+        -------
+        flask.Response
+            The response, compressed if the client accepts it, or a 304 response.
+        """
+        etag = hashlib.sha1(repr((api_prefix,) + tuple(key)).encode('utf8')).hexdigest()
+        entry = self._bodies.get(key)
+        # The size, and with it the encoding, is only known once the body was built
+        encoding = choose_encoding(request.accept_encodings)
+        if entry is not None and len(entry['identity']) < self.min_size:
+            encoding = None
+
+        if entry is None and encoding is not None and request.if_none_match.contains(f'{etag}-{encoding}'):
+            return self._not_modified(f'{etag}-{encoding}')
+        if entry is None:
+            entry = {'identity': to_json(build()).encode('utf8')}
+            self._bodies.set(key, entry)
+            if len(entry['identity']) < self.min_size:
+                encoding = None
+
+        tag = f'{etag}-{encoding}' if encoding else etag
+        if request.if_none_match.contains(tag):
+            return self._not_modified(tag)
+        if encoding is not None and encoding not in entry:
+            with self._lock:
+                entry[encoding] = compress(entry['identity'], encoding, self.compress_level)
+
+        response = Response(entry[encoding or 'identity'], mimetype='application/json')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(tag)
+        # Clients may keep the response but have to revalidate it, which costs a 304 at most
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    def _not_modified(self, tag):
+        response = Response(status=304)
+        response.vary.add('Accept-Encoding')
+        response.set_etag(tag)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+def frame_records(frame):
+    """
+    Converts a DataFrame to a list of row dictionaries for a JSON response.
+
+    Parameters
+    ----------
+    frame : pd.DataFrame
+        The rows.
+
+    Returns
+    -------
+    list
+        One dictionary per row. Missing values are None and dates ISO strings.
+    """
+    frame = frame.copy()
+    for col in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[col]):
+            frame[col] = frame[col].dt.strftime('%Y-%m-%d')
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+def page_arguments(args):
+    """
+    Reads the pagination parameters of a request.
+
+    Parameters
+    ----------
+    args : werkzeug.datastructures.MultiDict
+        The query parameters.
+
+    Returns
+    -------
+    tuple
+        The offset and the page size, limited to `max_page_size`.
+
+    Raises
+    ------
+    ValueError
+        If a parameter is not a non-negative number.
+    """
+    offset = args.get('offset', 0, type=int)
+    limit = args.get('limit', default_page_size, type=int)
+    if offset is None or limit is None or offset < 0 or limit < 1:
+        raise ValueError("offset must be >= 0 and limit >= 1")
+    return offset, min(limit, max_page_size)
+
+def register_api_routes(server, neighborhood_stats, listings_data, listing_dims, date_marks, city_indexes,
+                        response_cache=None):
+    """
+    Registers the read-only JSON API on the Flask server.
+
+    All routes are under `api_prefix` and answer GET requests from the
+    structures built at startup (the statistics, the prefix sums, the scatter
+    cubes and the facet indexes), so no request groups the listings. The
+    responses are cached per data version by a `ResponseCache`; a month added
+    by `append_month` or files that changed between two starts change the
+    version and with it the ETags.
+
+    - `/cities`: the cities with their data version and neighbourhoods.
+    - `/date-marks`: the months of the date slider by slider index.
+    - `/cities/<city>/stats`: the neighbourhood statistics of the map, for a
+      calendar month ('month', 1-12, the default is all months) or for a
+      range of slider indexes ('start' and 'end', inclusive).
+    - `/cities/<city>/neighbourhoods/<path:neighbourhood>/series`: the monthly mean
+      price and rating of a neighbourhood, followed by the forecasts.
+    - `/cities/<city>/listings`: the listings of a 'month' (1-12) and
+      'neighbourhood' in table order ('sort', 'order'), with the default
+      columns and any extra 'column' (repeated), paginated by 'offset' and
+      'limit'.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The Flask server of the Dash app (`app.server`).
+    neighborhood_stats, listings_data, listing_dims : dict
+        The data returned by `load_data`.
+    date_marks : dict
+        Dictionary containing the marks for the slider.
+    city_indexes : dict
+        The result of `build_city_indexes`.
+    response_cache : ResponseCache, optional
+        The cache of the responses. The default is a new cache.
+
+    Returns
+    -------
+    flask.Flask
+        The server with the routes registered.
+    """
+    response_cache = response_cache or ResponseCache()
+    # Sorted listing positions keyed by (city, version, month, neighbourhood, sort, order), shared by the pages
+    position_cache = LRUCache(maxsize=256, name='api_positions')
+
+    def data_version(city, indexes=None):
+        # The number of appended months restarts at 0, the fingerprint tells the data of different starts apart
+        indexes = city_indexes.get(city, {}) if indexes is None else indexes
+        return f"{indexes.get('fingerprint', '')}-{indexes.get('version', 0)}"
+
+    def global_version():
+        return len(date_marks), tuple(data_version(city) for city in city_indexes)
+
+    def unknown_city(city):
+        return jsonify(error=f"Unknown city: {city}"), 404
+
+    @server.route(f'{api_prefix}/cities')
+    def api_cities():
+        def build():
+            return [{
+                'name': city,
+                'version': data_version(city),
+                'neighbourhoods': [option['value'] for option in indexes['metadata']['neighborhood_options']],
+            } for city, indexes in city_indexes.items()]
+        return response_cache.respond(('cities', global_version()), build)
+
+    @server.route(f'{api_prefix}/date-marks')
+    def api_date_marks():
+        return response_cache.respond(('date-marks', global_version()),
+                                      lambda: {str(index): date_marks[index] for index in sorted(date_marks)})
+
+    @server.route(f'{api_prefix}/cities/<city>/stats')
+    def api_stats(city):
+        if city not in neighborhood_stats:
+            return unknown_city(city)
+        args = request.args
+        month, start, end = args.get('month', type=int), args.get('start', type=int), args.get('end', type=int)
+        if start is not None or end is not None:
+            start = start if start is not None else end
+            end = end if end is not None else start
+            if not (0 <= start < len(date_marks) and 0 <= end < len(date_marks)):
+                return jsonify(error=f"start and end must be slider indexes from 0 to {len(date_marks) - 1}"), 400
+            if 'prefix_sums' not in city_indexes.get(city, {}):
+                return jsonify(error=f"No month ranges for {city}"), 400
+
+            def build():
+                stats = range_stats(city_indexes[city]['prefix_sums'], start, end)
+                return {'start': date_marks[min(start, end)], 'end': date_marks[max(start, end)], 'stats': frame_records(stats)}
+            return response_cache.respond(('stats', city, data_version(city), 'range', start, end), build)
+
+        def build():
+            stats = neighborhood_stats[city]
+            if month is not None:
+                stats = stats[stats['month'] == month]
+            return {'month': month, 'stats': frame_records(stats.drop(columns='feature_id', errors='ignore'))}
+        return response_cache.respond(('stats', city, data_version(city), month), build)
+
+    @server.route(f'{api_prefix}/cities/<city>/neighbourhoods/<path:neighbourhood>/series')
+    def api_series(city, neighbourhood):
+        if city not in city_indexes or 'scatter' not in city_indexes[city]:
+            return unknown_city(city)
+
+        scatter_cube = city_indexes[city]['scatter']
+        row = np.searchsorted(scatter_cube['neighbourhoods'], neighbourhood)
+        if row >= len(scatter_cube['neighbourhoods']) or scatter_cube['neighbourhoods'][row] != neighbourhood:
+            return jsonify(error=f"Unknown neighbourhood for {city}: {neighbourhood}"), 404
+
+        def build():
+            series = neighbourhood_series(scatter_cube, neighbourhood)
+            series.insert(1, 'forecast', np.arange(len(series)) >= scatter_cube['history'])
+            return {'neighbourhood': neighbourhood, 'model': scatter_cube['best_model'][row], 'series': frame_records(series)}
+        return response_cache.respond(('series', city, data_version(city), neighbourhood), build)
+
+    @server.route(f'{api_prefix}/cities/<city>/listings')
+    def api_listings(city):
+        if city not in listings_data:
+            return unknown_city(city)
+        args = request.args
+        month, neighbourhood = args.get('month', type=int), args.get('neighbourhood')
+        if month is None or neighbourhood is None:
+            return jsonify(error="month and neighbourhood are required"), 400
+        sort_by, ascending = args.get('sort') or 'review_scores_rating', args.get('order', 'desc') == 'asc'
+        columns = list(dict.fromkeys(default_columns + args.getlist('column')))
+        try:
+            offset, limit = page_arguments(args)
+        except ValueError as error:
+            return jsonify(error=error.args[0]), 400
+        listings, listing_dim, indexes = city_snapshot(city, listings_data, listing_dims, city_indexes)
+        known = set(listings.columns) | set(listing_dim.columns if listing_dim is not None else [])
+        unknown = [col for col in columns + [sort_by] if col not in known]
+        if unknown:
+            return jsonify(error=f"Unknown columns for {city}: {unknown}"), 400
+
+        version = data_version(city, indexes)
+        selection = (city, version, month, neighbourhood, sort_by, ascending)
+
+        def build():
+            positions = position_cache.get(selection)
+            if positions is None:
+                positions = export_positions(listings, listing_dim, indexes.get('facets'), month,
+                                             neighbourhood, sort_by, ascending)
+                position_cache.set(selection, positions)
+            page = listings.iloc[positions[offset:offset + limit]]
+            next_offset = offset + limit if offset + limit < len(positions) else None
+            return {
+                'total': len(positions),
+                'offset': offset,
+                'limit': limit,
+                'next_offset': next_offset,
+                'listings': frame_records(join_listings(page, listing_dim, columns)[columns]),
+            }
+        return response_cache.respond(('listings',) + selection + (tuple(columns), offset, limit), build)
+
+    return server
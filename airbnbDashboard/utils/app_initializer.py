@@ -3,12 +3,21 @@ from dash import Dash
 import dash_bootstrap_components as dbc
 
 from airbnbDashboard.data.loader import load_data
-from airbnbDashboard.data.paths import city_paths
-from airbnbDashboard.utils.helpers import get_city_options
+from airbnbDashboard.data.paths import city_paths, delta_dir, quarantine_dir, validated_dir, query_engine
+from airbnbDashboard.data.incremental import replay_deltas, read_deltas
+from airbnbDashboard.data.query import create_query_backend
+from airbnbDashboard.data.validation import validated_path
+from airbnbDashboard.utils.helpers import get_city_options, build_city_indexes
 from airbnbDashboard.plots.slider import get_unique_dates, generate_date_marks
+from airbnbDashboard.utils.serialization import configure_json_engine
+from airbnbDashboard.utils.middleware import register_response_middleware
+from airbnbDashboard.data.tracing import phase
 
 def initialize_app():
     """Initialize the Dash app."""
+    # Encode the layout and all callback responses with the fastest JSON engine
+    configure_json_engine()
+
     assets_folder = os.path.join(os.path.dirname(__file__), '..', 'assets')
     app = Dash(
         __name__,
@@ -16,18 +25,52 @@ def initialize_app():
         suppress_callback_exceptions=True,
         assets_folder=assets_folder
     )
+
+    # Compress responses and answer unchanged GET requests with 304 Not Modified
+    register_response_middleware(app.server)
     return app
 
-def load_and_prepare_data():
-    """Load data and prepare necessary variables for the app."""
-    # Load data
-    neighborhoods_geojson, neighborhood_stats, listings_data = load_data(city_paths)
+def load_and_prepare_data(trace=None):
+    """
+    Load data and prepare necessary variables for the app, recording the phases in `trace` if given.
+
+    The listing queries go to the backend named by `query_engine` in
+    `data/paths.py`, which is returned last.
+    """
+    # The months in the delta files are only added to the loaded DataFrames, not to the files DuckDB scans
+    if query_engine == 'duckdb' and any(read_deltas(delta_dir, city) for city in city_paths):
+        raise ValueError(f"The DuckDB query backend cannot include the months in {delta_dir}, use the pandas backend")
+
+    # Load data, streaming the CSV files in chunks so the unused columns are never held in memory
+    # The sums and counts behind the statistics are kept, so new months can be merged into them
+    # Rows rejected by the validation are kept in the quarantine directory for inspection
+    # For DuckDB, the valid rows are written to the validated directory instead of being kept in memory
+    neighborhood_totals = {}
+    with phase(trace, 'load_data'):
+        neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims = load_data(
+            city_paths, chunksize=100000, neighborhood_totals=neighborhood_totals, quarantine_dir=quarantine_dir,
+            validated_dir=validated_dir if query_engine == 'duckdb' else None, trace=trace)
+
+    with phase(trace, 'query_backend'):
+        validated_paths = {city: {'listings': validated_path(validated_dir, city)} for city in neighborhood_stats}
+        query_backend = create_query_backend(query_engine, listings_data, listing_dims, validated_paths)
 
     # Get city options for the dropdown
     city_options = get_city_options(city_paths)
 
     # Get unique dates for the date slider
-    unique_dates = get_unique_dates(city_paths)
-    date_marks = generate_date_marks(unique_dates)
+    with phase(trace, 'date_marks'):
+        unique_dates = get_unique_dates(city_paths, trace)
+        date_marks = generate_date_marks(unique_dates)
+
+    # Precompute the per-city structures used by the callbacks
+    with phase(trace, 'build_city_indexes'):
+        city_indexes = build_city_indexes(listings_data, listing_dims, date_marks, neighborhood_stats, query_backend, trace,
+                                          city_paths)
+
+    # Add the months appended since the CSV files were generated
+    with phase(trace, 'replay_deltas'):
+        replay_deltas(delta_dir, neighborhood_stats, listings_data, listing_dims, date_marks, city_indexes, neighborhood_totals)
 
-    return neighborhoods_geojson, neighborhood_stats, listings_data, city_options, date_marks
\ No newline at end of file
+    return (neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims, city_options, date_marks, city_indexes,
+            neighborhood_totals, query_backend)
@@ -0,0 +1,115 @@
+from collections import OrderedDict
+import threading
+import weakref
+
+# Caches created with a name, by name, for the memory report (see utils/memory.py)
+named_caches = weakref.WeakValueDictionary()
+
+class LRUCache:
+    """
+    A small thread-safe least-recently-used cache for rendered callback results.
+
+    Dash serves callbacks from several worker threads, so every access is guarded
+    by a lock. Once `maxsize` entries are stored, the entry that was used least
+    recently is dropped. The hits, misses and evictions are counted.
+
+    Parameters
+    ----------
+    maxsize : int, optional
+        The maximum number of entries kept in the cache. The default is 128.
+    name : str, optional
+        If given, the cache is listed under this name in `named_caches`, so
+        its size and counters appear in the memory report.
+
+    Usage
+    -----
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache.set(('Madrid, Spain', 1), 'figure')
+    >>> cache.get(('Madrid, Spain', 1))
+    'figure'
+    """
+
+    def __init__(self, maxsize=128, name=None):
+        self.maxsize = maxsize
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if name is not None:
+            named_caches[name] = self
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for `key` and marks it as recently used.
+
+        Parameters
+        ----------
+        key : hashable
+            The key of the cached value.
+        default : object, optional
+            The value returned if `key` is not cached. The default is None.
+
+        Returns
+        -------
+        object
+            The cached value or `default`.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        """
+        Stores `value` under `key`, evicting the least recently used entry if the cache is full.
+
+        Parameters
+        ----------
+        key : hashable
+            The key of the value.
+        value : object
+            The value to cache.
+        """
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        with self._lock:
+            self._entries.clear()
+
+    def values(self):
+        """Returns a list of the cached values, least recently used first."""
+        with self._lock:
+            return list(self._entries.values())
+
+    def stats(self):
+        """
+        Returns the counters of the cache.
+
+        Returns
+        -------
+        dict
+            The number of 'entries', the 'maxsize' and the number of 'hits',
+            'misses' and 'evictions' since the cache was created.
+        """
+        with self._lock:
+            return {'entries': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
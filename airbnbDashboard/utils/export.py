@@ -0,0 +1,515 @@
+import atexit
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from flask import Response, jsonify, request
+
+from airbnbDashboard.data.facets import filter_positions
+from airbnbDashboard.data.incremental import city_snapshot
+from airbnbDashboard.data.normalize import join_listings
+from airbnbDashboard.data.paths import default_columns
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Number of rows converted and written at once
+export_chunksize = 50000
+
+# Size of the blocks in which finished files are sent to the client
+download_block_size = 64 * 1024
+
+# Export formats: Key = format, Value = (mimetype, file extension)
+export_formats = {
+    'csv': ('text/csv', '.csv'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+
+def available_formats():
+    """
+    Returns the export formats that can be written in this environment.
+
+    Returns
+    -------
+    list
+        'csv', and 'parquet' if the `pyarrow` package is installed.
+    """
+    return [export_format for export_format in export_formats if export_format != 'parquet' or pyarrow is not None]
+
+def export_positions(listings, listing_dim, facet_index, selected_month, selected_neighborhood, sort_by=None, ascending=False,
+                     selections=None, price_range=(None, None)):
+    """
+    Returns the row positions of the modal table selection, in table order.
+
+    Only the positions and the sort column of the selected rows are held in
+    memory; the rows themselves are read chunk by chunk by `export_chunks`.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        The monthly listings of the city.
+    listing_dim : pd.DataFrame or None
+        The static listing attributes of the city.
+    facet_index : dict or None
+        The facet index of the city (see `airbnbDashboard.data.facets`). If
+        None, the listings are scanned for the month and neighbourhood.
+    selected_month : int
+        The selected month.
+    selected_neighborhood : str
+        The selected neighbourhood.
+    sort_by : str, optional
+        The column to sort by. The default is the rating, like the table.
+    ascending : bool, optional
+        Whether the lowest values come first. The default is False, like the table.
+    selections : dict, optional
+        The selected facet options (see `airbnbDashboard.data.facets.facet_masks`).
+    price_range : tuple, optional
+        The minimum and maximum price. The default is no price filter.
+
+    Returns
+    -------
+    np.ndarray
+        The positions of the selected rows in `listings`, sorted by `sort_by`.
+    """
+    if facet_index is not None:
+        positions = filter_positions(facet_index, selected_month, selected_neighborhood, selections, price_range)
+    else:
+        positions = np.flatnonzero(((listings['month'] == selected_month)
+                                    & (listings['neighbourhood_cleansed'] == selected_neighborhood)).to_numpy())
+
+    sort_by = sort_by or 'review_scores_rating'
+    selected = listings.iloc[positions][['id'] + ([sort_by] if sort_by in listings.columns else [])]
+    values = join_listings(selected, listing_dim, [sort_by])[sort_by].reset_index(drop=True)
+    order = values.sort_values(ascending=ascending, kind='stable', na_position='last').index.to_numpy()
+    return positions[order]
+
+def export_chunks(listings, listing_dim, positions, columns, chunksize=export_chunksize):
+    """
+    Yields the selected rows and columns in chunks.
+
+    Parameters
+    ----------
+    listings : pd.DataFrame
+        The monthly listings of the city.
+    listing_dim : pd.DataFrame or None
+        The static listing attributes of the city, joined for the requested columns.
+    positions : np.ndarray
+        The positions of the rows to export (see `export_positions`).
+    columns : list
+        The columns to export.
+    chunksize : int, optional
+        The number of rows per chunk. The default is `export_chunksize`.
+
+    Yields
+    ------
+    pd.DataFrame
+        The next rows, with the requested columns.
+    """
+    for start in range(0, len(positions), chunksize):
+        chunk = listings.iloc[positions[start:start + chunksize]]
+        yield join_listings(chunk, listing_dim, columns)[columns]
+
+def write_csv(path, chunks, progress=None):
+    """
+    Writes chunks of rows to a CSV file, one chunk at a time.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file.
+    chunks : iterable of pd.DataFrame
+        The rows (see `export_chunks`).
+    progress : callable, optional
+        Called with the number of rows of each written chunk.
+    """
+    with open(path, 'w', encoding='utf-8', newline='') as file:
+        for number, chunk in enumerate(chunks):
+            chunk.to_csv(file, header=number == 0, index=False)
+            if progress is not None:
+                progress(len(chunk))
+
+def write_parquet(path, chunks, progress=None):
+    """
+    Writes chunks of rows to a Parquet file, one row group per chunk.
+
+    Parameters
+    ----------
+    path : str
+        The path of the file.
+    chunks : iterable of pd.DataFrame
+        The rows (see `export_chunks`).
+    progress : callable, optional
+        Called with the number of rows of each written chunk.
+
+    Raises
+    ------
+    ImportError
+        If the `pyarrow` package is not installed.
+    """
+    if pyarrow is None:
+        raise ImportError("Parquet exports require the pyarrow package")
+    writer = None
+    try:
+        for chunk in chunks:
+            if writer is None:
+                # Text columns that are empty in the first chunk would otherwise get the null type
+                schema = pyarrow.Schema.from_pandas(chunk, preserve_index=False)
+                schema = pyarrow.schema([field.with_type(pyarrow.string()) if pyarrow.types.is_null(field.type) else field
+                                         for field in schema])
+                writer = pyarrow.parquet.ParquetWriter(path, schema)
+            writer.write_table(pyarrow.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            if progress is not None:
+                progress(len(chunk))
+    finally:
+        if writer is not None:
+            writer.close()
+
+# Writer of each export format
+export_writers = {
+    'csv': write_csv,
+    'parquet': write_parquet,
+}
+
+class ExportJobs:
+    """
+    Runs exports as background jobs and keeps their files until they are evicted.
+
+    The jobs run in a small thread pool of their own, so large exports do not
+    occupy the threads that serve the interactive callbacks, and write their
+    rows chunk by chunk, so they hold at most one chunk in memory. Their
+    progress is the number of rows written so far.
+
+    Parameters
+    ----------
+    export_dir : str, optional
+        The directory of the export files. The jobs are only kept in memory,
+        so the export files of earlier runs are removed from it. The default
+        is a new temporary directory, which is removed at exit.
+    max_workers : int, optional
+        The number of exports that run at the same time. The default is 1.
+    max_jobs : int, optional
+        The number of jobs kept. Once exceeded, the oldest finished jobs and
+        their files are removed. The default is 16.
+
+    Usage
+    -----
+    >>> export_jobs = ExportJobs()
+    >>> job_id = export_jobs.submit(listings, listing_dim, positions, ['id', 'price'], 'csv', 'listings')
+    >>> export_jobs.status(job_id)['status']
+    'running'
+    """
+
+    def __init__(self, export_dir=None, max_workers=1, max_jobs=16):
+        if export_dir is None:
+            export_dir = tempfile.mkdtemp(prefix='airbnb-exports-')
+            atexit.register(shutil.rmtree, export_dir, ignore_errors=True)
+        os.makedirs(export_dir, exist_ok=True)
+        extensions = tuple(extension for _, extension in export_formats.values())
+        for file_name in os.listdir(export_dir):
+            if file_name.endswith(extensions):
+                os.remove(os.path.join(export_dir, file_name))
+        self.export_dir = export_dir
+        self.max_jobs = max_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='export')
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, listings, listing_dim, positions, columns, export_format='csv', file_name='listings'):
+        """
+        Starts an export job.
+
+        Parameters
+        ----------
+        listings, listing_dim, positions, columns
+            The rows to export (see `export_chunks`).
+        export_format : str, optional
+            One of `available_formats()`. The default is 'csv'.
+        file_name : str, optional
+            The name of the downloaded file, without extension.
+
+        Returns
+        -------
+        str
+            The id of the job.
+
+        Raises
+        ------
+        ValueError
+            If the format is not available.
+        """
+        if export_format not in available_formats():
+            raise ValueError(f"Unknown or unavailable export format: {export_format}")
+        mimetype, extension = export_formats[export_format]
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'status': 'queued',
+            'format': export_format,
+            'rows': 0,
+            'total': len(positions),
+            'file_name': file_name + extension,
+            'mimetype': mimetype,
+            'error': None,
+            'path': os.path.join(self.export_dir, job_id + extension),
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._evict()
+        self._executor.submit(self._run, job, export_chunks(listings, listing_dim, positions, columns))
+        return job_id
+
+    def reject(self, error, export_format='csv', file_name='listings'):
+        """
+        Records an export that could not be started as a failed job.
+
+        The job is reported like one that failed while it ran, so the caller
+        shows its error where it would show the progress.
+
+        Parameters
+        ----------
+        error : str
+            The reason the export was rejected.
+        export_format : str, optional
+            The requested format. The default is 'csv'.
+        file_name : str, optional
+            The name of the downloaded file, without extension.
+
+        Returns
+        -------
+        str
+            The id of the job.
+        """
+        mimetype, extension = export_formats.get(export_format, (None, ''))
+        job_id = uuid.uuid4().hex
+        job = {
+            'id': job_id,
+            'status': 'failed',
+            'format': export_format,
+            'rows': 0,
+            'total': 0,
+            'file_name': file_name + extension,
+            'mimetype': mimetype,
+            'error': error,
+            'path': os.path.join(self.export_dir, job_id + extension),
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+            self._evict()
+        return job_id
+
+    def status(self, job_id):
+        """
+        Returns the state of a job.
+
+        Parameters
+        ----------
+        job_id : str
+            The id of the job.
+
+        Returns
+        -------
+        dict or None
+            The 'id', 'status' ('queued', 'running', 'done' or 'failed'),
+            'format', 'rows' written, 'total' rows, 'file_name' and 'error' of
+            the job, or None if the job is unknown.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {key: value for key, value in job.items() if key not in ('path', 'mimetype')}
+
+    def download(self, job_id):
+        """
+        Returns the file of a finished job.
+
+        Parameters
+        ----------
+        job_id : str
+            The id of the job.
+
+        Returns
+        -------
+        tuple or None
+            The path, mimetype and file name, or None if the job is unknown or not done.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['status'] != 'done':
+                return None
+            return job['path'], job['mimetype'], job['file_name']
+
+    def _run(self, job, chunks):
+        def progress(n_rows):
+            with self._lock:
+                job['rows'] += n_rows
+
+        with self._lock:
+            job['status'] = 'running'
+        try:
+            export_writers[job['format']](job['path'], chunks, progress)
+        except Exception as error:
+            with self._lock:
+                job['status'], job['error'] = 'failed', str(error)
+            return
+        with self._lock:
+            job['status'] = 'done'
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in ('done', 'failed')]
+        while len(self._jobs) > self.max_jobs and finished:
+            job = self._jobs.pop(finished.pop(0))
+            if os.path.exists(job['path']):
+                os.remove(job['path'])
+
+def start_export(export_jobs, listings_data, listing_dims, city_indexes, selected_city, selected_month, selected_neighborhood,
+                 sort_by=None, ascending=False, selected_columns=None, selections=None, price_range=(None, None),
+                 export_format='csv'):
+    """
+    Starts the export of the modal table selection: the default columns and
+    the additional columns of the rows that match the filters, in table order.
+
+    Parameters
+    ----------
+    export_jobs : ExportJobs
+        The job runner.
+    listings_data, listing_dims, city_indexes : dict
+        The data of all cities.
+    selected_city : str
+        The selected city.
+    selected_month : int
+        The selected month.
+    selected_neighborhood : str
+        The selected neighbourhood.
+    sort_by, ascending, selections, price_range
+        The order and filters of the table (see `export_positions`).
+    selected_columns : list, optional
+        The additional columns of the table.
+    export_format : str, optional
+        One of `available_formats()`. The default is 'csv'.
+
+    Returns
+    -------
+    str
+        The id of the job. If a column is unknown or the format is not
+        available, the job is failed at once with the reason as its error
+        (see `ExportJobs.reject`).
+
+    Raises
+    ------
+    KeyError
+        If the city is unknown.
+    """
+    listings, listing_dim, indexes = city_snapshot(selected_city, listings_data, listing_dims, city_indexes)
+    file_name = re.sub(r'\W+', '_', f'listings {selected_city} {selected_month:02d} {selected_neighborhood}').strip('_')
+    columns = list(dict.fromkeys(default_columns + list(selected_columns or [])))
+    known = set(listings.columns) | set(listing_dim.columns if listing_dim is not None else [])
+    unknown = [col for col in columns + ([sort_by] if sort_by else []) if col not in known]
+    if unknown:
+        return export_jobs.reject(f"Unknown columns for {selected_city}: {unknown}", export_format, file_name)
+    if export_format not in available_formats():
+        return export_jobs.reject(f"Unknown or unavailable export format: {export_format}", export_format, file_name)
+
+    positions = export_positions(listings, listing_dim, indexes.get('facets'), selected_month,
+                                 selected_neighborhood, sort_by, ascending, selections, price_range)
+    return export_jobs.submit(listings, listing_dim, positions, columns, export_format, file_name)
+
+def read_blocks(file, block_size=download_block_size):
+    """
+    Yields an open file in blocks, for a streamed response, and closes it at the end.
+
+    The caller opens the file before the response starts, so a file that is
+    removed meanwhile (e.g. when its job is evicted) is still read to the end.
+
+    Parameters
+    ----------
+    file : file-like
+        The file, opened in binary mode.
+    block_size : int, optional
+        The size of the blocks in bytes.
+
+    Yields
+    ------
+    bytes
+        The next block of the file.
+    """
+    with file:
+        while True:
+            block = file.read(block_size)
+            if not block:
+                return
+            yield block
+
+def register_export_routes(server, export_jobs, listings_data, listing_dims, city_indexes):
+    """
+    Registers the export endpoints on the Flask server.
+
+    - `/export` (POST) starts an export with the form or query parameters
+      'city', 'month' (1-12), 'neighbourhood', 'sort', 'order' ('asc' or
+      'desc'), 'column' (repeated for each additional column) and 'format'
+      ('csv' or 'parquet'), and answers 202 with the job state, or 400 with
+      the state of the failed job if a column or the format is unknown.
+    - `/export/<job_id>` returns the job state, including the progress.
+    - `/export/<job_id>/download` streams the file of a finished job.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The Flask server of the Dash app (`app.server`).
+    export_jobs : ExportJobs
+        The job runner, shared with the export button of the modal.
+    listings_data, listing_dims, city_indexes : dict
+        The data of all cities.
+
+    Returns
+    -------
+    flask.Flask
+        The server with the routes registered.
+    """
+    @server.route('/export', methods=['POST'])
+    def start_export_route():
+        args = request.values
+        city = args.get('city')
+        if city not in listings_data:
+            return jsonify(error=f"Unknown city: {city}"), 404
+        job_id = start_export(export_jobs, listings_data, listing_dims, city_indexes, city, args.get('month', 1, type=int),
+                              args.get('neighbourhood'), args.get('sort'), args.get('order', 'desc') == 'asc',
+                              args.getlist('column'), export_format=args.get('format', 'csv'))
+        status = export_jobs.status(job_id)
+        if status['status'] == 'failed':
+            return jsonify(status), 400
+        return jsonify(status), 202, {'Location': f'/export/{job_id}'}
+
+    @server.route('/export/<job_id>')
+    def export_status_route(job_id):
+        status = export_jobs.status(job_id)
+        if status is None:
+            return jsonify(error=f"Unknown export: {job_id}"), 404
+        return jsonify(status)
+
+    @server.route('/export/<job_id>/download')
+    def export_download_route(job_id):
+        download = export_jobs.download(job_id)
+        if download is None:
+            return jsonify(error=f"Export {job_id} is unknown or not finished"), 404
+        path, mimetype, file_name = download
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            return jsonify(error=f"Export {job_id} is unknown or not finished"), 404
+        response = Response(read_blocks(file), mimetype=mimetype,
+                            headers={'Content-Disposition': f'attachment; filename="{file_name}"',
+                                     'Content-Length': str(os.fstat(file.fileno()).st_size)})
+        # Closes the file if the response is not read to the end
+        response.call_on_close(file.close)
+        return response
+
+    return server
@@ -0,0 +1,128 @@
+import itertools
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from dash.exceptions import PreventUpdate
+from flask import has_request_context, request
+
+# Request headers set by `assets/request_generations.js` on every callback request of a browser tab
+tab_header = 'X-Dash-Tab'
+sequence_header = 'X-Dash-Request'
+
+class RequestGenerations:
+    """
+    Tracks the latest request of each callback per browser tab, so work for
+    superseded inputs can be skipped.
+
+    Every callback request of a tab carries the id of the tab and a sequence
+    number that grows with every request the tab sends. A callback calls
+    `begin` once it knows it has work to do, which makes its request the
+    latest generation of that callback in that tab, and calls `check` between
+    the expensive steps, e.g. before building and before serializing a figure.
+    Once a newer request of the same callback from the same tab has begun,
+    `check` raises `PreventUpdate`: the stale request returns at once with
+    an empty response instead of finishing a result the browser would replace.
+
+    Requests without the headers (e.g. from the benchmarks or other clients)
+    are never skipped.
+
+    Parameters
+    ----------
+    max_keys : int, optional
+        The number of (tab, callback) pairs tracked. Once exceeded, the pairs
+        that were not used for the longest time are forgotten. The default is 10000.
+
+    Usage
+    -----
+    >>> request_generations = RequestGenerations()
+    >>> request_generations.begin('table')
+    >>> listings_filtered = filter_facets(...)
+    >>> request_generations.check()
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self.started = 0
+        self.skipped = 0
+        self._latest = OrderedDict()
+        self._lock = threading.Lock()
+        self._current = ContextVar('request_generation', default=None)
+        # Sequence numbers of requests without one, so they still order after the requests before them
+        self._counter = itertools.count(1)
+
+    def begin(self, name, cancellable=True):
+        """
+        Registers the current request as the latest generation of a callback.
+
+        Parameters
+        ----------
+        name : str
+            The name of the callback, e.g. 'city_view'.
+        cancellable : bool, optional
+            Whether the request may be skipped by a newer one. A request that
+            is not cancellable still supersedes the older requests, e.g. a city
+            change whose dropdown options must not be lost. The default is True.
+
+        Raises
+        ------
+        PreventUpdate
+            If the request is cancellable and a newer request of the callback
+            from the same tab has already begun, e.g. after overtaking it.
+        """
+        self._current.set(None)
+        tab = request.headers.get(tab_header) if has_request_context() else None
+        if not tab:
+            return
+        sequence = request.headers.get(sequence_header, type=int)
+        key = (tab, name)
+        with self._lock:
+            if sequence is None:
+                sequence = next(self._counter)
+            latest = self._latest.get(key, 0)
+            self._latest[key] = max(latest, sequence)
+            self._latest.move_to_end(key)
+            while len(self._latest) > self.max_keys:
+                self._latest.popitem(last=False)
+            self.started += 1
+        if cancellable:
+            self._current.set((key, sequence))
+            if latest > sequence:
+                self._skip()
+
+    def check(self):
+        """
+        Stops the current request if a newer request of its callback has begun.
+
+        Does nothing outside a request registered with `begin`.
+
+        Raises
+        ------
+        PreventUpdate
+            If the request is stale.
+        """
+        token = self._current.get()
+        if token is None:
+            return
+        key, sequence = token
+        with self._lock:
+            stale = self._latest.get(key, 0) > sequence
+        if stale:
+            self._skip()
+
+    def stats(self):
+        """
+        Returns the counters of the tracked requests.
+
+        Returns
+        -------
+        dict
+            The number of 'started' and 'skipped' requests and of 'tracked' (tab, callback) pairs.
+        """
+        with self._lock:
+            return {'started': self.started, 'skipped': self.skipped, 'tracked': len(self._latest)}
+
+    def _skip(self):
+        with self._lock:
+            self.skipped += 1
+        self._current.set(None)
+        raise PreventUpdate
@@ -1,5 +1,18 @@
 import pandas as pd
 
+from airbnbDashboard.plots.generate_table import get_sort_options, get_column_options
+from airbnbDashboard.plots.generate_map import get_color_ranges
+from airbnbDashboard.data.aggregates import build_prefix_sums
+from airbnbDashboard.data.facets import build_facet_index
+from airbnbDashboard.data.search import build_search_index
+from airbnbDashboard.data.hosts import build_host_index
+from airbnbDashboard.data.density import build_density_points
+from airbnbDashboard.data.forecast import build_scatter_cube, forecast_cities
+from airbnbDashboard.data.query import PandasBackend
+from airbnbDashboard.data.loader import data_fingerprint
+from airbnbDashboard.data.neighbourhoods import stats_feature_index
+from airbnbDashboard.data.tracing import phase
+
 def get_city_options(city_paths):
     """
     Generates options for the city dropdown.
@@ -16,14 +29,14 @@ def get_city_options(city_paths):
     """
     return [{'label': city, 'value': city} for city in city_paths.keys()]
 
-def get_neighborhood_options(listings_data, selected_city):
+def get_neighborhood_options(query_backend, selected_city):
     """
-    Generates unique neighborhood options for the dropdown menu.
+    Generates unique neighborhood options for the dropdown menu, sorted by name.
 
     Parameters
     ----------
-    listings_data : dict
-        A dictionary containing the raw listing data for each city.
+    query_backend : PandasBackend or DuckDBBackend
+        The query backend of the listings (see `data/query.py`).
     selected_city : str
         The selected city from the dropdown.
 
@@ -37,25 +50,36 @@ def get_neighborhood_options(listings_data, selected_city):
     KeyError
         If the selected city is not in the listings data.
     """
-    if selected_city in listings_data:
-        neighborhoods = listings_data[selected_city]['neighbourhood_cleansed'].unique()
+    if selected_city in query_backend.cities():
+        neighborhoods = query_backend.distinct(selected_city, 'neighbourhood_cleansed')
         return [{'label': neighborhood, 'value': neighborhood} for neighborhood in neighborhoods]
     return []
 
-def filter_listings(listings_data, selected_city, selected_month, selected_neighborhood):
+def filter_listings(query_backend, selected_city, selected_month, selected_neighborhood, selections=None, price_range=(None, None),
+                    columns=None):
     """
     Filters listings based on the selected city, month, and neighborhood.
 
+    The facets of the modal table are applied as filters of the query
+    backend, with the same meaning as in `data/facets.py`, so the result
+    matches `filter_facets` for backends without a facet index.
+
     Parameters
     ----------
-    listings_data : dict
-        A dictionary containing the raw listing data for each city.
+    query_backend : PandasBackend or DuckDBBackend
+        The query backend of the listings (see `data/query.py`).
     selected_city : str
         The selected city from the dropdown.
     selected_month : int
         The selected month from the slider.
     selected_neighborhood : str
         The selected neighborhood from the dropdown.
+    selections : dict, optional
+        The selected facet options (see `facet_masks` in `data/facets.py`).
+    price_range : tuple, optional
+        The minimum and maximum price. The default is no price filter.
+    columns : list, optional
+        The columns to return. The default is all monthly columns.
 
     Returns
     -------
@@ -67,7 +91,105 @@ def filter_listings(listings_data, selected_city, selected_month, selected_neigh
     KeyError
         If the selected city is not in the listings data.
     """
-    return listings_data[selected_city][
-        (listings_data[selected_city]['month'] == selected_month) &
-        (listings_data[selected_city]['neighbourhood_cleansed'] == selected_neighborhood)
-    ]
+    filters = {'month': selected_month, 'neighbourhood_cleansed': selected_neighborhood}
+    selections = selections or {}
+    if selections.get('room_type'):
+        filters['room_type'] = list(selections['room_type'])
+    if selections.get('rating') is not None:
+        filters['review_scores_rating'] = slice(selections['rating'], None)
+    if selections.get('minimum_nights') is not None:
+        filters['minimum_nights'] = slice(None, selections['minimum_nights'])
+    if price_range != (None, None):
+        filters['price'] = slice(*price_range)
+    return query_backend.slice(selected_city, filters, columns)
+
+def build_city_indexes(listings_data, listing_dims=None, date_marks=None, neighborhood_stats=None, query_backend=None,
+                       trace=None, city_paths=None):
+    """
+    Precomputes the per-city structures that only depend on the selected city,
+    so that a city change can be answered with dictionary lookups instead of
+    scanning the listings data in every callback.
+
+    The price forecasts of all cities are computed here as well, in a process
+    pool across cities (see `data/forecast.py`).
+
+    Parameters
+    ----------
+    listings_data : dict
+        A dictionary containing the raw listing data for each city.
+    listing_dims : dict, optional
+        A dictionary containing the static listing attributes for each city.
+    date_marks : dict, optional
+        Dictionary containing the marks for the slider. If given, the prefix
+        sums for month ranges and the density points are built as well.
+    neighborhood_stats : dict, optional
+        Dictionary containing the aggregated statistics for each city. If
+        given, the map colour ranges and feature index are computed as well.
+    query_backend : PandasBackend or DuckDBBackend, optional
+        The query backend for the dropdown options. The default queries
+        `listings_data`. Cities of the backend that are not in `listings_data`
+        (all of them for the DuckDB backend, see `load_data`) only get the
+        options, colour ranges and feature index; their tables and scatter
+        plots are answered by the backend.
+    trace : StartupTrace, optional
+        If given, the building of each structure is recorded in it per city
+        (see `utils/tracing.py`).
+    city_paths : dict, optional
+        The paths of the files of each city. If given, their fingerprint is
+        stored under 'fingerprint' (see `data_fingerprint`), which tells the
+        data of different starts apart.
+
+    Returns
+    -------
+    dict
+        A dictionary keyed by city name. Each value is a dictionary that holds
+        the dropdown options under 'metadata' ('sort_options', 'column_options'
+        and 'neighborhood_options'), the facet index of the modal table
+        under 'facets' (see `data/facets.py`), the search index of the
+        listing names and hosts under 'search' (see `data/search.py`), the
+        host portfolios under 'hosts' (see `data/hosts.py`), the cumulative neighbourhood
+        sums under 'prefix_sums' (see `data/aggregates.py`), the projected
+        listing coordinates under 'density' (see `data/density.py`), the colour
+        range of each map metric under 'color_ranges', the GeoJSON feature of each
+        neighbourhood under 'feature_index' (see `data/neighbourhoods.py`) and the neighbourhood series
+        and forecasts of the scatter plot under 'scatter' (see `data/forecast.py`).
+    """
+    query_backend = query_backend or PandasBackend(listings_data, listing_dims)
+    city_indexes = {}
+    for city in query_backend.cities():
+        listing_dim = (listing_dims or {}).get(city)
+        with phase(trace, 'metadata', city=city):
+            city_indexes[city] = {
+                'metadata': {
+                    'sort_options': get_sort_options(query_backend, city),
+                    'column_options': get_column_options(query_backend, city),
+                    'neighborhood_options': get_neighborhood_options(query_backend, city),
+                },
+            }
+        if city_paths is not None and city in city_paths:
+            city_indexes[city]['fingerprint'] = data_fingerprint(city_paths[city])
+        if neighborhood_stats is not None and city in neighborhood_stats:
+            city_indexes[city]['color_ranges'] = get_color_ranges(neighborhood_stats[city])
+            if 'feature_id' in neighborhood_stats[city].columns:
+                city_indexes[city]['feature_index'] = stats_feature_index(neighborhood_stats[city])
+        if city not in listings_data:
+            continue
+        with phase(trace, 'facets', city=city):
+            city_indexes[city]['facets'] = build_facet_index(listings_data[city], listing_dim)
+        with phase(trace, 'search', city=city):
+            city_indexes[city]['search'] = build_search_index(listings_data[city], listing_dim)
+        with phase(trace, 'hosts', city=city):
+            city_indexes[city]['hosts'] = build_host_index(listings_data[city], listing_dim)
+        if date_marks is not None:
+            with phase(trace, 'prefix_sums', city=city):
+                city_indexes[city]['prefix_sums'] = build_prefix_sums(listings_data[city], date_marks)
+            with phase(trace, 'density', city=city):
+                city_indexes[city]['density'] = build_density_points(listings_data[city], listing_dim, date_marks)
+
+    with phase(trace, 'scatter_cubes'):
+        scatter_cubes = {city: build_scatter_cube(listings_data[city]) for city in listings_data}
+    with phase(trace, 'forecasts'):
+        scatter_cubes = forecast_cities(scatter_cubes)
+    for city, scatter_cube in scatter_cubes.items():
+        city_indexes[city]['scatter'] = scatter_cube
+    return city_indexes
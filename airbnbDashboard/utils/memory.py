@@ -0,0 +1,263 @@
+"""
+Memory accounting of the loaded data, the per-city indexes and the caches.
+
+Run as a command to report the footprint of the data loaded at startup:
+
+>>> python -m airbnbDashboard.utils.memory [--json]
+
+The caches only fill while the app serves requests, so their sizes and
+counters are reported by the `/admin/memory` endpoint of the running app.
+"""
+import argparse
+import json
+import os
+import sys
+import numpy as np
+import pandas as pd
+from flask import jsonify
+
+from airbnbDashboard.utils.cache import named_caches
+
+def deep_size(obj, seen=None):
+    """
+    Estimates the memory used by an object and everything it refers to.
+
+    DataFrames, Series and indexes are measured by pandas (including the
+    Python strings of object columns), NumPy arrays by their buffer, and
+    containers by their own size plus that of their items. An object or array
+    buffer that was already counted, e.g. one shared by two indexes, is not
+    counted again.
+
+    Parameters
+    ----------
+    obj : object
+        The object to measure.
+    seen : set, optional
+        The ids of the objects and buffers counted so far. Pass the same set
+        to several calls to count shared objects only once.
+
+    Returns
+    -------
+    int
+        The size in bytes.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True, index=True).sum())
+    if isinstance(obj, (pd.Series, pd.Index)):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, np.ndarray):
+        # Views share the buffer of the array they were taken from, which is counted once
+        base = obj
+        while isinstance(base.base, np.ndarray):
+            base = base.base
+        size = 0
+        if base is obj or id(base) not in seen:
+            seen.add(id(base))
+            size = base.nbytes
+        if obj.dtype == object:
+            size += sum(deep_size(item, seen) for item in obj.ravel())
+        return size
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_size(key, seen) + deep_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_size(item, seen) for item in obj)
+    return size
+
+def column_sizes(frame):
+    """
+    Returns the memory used by each column of a DataFrame.
+
+    Parameters
+    ----------
+    frame : pd.DataFrame
+        The frame.
+
+    Returns
+    -------
+    dict
+        The size in bytes of each column and of the 'index', largest first.
+    """
+    sizes = frame.memory_usage(deep=True, index=True).astype(int)
+    sizes = sizes.rename({'Index': 'index'}).sort_values(ascending=False)
+    return {str(col): int(size) for col, size in sizes.items()}
+
+def process_rss():
+    """
+    Returns the resident set size of the process.
+
+    Returns
+    -------
+    int or None
+        The size in bytes, or None where /proc is not available.
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def cache_report(caches=None):
+    """
+    Reports the size and counters of caches.
+
+    Parameters
+    ----------
+    caches : dict, optional
+        The caches (`LRUCache`) by name. The default is all named caches.
+
+    Returns
+    -------
+    dict
+        For each cache, the counters of `LRUCache.stats` with the 'hit_rate'
+        and the size of the cached values in 'bytes'.
+    """
+    caches = dict(named_caches) if caches is None else caches
+    report = {}
+    for name, cache in sorted(caches.items()):
+        stats = cache.stats()
+        requests = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / requests, 4) if requests else None
+        stats['bytes'] = deep_size(cache.values())
+        report[name] = stats
+    return report
+
+def memory_report(neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims, city_indexes, caches=None):
+    """
+    Reports the memory used by the data of each city and by the caches.
+
+    Objects shared between the structures are counted once, under the first
+    structure in the order of the report.
+
+    Parameters
+    ----------
+    neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims : dict
+        The data returned by `load_data`.
+    city_indexes : dict
+        The result of `build_city_indexes`.
+    caches : dict, optional
+        The caches by name (see `cache_report`). The default is all named caches.
+
+    Returns
+    -------
+    dict
+        'rss' (the resident set size of the process, if known), 'total' (the
+        bytes counted), 'cities' and 'caches'. Each city has the 'total' and,
+        for 'listings_data' and 'listing_dims' if they are in memory, the
+        'bytes', 'rows' and the bytes of each column under 'columns', the bytes of
+        'neighborhood_stats' and 'geojson', and the bytes of each index under
+        'indexes' (largest first, as are the columns).
+    """
+    seen = set()
+    cities = {}
+    # The cities of the DuckDB backend have statistics and indexes, but no listings in memory
+    for city in neighborhood_stats:
+        city_report = {}
+        for name, frames in (('listings_data', listings_data), ('listing_dims', listing_dims)):
+            frame = frames.get(city)
+            if frame is not None:
+                city_report[name] = {'bytes': deep_size(frame, seen), 'rows': len(frame), 'columns': column_sizes(frame)}
+        city_report['neighborhood_stats'] = deep_size(neighborhood_stats.get(city), seen)
+        city_report['geojson'] = deep_size(neighborhoods_geojson.get(city), seen)
+        indexes = {name: deep_size(index, seen) for name, index in city_indexes.get(city, {}).items()}
+        city_report['indexes'] = dict(sorted(indexes.items(), key=lambda item: -item[1]))
+        city_report['total'] = (sum(city_report[name]['bytes'] for name in ('listings_data', 'listing_dims') if name in city_report)
+                                + city_report['neighborhood_stats'] + city_report['geojson'] + sum(indexes.values()))
+        cities[city] = city_report
+
+    caches = cache_report(caches)
+    return {
+        'rss': process_rss(),
+        'total': sum(city_report['total'] for city_report in cities.values()) + sum(cache['bytes'] for cache in caches.values()),
+        'cities': cities,
+        'caches': caches,
+    }
+
+def format_memory_report(report, top_columns=5):
+    """
+    Formats a memory report as text, in megabytes.
+
+    Parameters
+    ----------
+    report : dict
+        The result of `memory_report`.
+    top_columns : int, optional
+        The number of the largest columns listed per frame. The default is 5.
+
+    Returns
+    -------
+    str
+        The report.
+    """
+    def mb(size):
+        return f"{size / 2 ** 20:9.2f} MB"
+
+    lines = [f"Counted   {mb(report['total'])}"]
+    if report['rss'] is not None:
+        lines.append(f"RSS       {mb(report['rss'])}")
+    for city, city_report in report['cities'].items():
+        lines.append(f"\n{city}: {mb(city_report['total'])}")
+        for name in ('listings_data', 'listing_dims'):
+            if name in city_report:
+                frame_report = city_report[name]
+                lines.append(f"  {name:<28}{mb(frame_report['bytes'])}  ({frame_report['rows']} rows)")
+                columns = sorted(frame_report['columns'].items(), key=lambda item: -item[1])
+                for col, size in columns[:top_columns]:
+                    lines.append(f"    {col:<26}{mb(size)}")
+        lines.append(f"  {'neighborhood_stats':<28}{mb(city_report['neighborhood_stats'])}")
+        lines.append(f"  {'geojson':<28}{mb(city_report['geojson'])}")
+        for name, size in sorted(city_report['indexes'].items(), key=lambda item: -item[1]):
+            lines.append(f"  {'index ' + name:<28}{mb(size)}")
+    if report['caches']:
+        lines.append("\nCaches:")
+        for name, cache in report['caches'].items():
+            hit_rate = f"{cache['hit_rate']:.1%}" if cache['hit_rate'] is not None else '-'
+            lines.append(f"  {name:<16}{mb(cache['bytes'])}  {cache['entries']}/{cache['maxsize']} entries, "
+                         f"{cache['hits']} hits, {cache['misses']} misses, {cache['evictions']} evictions, hit rate {hit_rate}")
+    return '\n'.join(lines)
+
+def register_memory_routes(server, neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims, city_indexes):
+    """
+    Registers the `/admin/memory` endpoint, which returns the `memory_report` as JSON.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The Flask server of the Dash app (`app.server`).
+    neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims, city_indexes : dict
+        The data of all cities.
+
+    Returns
+    -------
+    flask.Flask
+        The server with the route registered.
+    """
+    @server.route('/admin/memory')
+    def admin_memory():
+        return jsonify(memory_report(neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims, city_indexes))
+
+    return server
+
+def main(argv=None):
+    """Loads the data like the app and prints its memory report."""
+    parser = argparse.ArgumentParser(description="Report the memory used by the data of the dashboard.")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    # Imported here, so the module can be used by the app without loading the data twice
+    from airbnbDashboard.data.paths import repo_url, local_dir
+    from airbnbDashboard.data.repo_manager import setup_repo
+    from airbnbDashboard.utils.app_initializer import load_and_prepare_data
+    setup_repo(repo_url, local_dir)
+    (neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims, _, _, city_indexes,
+     _, _) = load_and_prepare_data()
+    report = memory_report(neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims, city_indexes)
+    print(json.dumps(report, indent=2) if args.json else format_memory_report(report))
+
+if __name__ == '__main__':
+    main()
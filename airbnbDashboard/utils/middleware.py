@@ -0,0 +1,144 @@
+import gzip
+import hashlib
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Text based responses that are worth compressing
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/geo+json',
+    'application/javascript',
+    'text/javascript',
+    'text/css',
+    'text/csv',
+    'text/html',
+    'text/plain',
+    'image/svg+xml',
+}
+
+def register_response_middleware(server, min_size=1024, compress_level=6):
+    """
+    Registers a Flask `after_request` hook that compresses responses and adds strong ETags.
+
+    - Responses of a compressible type larger than `min_size` bytes are compressed
+      with brotli (if the `brotli` package is installed and accepted by the client)
+      or gzip.
+    - GET and HEAD responses, such as the layout with the initial map figure, the
+      assets and the JSON endpoints, are deterministic for a given data set. They
+      get a strong ETag (one per content encoding) and are answered with
+      `304 Not Modified` if the client already holds that version.
+    - Callback responses are POST requests that the Dash renderer does not send
+      conditionally, so they are only compressed.
+    - Streamed responses (e.g. generators) are passed through unchanged.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The Flask server of the Dash app (`app.server`).
+    min_size : int, optional
+        The minimum body size in bytes for compression. The default is 1024.
+    compress_level : int, optional
+        The gzip compression level (brotli quality is derived from it). The default is 6.
+
+    Returns
+    -------
+    flask.Flask
+        The server with the hook registered.
+    """
+    @server.after_request
+    def compress_and_tag_response(response):
+        return process_response(response, min_size, compress_level)
+
+    return server
+
+def choose_encoding(accept_encodings):
+    """
+    Chooses the best supported content encoding accepted by the client.
+
+    Parameters
+    ----------
+    accept_encodings : werkzeug.datastructures.Accept
+        The parsed `Accept-Encoding` header of the request.
+
+    Returns
+    -------
+    str or None
+        'br', 'gzip' or None if the client accepts neither.
+    """
+    if brotli is not None and accept_encodings['br']:
+        return 'br'
+    if accept_encodings['gzip']:
+        return 'gzip'
+    return None
+
+def compress(data, encoding, compress_level=6):
+    """
+    Compresses a response body with the given content encoding.
+
+    Parameters
+    ----------
+    data : bytes
+        The uncompressed body.
+    encoding : str
+        Either 'br' or 'gzip'.
+    compress_level : int, optional
+        The gzip compression level. The default is 6.
+
+    Returns
+    -------
+    bytes
+        The compressed body. The same body always gives the same bytes, as
+        required by the strong ETags of the encoded variants.
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=min(compress_level, 11))
+    # Without mtime=0, gzip writes the current time into the header
+    return gzip.compress(data, compresslevel=compress_level, mtime=0)
+
+def process_response(response, min_size=1024, compress_level=6):
+    """
+    Adds an ETag to and compresses a single response. See `register_response_middleware`.
+
+    Parameters
+    ----------
+    response : flask.Response
+        The response produced by the view function.
+    min_size : int, optional
+        The minimum body size in bytes for compression. The default is 1024.
+    compress_level : int, optional
+        The gzip compression level. The default is 6.
+
+    Returns
+    -------
+    flask.Response
+        The (possibly compressed or 304) response.
+    """
+    if response.status_code != 200 or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    # Files are read into memory to be compressed, generators are left streaming
+    if response.is_streamed and not response.direct_passthrough:
+        return response
+
+    response.direct_passthrough = False
+    data = response.get_data()
+    encoding = choose_encoding(request.accept_encodings) if len(data) >= min_size else None
+    response.vary.add('Accept-Encoding')
+
+    if request.method in ('GET', 'HEAD'):
+        etag, _ = response.get_etag()
+        etag = etag or hashlib.sha1(data).hexdigest()
+        response.set_etag(f'{etag}-{encoding}' if encoding else etag)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+
+    if encoding is not None:
+        response.set_data(compress(data, encoding, compress_level))
+        response.headers['Content-Encoding'] = encoding
+    return response
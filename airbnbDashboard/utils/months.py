@@ -0,0 +1,103 @@
+"""
+Adding a new month of listings to the running app.
+
+The rows of the month are posted as a CSV file in the format of the combined
+CSV files, with the admin token (see `utils/admin.py`), e.g.
+
+>>> curl -X POST --data-binary @2024-10.csv -H 'Content-Type: text/csv' -H "X-Admin-Token: $TOKEN" 'http://localhost:8050/admin/months/Madrid, Spain'
+
+and merged into the loaded data by `append_month` (see `data/incremental.py`).
+"""
+import io
+import threading
+import pandas as pd
+from flask import jsonify, request
+
+from airbnbDashboard.data.loader import dtype_spec
+from airbnbDashboard.data.incremental import append_month
+from airbnbDashboard.utils.admin import is_admin, forbidden
+
+# Columns without which the statistics and the scatter plot of a month cannot be computed
+required_columns = ['date', 'id', 'neighbourhood_cleansed', 'price', 'review_scores_rating']
+
+def read_month(file):
+    """
+    Reads the rows of a new month from a CSV file.
+
+    Parameters
+    ----------
+    file : file-like
+        The CSV file, with a header in the format of the combined CSV files.
+
+    Returns
+    -------
+    pd.DataFrame
+        The rows, with the same column types as at startup.
+
+    Raises
+    ------
+    ValueError
+        If the file is empty or one of the `required_columns` is missing.
+    """
+    try:
+        listings = pd.read_csv(file, encoding='utf-8', dtype=dtype_spec, low_memory=False)
+    except pd.errors.EmptyDataError:
+        raise ValueError("The file contains no rows")
+    missing = [col for col in required_columns if col not in listings.columns]
+    if missing:
+        raise ValueError(f"Missing columns: {missing}")
+    listings['date'] = pd.to_datetime(listings['date'])
+    return listings
+
+def register_month_routes(server, neighborhood_stats, listings_data, listing_dims, date_marks, city_indexes,
+                          neighborhood_totals, delta_dir=None, admin_token=None):
+    """
+    Registers the `/admin/months/<city>` endpoint, which adds a new month of listings of a city.
+
+    The CSV file is sent as the body of a POST request or as the 'file' field
+    of a form. The month is added with `append_month`, which increases the
+    data version of the city, so the callbacks render the city again instead
+    of serving cached figures, and the layout is built again with the new
+    slider marks. Months are added one at a time.
+
+    The response is the month, the new data version of the city and the
+    number of slider marks, or 400 with the error if the rows were rejected
+    (nothing is changed then) and 404 for an unknown city. Requests without
+    the admin token are answered with 403, all of them if no token is given.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The Flask server of the Dash app (`app.server`).
+    neighborhood_stats, listings_data, listing_dims, date_marks, city_indexes, neighborhood_totals : dict
+        The data of all cities (see `append_month`).
+    delta_dir : str, optional
+        If given, the month is also stored there, so it is added again at the next start.
+    admin_token : str, optional
+        The token that requests must send in the `X-Admin-Token` header.
+
+    Returns
+    -------
+    flask.Flask
+        The server with the route registered.
+    """
+    lock = threading.Lock()
+
+    @server.route('/admin/months/<city>', methods=['POST'])
+    def admin_append_month(city):
+        if not is_admin(admin_token):
+            return forbidden()
+        if city not in listings_data:
+            return jsonify(error=f"Unknown city: {city}"), 404
+        upload = request.files.get('file')
+        try:
+            listings = read_month(upload.stream if upload is not None else io.BytesIO(request.get_data()))
+            with lock:
+                append_month(city, listings, neighborhood_stats, listings_data, listing_dims, date_marks, city_indexes,
+                             neighborhood_totals, delta_dir)
+                version = city_indexes[city]['version']
+        except ValueError as error:
+            return jsonify(error=error.args[0]), 400
+        return jsonify(city=city, month=listings['date'].min().strftime('%Y-%m'), version=version, marks=len(date_marks))
+
+    return server
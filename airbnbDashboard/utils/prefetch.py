@@ -0,0 +1,195 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import g
+
+class Prefetcher:
+    """
+    Warms the callback caches in the background with what the user is likely to ask for next.
+
+    Tasks are identified by the cache key they fill and run on a small
+    thread pool, only while no request is being served: a task waits until
+    the server is idle (see `register_prefetching`), so the speculative work
+    does not compete with the requests for the GIL. The budget is strict:
+
+    - at most `max_pending` tasks are queued, further tasks are dropped;
+    - a task that could not start within `max_wait` seconds is dropped, as
+      the user has most likely moved on;
+    - a request that needs the result of a queued task cancels it and computes
+      the result itself, and one that needs the result of a running task waits
+      for it instead of computing it twice (see `claim`).
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        The number of threads that run the tasks. The default is 1.
+    max_pending : int, optional
+        The maximum number of queued and running tasks. The default is 16.
+    max_wait : float, optional
+        The seconds a task may wait for the server to become idle. The default is 2.
+
+    Usage
+    -----
+    >>> prefetcher = Prefetcher()
+    >>> register_prefetching(app.server, prefetcher)
+    >>> prefetcher.submit(('map', 'Madrid, Spain', 0, 2, 'avg_price'), lambda: render_map('Madrid, Spain', 2, 'avg_price'))
+    """
+
+    def __init__(self, max_workers=1, max_pending=16, max_wait=2.0):
+        self.max_pending = max_pending
+        self.max_wait = max_wait
+        self.counters = {'submitted': 0, 'completed': 0, 'claimed': 0, 'dropped': 0, 'expired': 0, 'failed': 0}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        self._tasks = {}
+        self._active = 0
+        self._idle = threading.Condition()
+
+    def submit(self, key, warm):
+        """
+        Queues a task, unless the same task is queued already or the budget is used up.
+
+        Parameters
+        ----------
+        key : hashable
+            The cache key the task fills.
+        warm : callable
+            Computes and caches the result; called without arguments.
+
+        Returns
+        -------
+        bool
+            Whether the task was queued.
+        """
+        with self._idle:
+            if key in self._tasks:
+                return False
+            if len(self._tasks) >= self.max_pending:
+                self.counters['dropped'] += 1
+                return False
+            task = {'state': 'pending', 'submitted': time.monotonic(), 'thread': None, 'done': threading.Event()}
+            self._tasks[key] = task
+            self.counters['submitted'] += 1
+        self._executor.submit(self._run, key, task, warm)
+        return True
+
+    def claim(self, key, timeout=None):
+        """
+        Takes over the task of a key before a request computes the result itself.
+
+        A queued task is cancelled, so the result is computed once, by the
+        request. If the task is already running, this waits until it has
+        cached the result. Does nothing if there is no task for the key or if
+        it is called by the task itself.
+
+        Parameters
+        ----------
+        key : hashable
+            The cache key.
+        timeout : float, optional
+            The maximum seconds to wait for a running task. The default is to wait until it finished.
+
+        Returns
+        -------
+        bool
+            Whether a running task was waited for, so its result may now be cached.
+        """
+        with self._idle:
+            task = self._tasks.get(key)
+            if task is None or task['thread'] == threading.get_ident():
+                return False
+            if task['state'] == 'pending':
+                task['state'] = 'claimed'
+                del self._tasks[key]
+                self.counters['claimed'] += 1
+                return False
+        return task['done'].wait(timeout)
+
+    def begin_request(self):
+        """Marks the start of a request; tasks do not start until all requests ended."""
+        with self._idle:
+            self._active += 1
+
+    def end_request(self):
+        """Marks the end of a request and wakes the tasks once the server is idle."""
+        with self._idle:
+            self._active -= 1
+            if self._active == 0:
+                self._idle.notify_all()
+
+    def stats(self):
+        """
+        Returns the counters of the prefetcher.
+
+        Returns
+        -------
+        dict
+            The number of tasks 'submitted', 'completed', 'claimed' by a request
+            before they started, 'dropped' over budget, 'expired' while waiting
+            for the server to be idle and 'failed', and the number 'pending'.
+        """
+        with self._idle:
+            return dict(self.counters, pending=len(self._tasks))
+
+    def shutdown(self):
+        """Drops the queued tasks and waits for the running ones."""
+        with self._idle:
+            for task in self._tasks.values():
+                if task['state'] == 'pending':
+                    task['state'] = 'expired'
+            self._idle.notify_all()
+        self._executor.shutdown(wait=True)
+
+    def _run(self, key, task, warm):
+        try:
+            with self._idle:
+                deadline = task['submitted'] + self.max_wait
+                while self._active and task['state'] == 'pending' and time.monotonic() < deadline:
+                    self._idle.wait(deadline - time.monotonic())
+                if task['state'] != 'pending':
+                    return
+                if self._active:
+                    task['state'] = 'expired'
+                    self.counters['expired'] += 1
+                    return
+                task['state'], task['thread'] = 'running', threading.get_ident()
+            try:
+                warm()
+                outcome = 'completed'
+            except Exception:
+                # A failed guess costs nothing but the attempt, the request computes the result again
+                outcome = 'failed'
+            with self._idle:
+                self.counters[outcome] += 1
+        finally:
+            with self._idle:
+                if self._tasks.get(key) is task:
+                    del self._tasks[key]
+            task['done'].set()
+
+def register_prefetching(server, prefetcher):
+    """
+    Registers the request hooks that keep the prefetcher from running while requests are served.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The Flask server of the Dash app (`app.server`).
+    prefetcher : Prefetcher
+        The prefetcher shared with the callbacks.
+
+    Returns
+    -------
+    flask.Flask
+        The server with the hooks registered.
+    """
+    @server.before_request
+    def begin_request():
+        prefetcher.begin_request()
+        g.prefetch_paused = True
+
+    @server.teardown_request
+    def end_request(error=None):
+        if g.pop('prefetch_paused', False):
+            prefetcher.end_request()
+
+    return server
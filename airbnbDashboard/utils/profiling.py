@@ -0,0 +1,281 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import Response, g, jsonify, request, send_file
+
+from airbnbDashboard.utils.admin import is_admin, forbidden
+
+# Request header and query parameter that ask for a profile of a single request
+profile_header = 'X-Profile'
+profile_flag = 'profile'
+
+# Number of functions in the text report of a profile
+report_limit = 40
+
+class RequestProfiles:
+    """
+    Profiles selected requests with cProfile and keeps the results under an id.
+
+    A request is profiled if it carries the `profile_header` header or the
+    `profile_flag` query parameter together with the admin token (see
+    `utils/admin.py`), or at random with the probability `sample_rate`. Dash callbacks run entirely inside their request, so the
+    profile covers the callback with its data access (e.g. `filter_listings`),
+    the construction of the Plotly figures and the serialization of the
+    response. Requests that are not profiled only pay for a header lookup and
+    a random number.
+
+    Only one request is profiled at a time; requests that arrive while a
+    profile is running are served without one.
+
+    Parameters
+    ----------
+    profile_dir : str, optional
+        The directory of the profile files. The default is a new temporary
+        directory. The descriptions of the profiles are only kept in memory,
+        so the profile files of earlier runs are removed from it.
+    sample_rate : float, optional
+        The fraction of requests profiled without being asked for. The default is 0.
+    max_profiles : int, optional
+        The number of profiles kept. Once exceeded, the oldest profiles and
+        their files are removed. The default is 100.
+
+    Usage
+    -----
+    >>> request_profiles = RequestProfiles(sample_rate=0.01)
+    >>> register_profiling(app.server, request_profiles, admin_token)
+    """
+
+    def __init__(self, profile_dir=None, sample_rate=0.0, max_profiles=100):
+        self.profile_dir = profile_dir or tempfile.mkdtemp(prefix='airbnb-profiles-')
+        os.makedirs(self.profile_dir, exist_ok=True)
+        for file_name in os.listdir(self.profile_dir):
+            if file_name.endswith('.prof'):
+                os.remove(os.path.join(self.profile_dir, file_name))
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+        self._active = threading.Lock()
+
+    def wanted(self, headers, args, admin=False):
+        """
+        Returns why a request should be profiled, if at all.
+
+        Parameters
+        ----------
+        headers : werkzeug.datastructures.Headers
+            The request headers.
+        args : werkzeug.datastructures.MultiDict
+            The query parameters.
+        admin : bool, optional
+            Whether the request sends the admin token. Only then do the
+            `profile_header` and `profile_flag` ask for a profile, so other
+            clients cannot slow the server down with profiled requests. The
+            default is False.
+
+        Returns
+        -------
+        str or None
+            'header', 'query' or 'sample', or None if the request is not profiled.
+        """
+        if admin and profile_header in headers:
+            return 'header'
+        if admin and profile_flag in args:
+            return 'query'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def start(self):
+        """
+        Starts a profile, unless another one is running.
+
+        Returns
+        -------
+        cProfile.Profile or None
+            The running profiler, or None if another request is being profiled.
+        """
+        if not self._active.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        profiler.enable()
+        return profiler
+
+    def stop(self, profiler, info):
+        """
+        Stops a profile and stores it.
+
+        Parameters
+        ----------
+        profiler : cProfile.Profile
+            The profiler returned by `start`.
+        info : dict
+            What was profiled, e.g. the path and the callback outputs.
+
+        Returns
+        -------
+        str
+            The id of the profile.
+        """
+        try:
+            profiler.disable()
+        finally:
+            self._active.release()
+        profile_id = uuid.uuid4().hex[:12]
+        path = os.path.join(self.profile_dir, f'{profile_id}.prof')
+        profiler.dump_stats(path)
+        with self._lock:
+            self._profiles[profile_id] = dict(info, id=profile_id, path=path)
+            while len(self._profiles) > self.max_profiles:
+                _, oldest = self._profiles.popitem(last=False)
+                if os.path.exists(oldest['path']):
+                    os.remove(oldest['path'])
+        return profile_id
+
+    def list(self):
+        """
+        Returns the stored profiles, newest first.
+
+        Returns
+        -------
+        list
+            The description of each profile, without its file path.
+        """
+        with self._lock:
+            return [{key: value for key, value in profile.items() if key != 'path'}
+                    for profile in reversed(self._profiles.values())]
+
+    def path(self, profile_id):
+        """
+        Returns the file of a profile.
+
+        Parameters
+        ----------
+        profile_id : str
+            The id of the profile.
+
+        Returns
+        -------
+        str or None
+            The path of the cProfile stats file, None if the profile is unknown.
+        """
+        with self._lock:
+            profile = self._profiles.get(profile_id)
+        return profile['path'] if profile is not None else None
+
+def profile_report(path, sort_by='cumulative', limit=report_limit):
+    """
+    Formats a profile as the text report of `pstats`.
+
+    Parameters
+    ----------
+    path : str
+        The path of the cProfile stats file.
+    sort_by : str, optional
+        The `pstats` sort key, e.g. 'cumulative' or 'tottime'. The default is 'cumulative'.
+    limit : int, optional
+        The number of functions listed. The default is `report_limit`.
+
+    Returns
+    -------
+    str
+        The report.
+    """
+    output = io.StringIO()
+    stats = pstats.Stats(path, stream=output)
+    stats.strip_dirs().sort_stats(sort_by).print_stats(limit)
+    return output.getvalue()
+
+def register_profiling(server, request_profiles, admin_token=None):
+    """
+    Registers the request profiling hooks and the endpoints of the profiles on the Flask server.
+
+    Profiled responses carry the id of their profile in an 'X-Profile-Id'
+    header. Asking for a profile and the endpoints require the admin token
+    in the `X-Admin-Token` header; the endpoints answer 403 without it.
+
+    - `/profiles` lists the stored profiles, newest first.
+    - `/profiles/<profile_id>` returns the text report of a profile, sorted
+      by the 'sort' parameter ('cumulative' by default). With 'format=pstats'
+      it returns the cProfile stats file instead, which can be opened with
+      `python -m pstats`, snakeviz or converted to a flame graph.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The Flask server of the Dash app (`app.server`).
+    request_profiles : RequestProfiles
+        The profile store and sampling settings.
+    admin_token : str, optional
+        The token that requests must send in the `X-Admin-Token` header.
+
+    Returns
+    -------
+    flask.Flask
+        The server with the hooks and routes registered.
+    """
+    @server.before_request
+    def start_profile():
+        reason = request_profiles.wanted(request.headers, request.args, is_admin(admin_token))
+        if reason is None or request.path.startswith('/profiles'):
+            return
+        profiler = request_profiles.start()
+        if profiler is not None:
+            g.profile = (profiler, reason, time.perf_counter())
+
+    @server.after_request
+    def stop_profile(response):
+        if 'profile' not in g:
+            return response
+        profiler, reason, start = g.pop('profile')
+        info = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'method': request.method,
+            'path': request.path,
+            'reason': reason,
+            'status': response.status_code,
+            'duration_ms': round((time.perf_counter() - start) * 1000, 1),
+        }
+        if request.path.endswith('_dash-update-component'):
+            # The callback is identified by its outputs, e.g. 'map-container.children'
+            info['callback'] = (request.get_json(silent=True) or {}).get('output')
+        response.headers['X-Profile-Id'] = request_profiles.stop(profiler, info)
+        return response
+
+    @server.teardown_request
+    def discard_profile(error=None):
+        # A request that failed before `stop_profile` must not keep the profiler running
+        if 'profile' in g:
+            profiler, _, _ = g.pop('profile')
+            request_profiles.stop(profiler, {'path': request.path, 'error': str(error)})
+
+    @server.route('/profiles')
+    def list_profiles():
+        if not is_admin(admin_token):
+            return forbidden()
+        return jsonify(request_profiles.list())
+
+    @server.route('/profiles/<profile_id>')
+    def get_profile(profile_id):
+        if not is_admin(admin_token):
+            return forbidden()
+        path = request_profiles.path(profile_id)
+        if path is None:
+            return jsonify(error=f"Unknown profile: {profile_id}"), 404
+        if request.args.get('format') == 'pstats':
+            return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                             download_name=f'{profile_id}.prof')
+        try:
+            report = profile_report(path, request.args.get('sort', 'cumulative'))
+        except KeyError as error:
+            return jsonify(error=f"Unknown sort key: {error.args[0]}"), 400
+        return Response(report, mimetype='text/plain')
+
+    return server
@@ -0,0 +1,166 @@
+import datetime
+import decimal
+import functools
+import json
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from dash import no_update
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# NumPy arrays are written from their buffer, datetimes natively in the same format as Plotly
+ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS) if orjson else 0
+
+def configure_json_engine():
+    """
+    Selects the fastest available JSON engine for every response that Dash sends.
+
+    Dash serializes the layout and all callback responses through
+    `plotly.io.json.to_json_plotly`, which uses the engine configured in
+    `plotly.io.json.config`.
+
+    Returns
+    -------
+    str
+        The name of the selected engine, either 'orjson' or 'json'.
+    """
+    engine = 'orjson' if orjson is not None else 'json'
+    pio.json.config.default_engine = engine
+    return engine
+
+def _encode_default(obj):
+    """
+    Converts the objects orjson cannot encode natively: Dash components, Plotly
+    figures, pandas objects and non-contiguous or object NumPy arrays.
+    """
+    if hasattr(obj, 'to_plotly_json'):
+        return obj.to_plotly_json()
+    if isinstance(obj, (pd.Series, pd.Index)):
+        obj = obj.to_numpy()
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind in ('b', 'i', 'u', 'f', 'M') and not obj.flags['C_CONTIGUOUS']:
+            return np.ascontiguousarray(obj)
+        if obj.dtype.kind == 'M':
+            return np.datetime_as_string(obj).tolist()
+        return obj.tolist()
+    if obj is pd.NaT or obj is pd.NA:
+        return None
+    if isinstance(obj, (datetime.date, np.datetime64)):
+        return pd.Timestamp(obj).isoformat()
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def to_json(obj):
+    """
+    Serializes a component, figure or any other callback output to a JSON string.
+
+    With orjson the object tree is walked in C and only the objects handled by
+    `_encode_default` are converted in Python, so GeoJSON coordinates, table
+    cells and NumPy arrays never pass through Python-level conversion. Without
+    orjson, the Plotly JSON encoder is used.
+
+    Parameters
+    ----------
+    obj : object
+        The object to serialize.
+
+    Returns
+    -------
+    str
+        The JSON representation of the object.
+    """
+    if orjson is None:
+        return pio.json.to_json_plotly(obj, engine='json')
+    return orjson.dumps(obj, default=_encode_default, option=ORJSON_OPTIONS).decode('utf8')
+
+def serialize_figure(fig):
+    """
+    Serializes a Plotly figure to a JSON string once, so that it can be cached
+    and sent again without being encoded a second time.
+
+    Parameters
+    ----------
+    fig : plotly.graph_objects.Figure
+        The figure to serialize.
+
+    Returns
+    -------
+    str
+        The JSON representation of the figure.
+    """
+    return to_json(fig)
+
+def pre_serialized(json_string):
+    """
+    Wraps an already serialized value so that it can be used as a callback output
+    or component property without being decoded and encoded again.
+
+    With orjson 3.9 or newer as the active engine, the JSON string is embedded
+    into the response as it is (`orjson.Fragment`). Otherwise, the string is
+    decoded and encoded again by the default encoder.
+
+    Parameters
+    ----------
+    json_string : str
+        The JSON representation of a value, e.g. from `serialize_figure`.
+
+    Returns
+    -------
+    orjson.Fragment or object
+        An object that serializes to the given JSON.
+    """
+    if hasattr(orjson, 'Fragment') and pio.json.config.default_engine in ('orjson', 'auto'):
+        return orjson.Fragment(json_string)
+    return json.loads(json_string)
+
+def serialize_output(output):
+    """
+    Serializes a single callback output once, e.g. before it is cached.
+
+    Parameters
+    ----------
+    output : object
+        The callback output. `no_update` and already serialized outputs are
+        returned unchanged, as is everything when orjson 3.9+ is not available.
+
+    Returns
+    -------
+    orjson.Fragment or object
+        The pre-serialized output.
+    """
+    if not hasattr(orjson, 'Fragment') or isinstance(output, (type(no_update), orjson.Fragment)):
+        return output
+    return pre_serialized(to_json(output))
+
+def serialized_outputs(callback):
+    """
+    Decorator that serializes the outputs of a Dash callback with `to_json`.
+
+    As soon as a response contains a component, Plotly's JSON helper used by
+    Dash falls back to converting the entire tree in Python, including every
+    GeoJSON coordinate. Returning the outputs pre-serialized leaves Dash with
+    nothing but already encoded fragments.
+
+    Parameters
+    ----------
+    callback : function
+        The callback function, decorated below `app.callback`.
+
+    Returns
+    -------
+    function
+        The wrapped callback function.
+    """
+    @functools.wraps(callback)
+    def wrapper(*args, **kwargs):
+        outputs = callback(*args, **kwargs)
+        if isinstance(outputs, tuple):
+            return tuple(serialize_output(output) for output in outputs)
+        return serialize_output(outputs)
+    return wrapper
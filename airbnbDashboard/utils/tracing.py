@@ -0,0 +1,259 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from flask import jsonify, request
+
+from airbnbDashboard.utils.memory import process_rss
+
+class StartupTrace:
+    """
+    Records the duration and memory of the phases of the startup.
+
+    Phases are recorded with the `phase` context manager and may be nested,
+    e.g. the reading of one city's CSV file inside the loading of all cities.
+    While the trace runs, a background thread samples the resident set size
+    of the process, so every phase gets the peak RSS reached while it ran,
+    including the memory that is released before it ends.
+
+    The functions of the startup take the trace as an optional `trace`
+    argument and record their phases only if it is given.
+
+    Parameters
+    ----------
+    sample_interval : float, optional
+        The seconds between two RSS samples. The default is 0.01.
+
+    Usage
+    -----
+    >>> trace = StartupTrace()
+    >>> with trace.phase('load_data', city='Madrid, Spain'):
+    ...     load_data(city_paths)
+    >>> trace.stop()
+    >>> trace.write('startup_trace.json', 'chrome')
+    """
+
+    def __init__(self, sample_interval=0.01):
+        self.sample_interval = sample_interval
+        self.started = time.time()
+        self.ended = None
+        self.phases = []
+        self.samples = []
+        self._start = time.perf_counter()
+        self._open = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='startup-trace', daemon=True)
+        self._sampler.start()
+
+    @contextmanager
+    def phase(self, name, city=None):
+        """
+        Records a phase of the startup.
+
+        Parameters
+        ----------
+        name : str
+            The name of the phase, e.g. 'read_listings'.
+        city : str, optional
+            The city the phase is about. The default is the city of the
+            enclosing phase, so the steps of a city need not repeat it.
+        """
+        rss = process_rss()
+        if city is None and self._open:
+            city = self._open[-1]['city']
+        record = {
+            'name': name,
+            'city': city,
+            'depth': len(self._open),
+            'start_ms': self._elapsed_ms(),
+            'rss_start': rss,
+            'peak_rss': rss,
+            'thread': threading.get_ident(),
+        }
+        with self._lock:
+            self.phases.append(record)
+            self._open.append(record)
+        try:
+            yield record
+        finally:
+            rss = process_rss()
+            with self._lock:
+                self._open.remove(record)
+                record['duration_ms'] = round(self._elapsed_ms() - record['start_ms'], 3)
+                record['rss_end'] = rss
+                if rss is not None:
+                    record['peak_rss'] = max(record['peak_rss'] or 0, rss)
+
+    def stop(self):
+        """Stops the RSS sampling. Phases can no longer be recorded afterwards."""
+        if self.ended is None:
+            self._stopped.set()
+            self._sampler.join()
+            self.ended = self._elapsed_ms()
+
+    def to_json(self):
+        """
+        Returns the trace as a dictionary.
+
+        Returns
+        -------
+        dict
+            The 'started' time (seconds since the epoch), the 'duration_ms' of
+            the startup, its 'peak_rss' in bytes and the 'phases' in the order
+            they started, each with its 'name', 'city', nesting 'depth',
+            'start_ms' (since the start of the trace), 'duration_ms',
+            'rss_start', 'rss_end' and 'peak_rss'. RSS values are None where
+            the RSS cannot be measured.
+        """
+        with self._lock:
+            phases = [{key: value for key, value in phase.items() if key != 'thread'} for phase in self.phases]
+            rss_values = [rss for _, rss in self.samples] + [phase['peak_rss'] for phase in phases if phase['peak_rss']]
+        return {
+            'started': self.started,
+            'duration_ms': round(self.ended if self.ended is not None else self._elapsed_ms(), 3),
+            'peak_rss': max(rss_values) if rss_values else None,
+            'phases': phases,
+        }
+
+    def to_chrome(self):
+        """
+        Returns the trace in the Chrome trace-event format.
+
+        The phases are complete ('X') events and the RSS samples a counter
+        ('C') track, for chrome://tracing or https://ui.perfetto.dev.
+
+        Returns
+        -------
+        dict
+            The trace events under 'traceEvents', with times in microseconds.
+        """
+        pid = os.getpid()
+        with self._lock:
+            phases = list(self.phases)
+            samples = list(self.samples)
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'startup'}}]
+        for phase in phases:
+            events.append({
+                'name': phase['name'] if phase['city'] is None else f"{phase['name']} ({phase['city']})",
+                'cat': 'startup',
+                'ph': 'X',
+                'ts': round(phase['start_ms'] * 1000, 1),
+                'dur': round(phase.get('duration_ms', 0) * 1000, 1),
+                'pid': pid,
+                'tid': phase['thread'],
+                'args': {key: phase.get(key) for key in ('city', 'rss_start', 'rss_end', 'peak_rss')},
+            })
+        for elapsed_ms, rss in samples:
+            events.append({'name': 'rss', 'ph': 'C', 'ts': round(elapsed_ms * 1000, 1), 'pid': pid,
+                           'args': {'MB': round(rss / 2 ** 20, 1)}})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path, trace_format='json'):
+        """
+        Writes the trace to a file.
+
+        Parameters
+        ----------
+        path : str
+            The path of the file.
+        trace_format : str, optional
+            'json' for `to_json` or 'chrome' for `to_chrome`. The default is 'json'.
+
+        Raises
+        ------
+        ValueError
+            If the format is unknown.
+        """
+        if trace_format not in ('json', 'chrome'):
+            raise ValueError(f"Unknown trace format: {trace_format}")
+        data = self.to_chrome() if trace_format == 'chrome' else self.to_json()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, indent=1)
+
+    def _elapsed_ms(self):
+        return (time.perf_counter() - self._start) * 1000
+
+    def _sample(self):
+        while not self._stopped.wait(self.sample_interval):
+            rss = process_rss()
+            if rss is None:
+                return
+            with self._lock:
+                self.samples.append((self._elapsed_ms(), rss))
+                for record in self._open:
+                    record['peak_rss'] = max(record['peak_rss'] or 0, rss)
+
+def format_trace(trace_json, min_ms=1.0):
+    """
+    Formats a trace as an indented list of phases for the startup log.
+
+    Phases repeated within the same parent phase, e.g. for every chunk of a
+    file, are summed into one line with the number of repetitions.
+
+    Parameters
+    ----------
+    trace_json : dict
+        The result of `StartupTrace.to_json`.
+    min_ms : float, optional
+        Phases shorter than this are left out. The default is 1 ms.
+
+    Returns
+    -------
+    str
+        One line per phase with its duration and peak RSS, followed by the total.
+    """
+    def mb(size):
+        return f"{size / 2 ** 20:8.1f} MB" if size is not None else '       - MB'
+
+    # Phases are summed per path from the top level, e.g. the steps of each chunk of a file
+    rows = {}
+    path = []
+    for phase in trace_json['phases']:
+        path = path[:phase['depth']] + [(phase['name'], phase['city'])]
+        row = rows.setdefault(tuple(path), {'count': 0, 'duration_ms': 0.0, 'peak_rss': None})
+        row['count'] += 1
+        row['duration_ms'] += phase.get('duration_ms', 0)
+        if phase['peak_rss'] is not None:
+            row['peak_rss'] = max(row['peak_rss'] or 0, phase['peak_rss'])
+
+    lines = []
+    for path, row in rows.items():
+        if row['duration_ms'] < min_ms:
+            continue
+        name, city = path[-1]
+        # The city is only named where it changes, not again on the steps of a city
+        shown_city = city if city and (len(path) == 1 or path[-2][1] != city) else None
+        label = '  ' * (len(path) - 1) + name + (f" ({shown_city})" if shown_city else '') + (f" x{row['count']}" if row['count'] > 1 else '')
+        lines.append(f"{label:<56}{row['duration_ms']:10.1f} ms{mb(row['peak_rss'])}")
+    lines.append(f"{'Startup':<56}{trace_json['duration_ms']:10.1f} ms{mb(trace_json['peak_rss'])}")
+    return '\n'.join(lines)
+
+def register_trace_routes(server, trace):
+    """
+    Registers the `/admin/startup` endpoint, which returns the startup trace.
+
+    The trace is returned as `StartupTrace.to_json`, or in the Chrome
+    trace-event format with the parameter 'format=chrome'.
+
+    Parameters
+    ----------
+    server : flask.Flask
+        The Flask server of the Dash app (`app.server`).
+    trace : StartupTrace
+        The trace of the startup.
+
+    Returns
+    -------
+    flask.Flask
+        The server with the route registered.
+    """
+    @server.route('/admin/startup')
+    def admin_startup():
+        if request.args.get('format') == 'chrome':
+            return jsonify(trace.to_chrome())
+        return jsonify(trace.to_json())
+
+    return server
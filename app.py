@@ -1,4 +1,3 @@
-import os
 from dash import Dash
 import dash_bootstrap_components as dbc
 
@@ -6,28 +5,84 @@ from airbnbDashboard.dashboard.callbacks import register_callbacks
 from airbnbDashboard.dashboard.layout import setup_layout
 from airbnbDashboard.utils.app_initializer import initialize_app, load_and_prepare_data
 from airbnbDashboard.data.repo_manager import setup_repo
+from airbnbDashboard.data.paths import repo_url, local_dir, admin_token, delta_dir, export_dir, query_engine, profile_dir, profile_sample_rate, trace_path, trace_format, prefetch_workers
+from airbnbDashboard.utils.export import ExportJobs, register_export_routes
+from airbnbDashboard.utils.api import register_api_routes
+from airbnbDashboard.utils.profiling import RequestProfiles, register_profiling
+from airbnbDashboard.utils.memory import register_memory_routes
+from airbnbDashboard.utils.months import register_month_routes
+from airbnbDashboard.utils.tracing import StartupTrace, format_trace, register_trace_routes
+from airbnbDashboard.utils.prefetch import Prefetcher, register_prefetching
 
 def main():
     print("Starting the application...")
 
-    # Use a consistent directory for the repository
-    repo_url = 'https://github.com/aleksandar42/webapp.git'
-    local_dir = os.path.join(os.path.expanduser('~'), 'Desktop/webapp')
+    # Record the duration and peak memory of every startup phase
+    trace = StartupTrace()
 
-    # Set up the repository (only once)
-    setup_repo(repo_url, local_dir)
+    # Set up the repository that the data is read from (only once)
+    with trace.phase('setup_repo'):
+        setup_repo(repo_url, local_dir)
 
     # Initialize the Dash app
-    app = initialize_app()
+    with trace.phase('initialize_app'):
+        app = initialize_app()
 
     # Load and prepare data (only once)
-    neighborhoods_geojson, neighborhood_stats, listings_data, city_options, date_marks = load_and_prepare_data()
+    with trace.phase('load_and_prepare_data'):
+        (neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims, city_options, date_marks, city_indexes,
+         neighborhood_totals, query_backend) = load_and_prepare_data(trace)
 
-    # Set up the layout
-    app.layout = setup_layout(city_options, date_marks, neighborhoods_geojson, neighborhood_stats)
+    # Set up the layout, built again when a month was appended (see data/incremental.py)
+    layouts = {}
 
-    # Register the callbacks
-    register_callbacks(app, listings_data, neighborhoods_geojson, neighborhood_stats, date_marks)
+    def serve_layout(trace=None):
+        data_version = (len(date_marks), sum(indexes.get('version', 0) for indexes in city_indexes.values()))
+        if data_version not in layouts:
+            layouts.clear()
+            layouts[data_version] = setup_layout(city_options, date_marks, neighborhoods_geojson, neighborhood_stats, trace)
+        return layouts[data_version]
+
+    app.layout = serve_layout
+
+    # The layout is built once at startup, so the first visitor does not wait for it
+    with trace.phase('layout'):
+        serve_layout(trace)
+
+    # Memory used by the data, indexes and caches, for deciding on dtypes and cache sizes
+    register_memory_routes(app.server, neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims, city_indexes)
+
+    # New months are posted to /admin/months/<city> with the admin token and added without a restart,
+    # to the loaded DataFrames only
+    if query_engine == 'pandas' and admin_token:
+        register_month_routes(app.server, neighborhood_stats, listings_data, listing_dims, date_marks, city_indexes,
+                              neighborhood_totals, delta_dir, admin_token)
+
+    # Profile single requests on demand (X-Profile header or ?profile, with the admin token) or a sample of them,
+    # the profiles are listed at /profiles for the admin token
+    if admin_token:
+        register_profiling(app.server, RequestProfiles(profile_dir, profile_sample_rate), admin_token)
+
+    # Register the callbacks, with the configured backend for the listing queries
+    with trace.phase('register_callbacks'):
+        # Table exports run as background jobs, started from the modal or the /export endpoint
+        export_jobs = ExportJobs(export_dir)
+        register_export_routes(app.server, export_jobs, listings_data, listing_dims, city_indexes)
+        # Read-only JSON API for other tools, served from the same precomputed structures
+        register_api_routes(app.server, neighborhood_stats, listings_data, listing_dims, date_marks, city_indexes)
+        # Adjacent months and the clicked neighbourhood's table and scatter plot are prepared while the server is idle
+        prefetcher = None
+        if prefetch_workers > 0:
+            prefetcher = Prefetcher(max_workers=prefetch_workers)
+            register_prefetching(app.server, prefetcher)
+        register_callbacks(app, listings_data, listing_dims, neighborhoods_geojson, neighborhood_stats, date_marks, city_indexes,
+                           query_backend, export_jobs, prefetcher=prefetcher)
+
+    # Print the startup timeline and keep it in a file and at /admin/startup
+    trace.stop()
+    print(format_trace(trace.to_json()))
+    trace.write(trace_path, trace_format)
+    register_trace_routes(app.server, trace)
 
     # Run the app on all available IP addresses of the server
     app.run_server(debug=True, host='0.0.0.0', port=8050)
@@ -0,0 +1,115 @@
+"""
+Benchmark for the response compression and ETag middleware.
+
+Replays a typical session against the Flask test client: loading the page,
+moving the month slider, opening the modal for a neighbourhood and reloading
+the page. It reports the transferred bytes without compression, with gzip
+and with brotli (if installed), and with conditional requests on reload.
+
+Synthetic data (see `synthetic.py`) is used so that the benchmark runs without
+the Git LFS files.
+
+Usage
+-----
+>>> python benchmarks/compression_benchmark.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from synthetic import write_city
+from airbnbDashboard.dashboard import register_callbacks, setup_layout
+from airbnbDashboard.data.loader import load_data
+from airbnbDashboard.plots import get_unique_dates, generate_date_marks
+from airbnbDashboard.utils import initialize_app, get_city_options, build_city_indexes
+from airbnbDashboard.utils.middleware import brotli
+
+CITY = 'Madrid, Spain'
+NEIGHBORHOOD = 'Neighbourhood 3'
+
+def create_app(city_paths):
+    """Creates the app the same way as `main()` in `app.py`, using the given data files."""
+    app = initialize_app()
+    neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims = load_data(city_paths)
+    date_marks = generate_date_marks(get_unique_dates(city_paths))
+    city_indexes = build_city_indexes(listings_data, listing_dims, date_marks, neighborhood_stats)
+    app.layout = setup_layout(get_city_options(city_paths), date_marks, neighborhoods_geojson, neighborhood_stats)
+    register_callbacks(app, listings_data, listing_dims, neighborhoods_geojson, neighborhood_stats, date_marks, city_indexes)
+    return app
+
+def callback(client, outputs, inputs, headers, state=()):
+    """Posts a callback request. `outputs`, `inputs` and `state` are lists of (id, property[, value])."""
+    output_ids = [{'id': output_id, 'property': prop} for output_id, prop in outputs]
+    payload = {
+        'output': '..' + '...'.join(f'{output_id}.{prop}' for output_id, prop in outputs) + '..' if len(outputs) > 1
+                  else f'{outputs[0][0]}.{outputs[0][1]}',
+        'outputs': output_ids if len(outputs) > 1 else output_ids[0],
+        'inputs': [{'id': input_id, 'property': prop, 'value': value} for input_id, prop, value in inputs],
+        'state': [{'id': state_id, 'property': prop, 'value': value} for state_id, prop, value in state],
+        'changedPropIds': [f'{inputs[0][0]}.{inputs[0][1]}'],
+    }
+    response = client.post('/_dash-update-component', json=payload, headers=headers)
+    # A failed or skipped callback would silently leave its payload out of the numbers
+    if response.status_code != 200:
+        raise RuntimeError(f"Callback {payload['output']} returned {response.status_code}")
+    return response
+
+def replay_session(client, accept_encoding, conditional=True):
+    """Replays a session and returns the transferred bytes of the first visit and of a reload."""
+    headers = {'Accept-Encoding': accept_encoding}
+    city_outputs = [('map-container', 'children'), ('sort-dropdown', 'options'),
+                    ('columns-dropdown', 'options'), ('neighborhood-dropdown', 'options'), ('map-view', 'data')]
+    metric_state = [('map-metric', 'value', 'avg_price')]
+
+    def city_inputs(month_index):
+        return [('city-dropdown', 'value', CITY), ('month-selection', 'data', month_index),
+                ('month-range-selection', 'data', [0, 2]), ('slider-mode', 'value', 'month')]
+
+    responses = [client.get(path, headers=headers) for path in ('/', '/_dash-layout', '/_dash-dependencies')]
+    for month_index in range(6):
+        responses.append(callback(client, city_outputs, city_inputs(month_index), headers, metric_state))
+    # The inputs are passed to the callbacks by position, so they are listed in the order of their signatures
+    responses.append(callback(client, [('table-container', 'children')], [
+        ('city-dropdown', 'value', CITY), ('month-selection', 'data', 5),
+        ('sort-dropdown', 'value', 'price'), ('columns-dropdown', 'value', ['host_name', 'room_type']),
+        ('order-asc', 'n_clicks', 0), ('order-desc', 'n_clicks', 1), ('neighborhood-dropdown', 'value', NEIGHBORHOOD),
+        ('modal', 'is_open', True),
+        ('room-type-filter', 'value', []), ('price-min', 'value', None), ('price-max', 'value', None),
+        ('nights-filter', 'value', None), ('rating-filter', 'value', None)], headers))
+    responses.append(callback(client, [('scatter-plot', 'figure'), ('plot-title', 'children')], [
+        ('city-dropdown', 'value', CITY), ('neighborhood-dropdown', 'value', NEIGHBORHOOD),
+        ('price-over-time', 'n_clicks', 0), ('rating-over-time', 'n_clicks', 0), ('modal', 'is_open', True)], headers))
+    first_visit = sum(len(response.data) for response in responses)
+
+    reload_responses = []
+    for response, path in zip(responses[:3], ('/', '/_dash-layout', '/_dash-dependencies')):
+        reload_headers = dict(headers)
+        if conditional and response.headers.get('ETag'):
+            reload_headers['If-None-Match'] = response.headers['ETag']
+        reload_responses.append(client.get(path, headers=reload_headers))
+    reload_responses.append(callback(client, city_outputs, city_inputs(0), headers, metric_state))
+    reload = sum(len(response.data) for response in reload_responses)
+    return first_visit, reload
+
+def main():
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(write_city(directory))
+    client = app.server.test_client()
+
+    # The first row is the behaviour without the middleware: no compression and no conditional requests
+    variants = [('identity', False, 'plain'), ('identity', True, 'etag'), ('gzip', True, 'etag+gzip')]
+    if brotli is not None:
+        variants.append(('br, gzip', True, 'etag+br'))
+
+    baseline = None
+    print(f"{'variant':<12}{'first visit [kB]':>18}{'reload [kB]':>14}{'saved':>10}")
+    for accept_encoding, conditional, label in variants:
+        first_visit, reload = replay_session(client, accept_encoding, conditional)
+        total = first_visit + reload
+        baseline = baseline or total
+        print(f"{label:<12}{first_visit / 1024:>18.1f}{reload / 1024:>14.1f}{1 - total / baseline:>10.1%}")
+
+if __name__ == '__main__':
+    main()
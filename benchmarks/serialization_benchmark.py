@@ -0,0 +1,103 @@
+"""
+Benchmark for the JSON serialization of the map and table callback outputs.
+
+Compares the encode time of the `generate_map` and `generate_table` outputs
+as part of a Dash callback response with Plotly's `json` and `orjson`
+engines, with `airbnbDashboard.utils.serialization.to_json`, and with the
+pre-serialized pass-through that is used for cached map figures.
+
+Synthetic data is used so that the benchmark runs without the Git LFS files.
+
+Usage
+-----
+>>> python benchmarks/serialization_benchmark.py
+"""
+import os
+import sys
+import timeit
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from airbnbDashboard.plots import generate_map, create_map_figure, map_graph, generate_sorted_table
+from airbnbDashboard.utils.serialization import serialize_figure, pre_serialized, to_json
+
+CITY = 'Madrid, Spain'
+N_NEIGHBORHOODS = 128
+N_VERTICES = 400
+N_LISTINGS = 5000
+REPEAT = 20
+
+def make_geojson_and_stats():
+    """Creates a GeoJSON with detailed polygons and matching neighborhood statistics."""
+    rng = np.random.default_rng(42)
+    features = []
+    for i in range(N_NEIGHBORHOODS):
+        angles = np.linspace(0, 2 * np.pi, N_VERTICES)
+        lon = -3.7 + (i % 16) * 0.02 + 0.01 * np.cos(angles)
+        lat = 40.4 + (i // 16) * 0.02 + 0.01 * np.sin(angles)
+        features.append({
+            'type': 'Feature',
+            'properties': {'neighbourhood': f'Neighbourhood {i}'},
+            'geometry': {'type': 'Polygon', 'coordinates': [np.column_stack([lon, lat]).tolist()]},
+        })
+    geojson = {CITY: {'type': 'FeatureCollection', 'features': features}}
+    stats = {CITY: pd.DataFrame({
+        'neighbourhood_cleansed': [f'Neighbourhood {i}' for i in range(N_NEIGHBORHOODS)],
+        'month': 1,
+        'avg_price': rng.uniform(50, 300, N_NEIGHBORHOODS),
+        'avg_ratings': rng.uniform(3, 5, N_NEIGHBORHOODS),
+        'number_of_reviews': rng.uniform(0, 100, N_NEIGHBORHOODS),
+        'name': rng.integers(1, 500, N_NEIGHBORHOODS),
+    })}
+    return geojson, stats
+
+def make_listings():
+    """Creates a listings frame with the columns shown in the table."""
+    rng = np.random.default_rng(7)
+    return pd.DataFrame({
+        'id': np.arange(N_LISTINGS),
+        'price': rng.uniform(20, 500, N_LISTINGS),
+        'name': [f'Listing {i}' for i in range(N_LISTINGS)],
+        'review_scores_rating': rng.uniform(1, 5, N_LISTINGS),
+        'host_name': [f'Host {i % 700}' for i in range(N_LISTINGS)],
+        'room_type': rng.choice(['Entire home/apt', 'Private room'], N_LISTINGS),
+        'date': pd.Timestamp('2024-01-01'),
+    })
+
+def callback_response(component):
+    """Wraps a component the way Dash wraps a callback output."""
+    return {'multi': True, 'response': {'container': {'children': component}}}
+
+def time_encode(encode, component):
+    """Returns the mean time in milliseconds to encode a callback response containing `component`."""
+    response = callback_response(component)
+    try:
+        seconds = timeit.timeit(lambda: encode(response), number=REPEAT)
+    except TypeError:
+        # The standard json engine cannot embed pre-serialized fragments
+        return float('nan')
+    return seconds / REPEAT * 1000
+
+ENCODERS = {
+    'plotly json': lambda obj: pio.json.to_json_plotly(obj, engine='json'),
+    'plotly orjson': lambda obj: pio.json.to_json_plotly(obj, engine='orjson'),
+    'to_json': to_json,
+}
+
+def main():
+    geojson, stats = make_geojson_and_stats()
+    map_component = generate_map(CITY, 1, geojson, stats)
+    table_component = generate_sorted_table(make_listings(), 'price', ['host_name', 'room_type'], 0, 1)
+    cached_map = map_graph(pre_serialized(serialize_figure(create_map_figure(CITY, 1, geojson, stats))))
+
+    print(f"{'output [ms]':<28}" + ''.join(f"{name:>16}" for name in ENCODERS))
+    for label, component in [('generate_map', map_component), ('generate_table', table_component),
+                             ('generate_map (cached JSON)', cached_map)]:
+        print(f"{label:<28}" + ''.join(f"{time_encode(encode, component):>16.2f}" for encode in ENCODERS.values()))
+
+if __name__ == '__main__':
+    main()
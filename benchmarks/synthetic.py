@@ -0,0 +1,128 @@
+"""
+Synthetic data for the benchmarks.
+
+Writes GeoJSON and combined CSV files with the same schema as the files in
+`data/`, so that the benchmarks exercise the real loading and callback code
+without requiring the Git LFS files.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+def make_geojson(n_neighborhoods, n_vertices, seed=42):
+    """
+    Creates a GeoJSON FeatureCollection with one detailed polygon per neighborhood.
+
+    Parameters
+    ----------
+    n_neighborhoods : int
+        The number of neighborhoods (features).
+    n_vertices : int
+        The number of vertices of each polygon.
+    seed : int, optional
+        The seed of the random number generator. The default is 42.
+
+    Returns
+    -------
+    dict
+        The GeoJSON data, with the neighborhood names in `properties.neighbourhood`.
+    """
+    rng = np.random.default_rng(seed)
+    features = []
+    for i in range(n_neighborhoods):
+        angles = np.linspace(0, 2 * np.pi, n_vertices)
+        radius = 0.01 * (1 + 0.1 * rng.random(n_vertices))
+        lon = -3.7 + (i % 16) * 0.02 + radius * np.cos(angles)
+        lat = 40.4 + (i // 16) * 0.02 + radius * np.sin(angles)
+        features.append({
+            'type': 'Feature',
+            'properties': {'neighbourhood': f'Neighbourhood {i}', 'neighbourhood_group': None},
+            'geometry': {'type': 'Polygon', 'coordinates': [np.round(np.column_stack([lon, lat]), 6).tolist()]},
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+def make_listings(n_neighborhoods, n_listings, months, seed=7):
+    """
+    Creates a combined listings frame with one row per listing and month,
+    followed by two forecast months with one row per neighborhood.
+
+    Parameters
+    ----------
+    n_neighborhoods : int
+        The number of neighborhoods.
+    n_listings : int
+        The number of listings.
+    months : int
+        The number of historical months.
+    seed : int, optional
+        The seed of the random number generator. The default is 7.
+
+    Returns
+    -------
+    pd.DataFrame
+        The listings in the schema of the combined CSV files.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2023-09-01', periods=months + 2, freq='MS')
+    neighborhoods = np.array([f'Neighbourhood {i}' for i in range(n_neighborhoods)])
+    listing_neighborhoods = neighborhoods[rng.integers(0, n_neighborhoods, n_listings)]
+    listing_ids = np.arange(n_listings) + 10000
+    history = pd.DataFrame({
+        'date': np.repeat(dates[:months], n_listings),
+        'id': np.tile(listing_ids, months),
+        'neighbourhood_cleansed': np.tile(listing_neighborhoods, months),
+        'price': rng.lognormal(4.5, 0.6, n_listings * months).round(2),
+        'review_scores_rating': rng.uniform(3, 5, n_listings * months).round(2),
+        'number_of_reviews': rng.integers(0, 400, n_listings * months),
+        'reviews_per_month': rng.uniform(0, 5, n_listings * months).round(2),
+        'name': np.tile([f'Apartment {i} with balcony' for i in range(n_listings)], months),
+        'host_id': np.tile(listing_ids % (n_listings // 3 + 1), months),
+        'host_name': np.tile([f'Host {i % (n_listings // 3 + 1)}' for i in range(n_listings)], months),
+        'host_total_listings_count': np.tile(rng.integers(1, 20, n_listings), months),
+        'room_type': np.tile(rng.choice(['Entire home/apt', 'Private room', 'Shared room', 'Hotel room'], n_listings), months),
+        'minimum_nights': np.tile(rng.integers(1, 30, n_listings), months),
+        'latitude': np.tile(40.4 + rng.random(n_listings) * 0.16, months),
+        'longitude': np.tile(-3.7 + rng.random(n_listings) * 0.32, months),
+        'bathrooms': np.tile(rng.integers(1, 3, n_listings).astype(float), months),
+        'bedrooms': np.tile(rng.integers(1, 4, n_listings).astype(float), months),
+    })
+    forecast_price = rng.lognormal(4.5, 0.2, 2 * n_neighborhoods).round(2)
+    forecast = pd.DataFrame({
+        'date': np.repeat(dates[months:], n_neighborhoods),
+        'neighbourhood_cleansed': np.tile(neighborhoods, 2),
+        'price': forecast_price,
+        'conf_int_upper': (forecast_price * 1.2).round(2),
+        'conf_int_lower': (forecast_price * 0.8).round(2),
+        'best_model': 'ARIMA',
+    })
+    listings = pd.concat([history, forecast], ignore_index=True)
+    listings['city'] = 'Madrid'
+    return listings
+
+def write_city(directory, city='Madrid, Spain', n_neighborhoods=128, n_vertices=400, n_listings=5000, months=12):
+    """
+    Writes the GeoJSON and CSV files of a synthetic city.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to write the files to.
+    city : str, optional
+        The city name used as key. The default is 'Madrid, Spain'.
+    n_neighborhoods, n_vertices, n_listings, months : int, optional
+        The size of the synthetic data.
+
+    Returns
+    -------
+    dict
+        A `city_paths` dictionary for the city.
+    """
+    os.makedirs(directory, exist_ok=True)
+    geojson_path = os.path.join(directory, 'neighbourhoods.geojson')
+    listings_path = os.path.join(directory, 'combined_data_final.csv')
+    with open(geojson_path, 'w', encoding='utf8') as file:
+        json.dump(make_geojson(n_neighborhoods, n_vertices), file)
+    make_listings(n_neighborhoods, n_listings, months).to_csv(listings_path, index=False)
+    return {city: {'listings': listings_path, 'geojson': geojson_path}}
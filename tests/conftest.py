@@ -0,0 +1,123 @@
+import json
+import os
+import sys
+import pandas as pd
+import pytest
+
+# The tests import the package from the repository and the synthetic data from the benchmarks
+repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [repo_dir, os.path.join(repo_dir, 'benchmarks')]
+
+from synthetic import make_geojson, make_listings
+from airbnbDashboard.data.loader import load_data
+from airbnbDashboard.data.query import create_query_backend
+from airbnbDashboard.data.validation import validated_path
+from airbnbDashboard.plots.slider import generate_date_marks
+from airbnbDashboard.utils.helpers import get_city_options, build_city_indexes
+from airbnbDashboard.utils.app_initializer import initialize_app
+from airbnbDashboard.dashboard.layout import setup_layout
+from airbnbDashboard.dashboard.callbacks import register_callbacks
+
+CITY = 'Madrid, Spain'
+
+def write_listings(directory, listings, name='listings.csv'):
+    """Writes a listings frame as a combined CSV file and returns the paths of the city."""
+    geojson = os.path.join(directory, 'neighbourhoods.geojson')
+    if not os.path.exists(geojson):
+        with open(geojson, 'w', encoding='utf8') as file:
+            json.dump(make_geojson(12, 8), file)
+    path = os.path.join(directory, name)
+    listings.to_csv(path, index=False)
+    return {CITY: {'listings': path, 'geojson': geojson}}
+
+def load_city(city_paths, quarantine_dir=None, validated_dir=None):
+    """
+    Loads a city like `load_and_prepare_data` and returns the data by name.
+
+    With `validated_dir`, the valid rows are written there and queried with
+    DuckDB, like the app does for `query_engine = 'duckdb'`.
+    """
+    neighborhood_totals = {}
+    neighborhoods_geojson, neighborhood_stats, listings_data, listing_dims = load_data(
+        city_paths, chunksize=1000, neighborhood_totals=neighborhood_totals, quarantine_dir=quarantine_dir,
+        validated_dir=validated_dir)
+    if validated_dir is None:
+        query_backend = create_query_backend('pandas', listings_data, listing_dims)
+        dates = pd.concat([listings['date'] for listings in listings_data.values()]).unique()
+    else:
+        query_backend = create_query_backend('duckdb', city_paths={city: {'listings': validated_path(validated_dir, city)}
+                                                                   for city in neighborhood_stats})
+        dates = [date for city in query_backend.cities() for date in query_backend.distinct(city, 'date')]
+    date_marks = generate_date_marks(pd.to_datetime(dates))
+    city_indexes = build_city_indexes(listings_data, listing_dims, date_marks, neighborhood_stats, query_backend,
+                                      city_paths=city_paths)
+    return {
+        'neighborhoods_geojson': neighborhoods_geojson,
+        'neighborhood_stats': neighborhood_stats,
+        'listings_data': listings_data,
+        'listing_dims': listing_dims,
+        'date_marks': date_marks,
+        'city_indexes': city_indexes,
+        'neighborhood_totals': neighborhood_totals,
+        'query_backend': query_backend,
+    }
+
+def build_app(data, **options):
+    """Builds the Dash app around loaded data; `options` are passed on to `register_callbacks`."""
+    app = initialize_app()
+    app.layout = setup_layout(get_city_options(data['city_indexes']), data['date_marks'], data['neighborhoods_geojson'],
+                              data['neighborhood_stats'])
+    register_callbacks(app, data['listings_data'], data['listing_dims'], data['neighborhoods_geojson'],
+                       data['neighborhood_stats'], data['date_marks'], data['city_indexes'], data['query_backend'], **options)
+    return app
+
+# Outputs of the map callback, which also sends the dropdown options of the city
+city_view = ['map-container.children', 'sort-dropdown.options', 'columns-dropdown.options',
+             'neighborhood-dropdown.options', 'map-view.data']
+
+def city_view_inputs(date_index):
+    """The inputs of the map callback for a city and a month, in the order of its signature."""
+    return [('city-dropdown', 'value', CITY), ('month-selection', 'data', date_index),
+            ('month-range-selection', 'data', [0, 2]), ('slider-mode', 'value', 'month')]
+
+def update(client, outputs, inputs, state=(), headers=None, triggered=None):
+    """
+    Sends a callback request like the Dash renderer and returns the response.
+
+    `outputs` is a list of 'id.property' strings, `inputs` and `state` are
+    lists of (id, property, value) tuples. The trigger is the 'id.property'
+    of `triggered`, the default is the first input.
+    """
+    output = '..' + '...'.join(outputs) + '..' if len(outputs) > 1 else outputs[0]
+    specs = [{'id': spec.split('.')[0], 'property': spec.split('.')[1]} for spec in outputs]
+    payload = {
+        'output': output,
+        'outputs': specs if len(outputs) > 1 else specs[0],
+        'inputs': [{'id': id, 'property': prop, 'value': value} for id, prop, value in inputs],
+        'state': [{'id': id, 'property': prop, 'value': value} for id, prop, value in state],
+        'changedPropIds': [triggered or f'{inputs[0][0]}.{inputs[0][1]}'],
+    }
+    return client.post('/_dash-update-component', json=payload, headers=headers or {})
+
+@pytest.fixture(scope='session')
+def listings():
+    """Thirteen months of a synthetic city, followed by two forecast months."""
+    listings = make_listings(12, 400, 13)
+    listings['date'] = pd.to_datetime(listings['date'])
+    return listings
+
+@pytest.fixture
+def months(listings):
+    """
+    The listings split at the last month of the history: the CSV file of the
+    full history, the CSV file generated a month earlier (with forecast rows
+    for that month) and the rows of that month.
+    """
+    dates = sorted(listings['date'].unique())
+    history = listings[listings['id'].notna()]
+    forecasts = listings[listings['id'].isna()]
+    full = pd.concat([history, forecasts], ignore_index=True)
+    earlier_forecasts = forecasts[forecasts['date'] == dates[13]]
+    earlier = pd.concat([history[history['date'] < dates[12]], earlier_forecasts.assign(date=dates[12]), earlier_forecasts],
+                        ignore_index=True)
+    return full, earlier, history[history['date'] == dates[12]]
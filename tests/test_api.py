@@ -0,0 +1,97 @@
+import gzip
+import json
+import pytest
+
+from conftest import CITY, write_listings, load_city, build_app
+from airbnbDashboard.data.incremental import append_month
+from airbnbDashboard.utils.api import api_prefix, register_api_routes
+from airbnbDashboard.utils.export import export_positions
+
+@pytest.fixture
+def api(tmp_path, months):
+    """A client of the app with the API, on the listings of a month earlier, and the rows of the next month."""
+    _, earlier, new_month = months
+    data = load_city(write_listings(str(tmp_path), earlier))
+    app = build_app(data)
+    register_api_routes(app.server, data['neighborhood_stats'], data['listings_data'], data['listing_dims'],
+                        data['date_marks'], data['city_indexes'])
+    return app.server.test_client(), data, new_month
+
+def test_stats_are_the_statistics_of_the_map(api):
+    client, data, _ = api
+    response = client.get(f'{api_prefix}/cities/{CITY}/stats?month=9')
+    assert response.status_code == 200
+    stats = data['neighborhood_stats'][CITY]
+    stats = stats[stats['month'] == 9].sort_values('neighbourhood_cleansed')
+    body = sorted(response.get_json()['stats'], key=lambda row: row['neighbourhood_cleansed'])
+    assert [row['avg_price'] for row in body] == pytest.approx(stats['avg_price'].tolist())
+
+def test_listings_pages_cover_the_table_in_order(api):
+    client, data, _ = api
+    query = f'{api_prefix}/cities/{CITY}/listings?month=9&neighbourhood=Neighbourhood 3&sort=price&order=asc&limit=7'
+    ids, offset = [], 0
+    while offset is not None:
+        page = client.get(f'{query}&offset={offset}').get_json()
+        ids += [listing['id'] for listing in page['listings']]
+        offset = page['next_offset']
+
+    listings = data['listings_data'][CITY]
+    positions = export_positions(listings, data['listing_dims'][CITY], data['city_indexes'][CITY]['facets'], 9,
+                                 'Neighbourhood 3', 'price', True)
+    expected = listings['id'].iloc[positions]
+    assert ids == expected.astype(object).where(expected.notna(), None).tolist()
+    assert len(ids) == page['total'] > 7
+
+def test_unchanged_responses_are_answered_with_304(api):
+    client, data, new_month = api
+    url = f'{api_prefix}/cities/{CITY}/stats'
+    response = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    etag = response.headers['ETag']
+    identity = client.get(url)
+    assert identity.headers['ETag'] != etag
+    assert json.loads(gzip.decompress(response.data)) == identity.get_json()
+
+    revalidated = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+    assert revalidated.headers['ETag'] == etag
+
+    # A new month changes the data version of the city, and with it the ETag
+    append_month(CITY, new_month, data['neighborhood_stats'], data['listings_data'], data['listing_dims'], data['date_marks'],
+                 data['city_indexes'], data['neighborhood_totals'])
+    updated = client.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+    assert updated.status_code == 200
+    assert updated.headers['ETag'] != etag
+    assert json.loads(gzip.decompress(updated.data)) != json.loads(gzip.decompress(response.data))
+
+def test_changed_files_change_the_etag_after_a_restart(tmp_path, months):
+    full, earlier, _ = months
+    url = f'{api_prefix}/cities/{CITY}/stats?month=9'
+
+    def start(listings):
+        """Starts the app on the CSV file of `listings`, without appending months."""
+        data = load_city(write_listings(str(tmp_path), listings))
+        assert data['city_indexes'][CITY].get('version', 0) == 0
+        app = build_app(data)
+        register_api_routes(app.server, data['neighborhood_stats'], data['listings_data'], data['listing_dims'],
+                            data['date_marks'], data['city_indexes'])
+        return app.server.test_client()
+
+    before = start(earlier).get(url)
+    # The CSV file was updated before the next start
+    after = start(full).get(url, headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != before.headers['ETag']
+    assert after.get_json() != before.get_json()
+
+def test_invalid_requests_are_rejected(api):
+    client, _, _ = api
+    assert client.get(f'{api_prefix}/cities/Nowhere/stats').status_code == 404
+    assert client.get(f'{api_prefix}/cities/{CITY}/stats?start=0&end=99').status_code == 400
+    listings = f'{api_prefix}/cities/{CITY}/listings?month=9&neighbourhood=Neighbourhood 3'
+    assert client.get(listings + '&offset=-1').status_code == 400
+    assert client.get(listings + '&column=nope').status_code == 400
+    assert client.get(f'{api_prefix}/cities/{CITY}/listings?month=9').status_code == 400
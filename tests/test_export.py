@@ -0,0 +1,44 @@
+import io
+import os
+import time
+import pandas as pd
+from flask import Flask
+
+from conftest import CITY, write_listings, load_city
+from airbnbDashboard.utils.export import ExportJobs, register_export_routes
+
+def finished(client, job_id):
+    for _ in range(100):
+        status = client.get(f'/export/{job_id}').get_json()
+        if status['status'] in ('done', 'failed'):
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"Export {job_id} did not finish")
+
+def test_a_started_download_survives_the_removal_of_its_file(tmp_path, listings):
+    data = load_city(write_listings(str(tmp_path), listings))
+    export_jobs = ExportJobs(str(tmp_path / 'exports'))
+    server = register_export_routes(Flask(__name__), export_jobs, data['listings_data'], data['listing_dims'], data['city_indexes'])
+    client = server.test_client()
+    neighbourhood = data['query_backend'].distinct(CITY, 'neighbourhood_cleansed')[0]
+
+    response = client.post('/export', data={'city': CITY, 'month': 9, 'neighbourhood': neighbourhood, 'sort': 'price'})
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    status = finished(client, job_id)
+    assert status['status'] == 'done' and status['rows'] > 0
+
+    # The file is opened before the response starts, so evicting the job meanwhile does not cut the download short
+    download = client.get(f'/export/{job_id}/download', buffered=False)
+    path = export_jobs.download(job_id)[0]
+    os.remove(path)
+    content = download.get_data()
+    assert len(content) == int(download.headers['Content-Length'])
+    assert len(pd.read_csv(io.BytesIO(content))) == status['rows']
+    assert client.get(f'/export/{job_id}/download').status_code == 404
+
+def test_export_files_of_earlier_runs_are_removed(tmp_path):
+    (tmp_path / 'old.csv').write_text('id\n1\n')
+    (tmp_path / 'notes.txt').write_text('kept')
+    ExportJobs(str(tmp_path))
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['notes.txt']
@@ -0,0 +1,89 @@
+import contextvars
+import flask
+import pytest
+from dash.exceptions import PreventUpdate
+
+from conftest import write_listings, load_city, build_app, update, city_view, city_view_inputs
+from airbnbDashboard.utils.generations import RequestGenerations, tab_header, sequence_header
+
+server = flask.Flask(__name__)
+
+class Request:
+    """A callback request of a browser tab; its calls share one context, like the calls of a Dash callback."""
+
+    def __init__(self, tab=None, sequence=None):
+        self.headers = {}
+        if tab is not None:
+            self.headers[tab_header] = tab
+        if sequence is not None:
+            self.headers[sequence_header] = str(sequence)
+        self.context = contextvars.copy_context()
+
+    def run(self, function, *args, **kwargs):
+        return self.context.run(self._call, function, *args, **kwargs)
+
+    def _call(self, function, *args, **kwargs):
+        with server.test_request_context(headers=self.headers):
+            return function(*args, **kwargs)
+
+def test_a_newer_request_skips_the_older_one():
+    generations = RequestGenerations()
+    older, newer = Request('tab', 1), Request('tab', 2)
+    older.run(generations.begin, 'table')
+    older.run(generations.check)
+
+    newer.run(generations.begin, 'table')
+    with pytest.raises(PreventUpdate):
+        older.run(generations.check)
+    newer.run(generations.check)
+    assert generations.stats() == {'started': 2, 'skipped': 1, 'tracked': 1}
+
+def test_an_overtaken_request_is_skipped_when_it_begins():
+    generations = RequestGenerations()
+    Request('tab', 5).run(generations.begin, 'table')
+    with pytest.raises(PreventUpdate):
+        Request('tab', 4).run(generations.begin, 'table')
+
+def test_tabs_and_callbacks_are_tracked_separately():
+    generations = RequestGenerations()
+    first = Request('first', 1)
+    first.run(generations.begin, 'table')
+    Request('second', 2).run(generations.begin, 'table')
+    Request('first', 3).run(generations.begin, 'city_view')
+    first.run(generations.check)
+
+def test_requests_that_cannot_be_skipped():
+    generations = RequestGenerations()
+    # Requests without the headers of the browser script, e.g. from other clients
+    anonymous = Request()
+    anonymous.run(generations.begin, 'table')
+    Request().run(generations.begin, 'table')
+    anonymous.run(generations.check)
+
+    # A request that is not cancellable still supersedes the older ones
+    older, city_change = Request('tab', 1), Request('tab', 2)
+    older.run(generations.begin, 'city_view')
+    city_change.run(generations.begin, 'city_view', cancellable=False)
+    Request('tab', 3).run(generations.begin, 'city_view')
+    city_change.run(generations.check)
+    with pytest.raises(PreventUpdate):
+        older.run(generations.check)
+
+def test_the_map_callback_skips_superseded_slider_changes(tmp_path, listings):
+    generations = RequestGenerations()
+    app = build_app(load_city(write_listings(str(tmp_path), listings)), request_generations=generations)
+    client = app.server.test_client()
+    metric = [('map-metric', 'value', 'avg_price')]
+
+    def move_slider(date_index, sequence):
+        return update(client, city_view, city_view_inputs(date_index), metric, triggered='month-selection.data',
+                      headers={tab_header: 'tab', sequence_header: str(sequence)})
+
+    assert move_slider(3, 2).status_code == 200
+    # A response that arrives after a newer one was requested is not sent, Dash answers 204 No Content
+    assert move_slider(2, 1).status_code == 204
+    # The dropdown options of a new city are always sent, even if a newer slider change overtook it
+    city_change = update(client, city_view, city_view_inputs(3), metric, headers={tab_header: 'tab', sequence_header: '1'})
+    assert city_change.status_code == 200
+    assert city_change.get_json()['response']['neighborhood-dropdown']['options']
+    assert generations.stats()['skipped'] == 1
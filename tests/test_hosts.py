@@ -0,0 +1,27 @@
+from conftest import CITY, write_listings, load_city, build_app, update
+
+def test_the_portfolio_of_a_top_host_is_shown(tmp_path, listings):
+    data = load_city(write_listings(str(tmp_path), listings))
+    client = build_app(data).server.test_client()
+
+    inputs = [('city-dropdown', 'value', CITY), ('month-selection', 'data', 3)]
+    response = update(client, ['top-hosts-container.children', 'host-dropdown.options'], inputs)
+    assert response.status_code == 200
+    options = response.get_json()['response']['host-dropdown']['options']
+    assert options
+
+    host_id = options[0]['value']
+    response = update(client, ['host-portfolio-container.children'], [('host-dropdown', 'value', host_id), ('city-dropdown', 'value', CITY)])
+    assert response.status_code == 200
+    months, portfolio = response.get_json()['response']['host-portfolio-container']['children']['props']['children']
+    # The months with listings of the host, and its listings
+    assert months['props']['children'][1]['props']['children']
+    host_index = data['city_indexes'][CITY]['hosts']
+    host = list(host_index['host_ids']).index(host_id)
+    rows = portfolio['props']['children'][1]['props']['children']
+    assert sorted(row['props']['children'][0]['props']['children'] for row in rows) == \
+           sorted(host_index['listing_ids'][host_index['listing_starts'][host]:host_index['listing_starts'][host + 1]].tolist())
+
+    # Nothing is shown without a selected host
+    response = update(client, ['host-portfolio-container.children'], [('host-dropdown', 'value', None), ('city-dropdown', 'value', CITY)])
+    assert response.get_json()['response']['host-portfolio-container']['children'] is None
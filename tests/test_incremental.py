@@ -0,0 +1,128 @@
+import io
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import CITY, write_listings, load_city, build_app, update, city_view, city_view_inputs
+from airbnbDashboard.data.incremental import append_month, read_deltas
+from airbnbDashboard.data.search import search_listings
+from airbnbDashboard.data.hosts import host_portfolio
+from airbnbDashboard.utils.months import register_month_routes
+from airbnbDashboard.utils.admin import admin_header
+
+def map_values(response):
+    figure = response.get_json()['response']['map-container']['children']['props']['figure']
+    return np.sort([value for value in figure['data'][0]['z'] if value is not None])
+
+def test_append_month_matches_full_load(tmp_path, months):
+    full, earlier, new_month = months
+    expected = load_city(write_listings(str(tmp_path), full, 'full.csv'))
+    data = load_city(write_listings(str(tmp_path), earlier, 'earlier.csv'))
+
+    append_month(CITY, new_month, data['neighborhood_stats'], data['listings_data'], data['listing_dims'], data['date_marks'],
+                 data['city_indexes'], data['neighborhood_totals'])
+
+    # The full load has one more forecast month, which the appended data cannot know about
+    forecast_month = full['date'].max().month
+    key = ['neighbourhood_cleansed', 'month']
+    stats = expected['neighborhood_stats'][CITY].merge(data['neighborhood_stats'][CITY], on=key, how='outer',
+                                                       suffixes=('_full', '_appended'))
+    stats = stats[stats['month'] != forecast_month]
+    for col in ['avg_price', 'avg_ratings', 'number_of_reviews', 'name', 'median_price', 'p90_price']:
+        assert np.allclose(stats[f'{col}_full'].astype(float), stats[f'{col}_appended'].astype(float), equal_nan=True), col
+
+    assert data['date_marks'] == expected['date_marks']
+    expected_cube, cube = expected['city_indexes'][CITY]['scatter'], data['city_indexes'][CITY]['scatter']
+    assert cube['history'] == expected_cube['history']
+    assert np.allclose(cube['mean_price'], expected_cube['mean_price'], equal_nan=True)
+    facts = data['listings_data'][CITY]
+    assert facts['id'].notna().sum() == expected['listings_data'][CITY]['id'].notna().sum()
+    assert data['city_indexes'][CITY]['version'] == 1
+
+def test_append_month_updates_the_search_and_host_indexes(tmp_path, months):
+    full, earlier, new_month = months
+    # A listing is renamed and another one moves to a different neighbourhood in the new month
+    new_month = new_month.copy()
+    renamed, moved = new_month.index[:2]
+    new_month.loc[renamed, 'name'] = 'Loft by the river'
+    new_month.loc[moved, 'neighbourhood_cleansed'] = next(name for name in new_month['neighbourhood_cleansed'].unique()
+                                                          if name != new_month.loc[moved, 'neighbourhood_cleansed'])
+    full = pd.concat([full[full['date'] != new_month['date'].min()], new_month], ignore_index=True)
+    expected = load_city(write_listings(str(tmp_path), full, 'full.csv'))['city_indexes'][CITY]
+    data = load_city(write_listings(str(tmp_path), earlier, 'earlier.csv'))
+
+    append_month(CITY, new_month, data['neighborhood_stats'], data['listings_data'], data['listing_dims'], data['date_marks'],
+                 data['city_indexes'], data['neighborhood_totals'])
+    indexes = data['city_indexes'][CITY]
+
+    # The listings keep their positions, so the same listings are found in another order
+    for query in ['loft river', 'apartment 1', 'balcony', 'host 3', 'apartment with']:
+        found, expected_found = (search_listings(index['search'], query, limit=10 ** 6).sort_values('id', ignore_index=True)
+                                 for index in (indexes, expected))
+        assert found.equals(expected_found), query
+    assert search_listings(indexes['search'], 'loft')['id'].tolist() == [int(new_month.loc[renamed, 'id'])]
+
+    hosts, expected_hosts = indexes['hosts'], expected['hosts']
+    for key in ['host_ids', 'host_names', 'listing_starts', 'neighbourhood_counts', 'listing_counts', 'reviews']:
+        assert np.array_equal(hosts[key], expected_hosts[key]), key
+    assert np.allclose(hosts['avg_price'], expected_hosts['avg_price'], equal_nan=True)
+    assert all(np.array_equal(hosts['top_hosts'][month], expected_hosts['top_hosts'][month]) for month in range(1, 13))
+    host_id = expected_hosts['host_ids'][0]
+    assert {key: list(value) for key, value in host_portfolio(hosts, host_id).items()} == \
+           {key: list(value) for key, value in host_portfolio(expected_hosts, host_id).items()}
+
+def test_append_month_rejects_a_month_of_the_history(tmp_path, months):
+    _, earlier, new_month = months
+    data = load_city(write_listings(str(tmp_path), earlier))
+    append_month(CITY, new_month, data['neighborhood_stats'], data['listings_data'], data['listing_dims'], data['date_marks'],
+                 data['city_indexes'], data['neighborhood_totals'])
+    facts = data['listings_data'][CITY]
+
+    with pytest.raises(ValueError):
+        append_month(CITY, new_month, data['neighborhood_stats'], data['listings_data'], data['listing_dims'],
+                     data['date_marks'], data['city_indexes'], data['neighborhood_totals'])
+    assert data['listings_data'][CITY] is facts
+    assert data['city_indexes'][CITY]['version'] == 1
+
+def test_admin_route_appends_a_month_to_the_running_app(tmp_path, months):
+    _, earlier, new_month = months
+    data = load_city(write_listings(str(tmp_path), earlier))
+    app = build_app(data)
+    delta_dir = str(tmp_path / 'deltas')
+    register_month_routes(app.server, data['neighborhood_stats'], data['listings_data'], data['listing_dims'],
+                          data['date_marks'], data['city_indexes'], data['neighborhood_totals'], delta_dir, 'secret')
+    client = app.server.test_client()
+    admin = {admin_header: 'secret'}
+    month = new_month['date'].min().strftime('%Y-%m')
+    month_index = next(index for index, mark in data['date_marks'].items() if mark == month)
+    metric = [('map-metric', 'value', 'avg_price')]
+    before = update(client, city_view, city_view_inputs(month_index), metric)
+    assert before.status_code == 200
+
+    csv = new_month.to_csv(index=False).encode('utf8')
+    # Requests without the admin token change nothing
+    assert client.post(f'/admin/months/{CITY}', data=csv, content_type='text/csv').status_code == 403
+    assert client.post(f'/admin/months/{CITY}', data=csv, content_type='text/csv',
+                       headers={admin_header: 'guess'}).status_code == 403
+    assert data['city_indexes'][CITY].get('version', 0) == 0
+
+    response = client.post(f'/admin/months/{CITY}', data=csv, content_type='text/csv', headers=admin)
+    assert response.status_code == 200
+    assert response.get_json() == {'city': CITY, 'month': month, 'version': 1, 'marks': len(data['date_marks'])}
+
+    # The cached map of the month is not served again, it now includes the posted prices instead of the forecasts
+    after = update(client, city_view, city_view_inputs(month_index), metric)
+    assert after.status_code == 200
+    history = pd.concat([earlier[earlier['id'].notna()], new_month])
+    history = history[history['date'].dt.month == new_month['date'].min().month]
+    expected = np.sort(history.groupby('neighbourhood_cleansed')['price'].mean().to_numpy())
+    assert not np.allclose(map_values(before), expected)
+    assert np.allclose(map_values(after), expected)
+    assert [len(delta) for delta in read_deltas(delta_dir, CITY)] == [len(new_month)]
+
+    # A month that is already loaded is rejected, and so are unknown cities and files without listings
+    upload = lambda: {'file': (io.BytesIO(csv), 'month.csv')}
+    assert client.post(f'/admin/months/{CITY}', data=upload(), content_type='multipart/form-data', headers=admin).status_code == 400
+    assert client.post('/admin/months/Nowhere', data=upload(), content_type='multipart/form-data', headers=admin).status_code == 404
+    assert client.post(f'/admin/months/{CITY}', data=b'date,price\n', content_type='text/csv', headers=admin).status_code == 400
+    assert data['city_indexes'][CITY]['version'] == 1
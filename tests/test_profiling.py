@@ -0,0 +1,31 @@
+from flask import Flask
+
+from airbnbDashboard.utils.admin import admin_header
+from airbnbDashboard.utils.profiling import RequestProfiles, register_profiling
+
+def profiled_server(profile_dir):
+    server = Flask(__name__)
+    server.route('/ping')(lambda: 'pong')
+    register_profiling(server, RequestProfiles(str(profile_dir)), 'secret')
+    return server.test_client()
+
+def test_profiles_require_the_admin_token(tmp_path):
+    client = profiled_server(tmp_path)
+    admin = {admin_header: 'secret'}
+
+    # Without the token, asking for a profile is ignored and the profiles are not listed
+    assert 'X-Profile-Id' not in client.get('/ping?profile').headers
+    assert 'X-Profile-Id' not in client.get('/ping', headers={'X-Profile': '1', admin_header: 'guess'}).headers
+    profile_id = client.get('/ping?profile', headers=admin).headers['X-Profile-Id']
+    assert client.get('/profiles').status_code == 403
+    assert client.get(f'/profiles/{profile_id}?format=pstats').status_code == 403
+
+    assert [profile['id'] for profile in client.get('/profiles', headers=admin).get_json()] == [profile_id]
+    assert client.get(f'/profiles/{profile_id}', headers=admin).status_code == 200
+
+def test_profile_files_of_earlier_runs_are_removed(tmp_path):
+    (tmp_path / 'old.prof').write_bytes(b'')
+    (tmp_path / 'notes.txt').write_text('kept')
+    client = profiled_server(tmp_path)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['notes.txt']
+    assert client.get('/profiles', headers={admin_header: 'secret'}).get_json() == []
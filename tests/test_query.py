@@ -0,0 +1,81 @@
+import os
+import pytest
+
+from conftest import CITY, write_listings, load_city, build_app, update
+from airbnbDashboard.data.facets import filter_facets
+from airbnbDashboard.utils.helpers import filter_listings
+from airbnbDashboard.utils.memory import memory_report
+
+pytest.importorskip('duckdb')
+
+# Inputs of the table callback in the order of its signature, for a month and neighbourhood
+table_inputs = ['city-dropdown.value', 'month-selection.data', 'sort-dropdown.value', 'columns-dropdown.value',
+                'order-asc.n_clicks', 'order-desc.n_clicks', 'neighborhood-dropdown.value', 'modal.is_open',
+                'room-type-filter.value', 'price-min.value', 'price-max.value', 'nights-filter.value', 'rating-filter.value']
+
+@pytest.fixture
+def backends(tmp_path, listings):
+    """The city loaded for the pandas backend and for DuckDB, with a row of a neighbourhood outside the GeoJSON file."""
+    checked = listings.copy()
+    checked.loc[checked['id'].first_valid_index(), 'neighbourhood_cleansed'] = 'Atlantis'
+    city_paths = write_listings(str(tmp_path), checked)
+    return load_city(city_paths), load_city(city_paths, validated_dir=str(tmp_path / 'validated'))
+
+def table_ids(client, neighbourhood, room_types=None, min_price=None):
+    values = [CITY, 3, 'price', ['room_type'], 1, 0, neighbourhood, True, room_types or [], min_price, None, None, None]
+    response = update(client, ['table-container.children'], [(*spec.split('.'), value) for spec, value in zip(table_inputs, values)])
+    assert response.status_code == 200
+    return response.get_json()['response']['table-container']['children']['props']['figure']['data'][0]['cells']['values'][0]
+
+def test_duckdb_answers_from_the_validated_rows(tmp_path, backends):
+    pandas, duckdb = backends
+    assert duckdb['listings_data'] == {} and duckdb['listing_dims'] == {}
+    # The rows staged while reading were converted to Parquet
+    assert os.listdir(tmp_path / 'validated') == ['Madrid_Spain.parquet']
+    pandas_backend, duckdb_backend = pandas['query_backend'], duckdb['query_backend']
+
+    # The rejected row is not in the validated file, so the options are the same
+    neighbourhoods = pandas_backend.distinct(CITY, 'neighbourhood_cleansed')
+    assert 'Atlantis' not in neighbourhoods
+    assert duckdb_backend.distinct(CITY, 'neighbourhood_cleansed') == neighbourhoods
+    assert duckdb['city_indexes'][CITY]['metadata'] == pandas['city_indexes'][CITY]['metadata']
+    assert duckdb['date_marks'] == pandas['date_marks']
+
+    expected = filter_listings(pandas_backend, CITY, 9, neighbourhoods[0])
+    rows = filter_listings(duckdb_backend, CITY, 9, neighbourhoods[0])
+    assert list(rows.columns) == list(expected.columns)
+    assert sorted(rows['id']) == sorted(expected['id'])
+
+    # The facets of the modal table select the same rows as the facet index
+    selections = {'room_type': ['Private room'], 'rating': 4.0, 'minimum_nights': 7}
+    expected = filter_facets(pandas['listings_data'][CITY], pandas['city_indexes'][CITY]['facets'], 9, neighbourhoods[0],
+                             selections, (40, 150))
+    rows = filter_listings(duckdb_backend, CITY, 9, neighbourhoods[0], selections, (40, 150), ['id', 'room_type'])
+    assert list(rows.columns) == ['id', 'room_type']
+    assert len(rows) and sorted(rows['id']) == sorted(expected['id'])
+
+def test_the_app_queries_duckdb_without_the_listings(backends):
+    pandas, duckdb = backends
+    assert not {'facets', 'scatter', 'search'} & set(duckdb['city_indexes'][CITY])
+    pandas_client, duckdb_client = build_app(pandas).server.test_client(), build_app(duckdb).server.test_client()
+    neighbourhood = pandas['query_backend'].distinct(CITY, 'neighbourhood_cleansed')[0]
+
+    assert table_ids(duckdb_client, neighbourhood) == table_ids(pandas_client, neighbourhood)
+    assert table_ids(duckdb_client, neighbourhood, ['Private room'], 60) == table_ids(pandas_client, neighbourhood, ['Private room'], 60)
+
+    # The scatter plot is aggregated by DuckDB, its history has the months of the pandas scatter cube
+    inputs = [('city-dropdown', 'value', CITY), ('neighborhood-dropdown', 'value', neighbourhood), ('price-over-time', 'n_clicks', 1),
+              ('rating-over-time', 'n_clicks', 0), ('modal', 'is_open', True)]
+    response = update(duckdb_client, ['scatter-plot.figure', 'plot-title.children'], inputs)
+    assert response.status_code == 200
+    dates = response.get_json()['response']['scatter-plot']['figure']['data'][0]['x']
+    assert len(dates) == pandas['city_indexes'][CITY]['scatter']['history']
+
+def test_the_memory_report_covers_the_cities_without_listings(backends):
+    _, duckdb = backends
+    report = memory_report(duckdb['neighborhoods_geojson'], duckdb['neighborhood_stats'], duckdb['listings_data'],
+                           duckdb['listing_dims'], duckdb['city_indexes'], caches={})
+    city_report = report['cities'][CITY]
+    assert 'listings_data' not in city_report and 'listing_dims' not in city_report
+    assert city_report['neighborhood_stats'] > 0 and 'metadata' in city_report['indexes']
+    assert report['total'] == city_report['total'] > 0
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import CITY, write_listings
+from airbnbDashboard.data.loader import load_data
+from airbnbDashboard.data.neighbourhoods import index_features
+from airbnbDashboard.data.validation import validate_listings, validation_rules, quarantine_path
+from synthetic import make_geojson
+
+# One row breaking each rule, as changes to a valid row
+broken_rows = {
+    'missing_neighbourhood': {'neighbourhood_cleansed': None},
+    'missing_price': {'price': None},
+    'malformed_value': {'price': 'twelve'},
+    'invalid_date': {'date': 'not a date'},
+    'price_out_of_range': {'price': '20000'},
+    'rating_out_of_range': {'review_scores_rating': 7.5},
+    'negative_count': {'minimum_nights': -1},
+    'invalid_coordinates': {'latitude': 95.0},
+    'unknown_neighbourhood': {'neighbourhood_cleansed': 'Atlantis'},
+}
+
+def with_broken_rows(listings, positions):
+    """Inserts a copy of a valid row breaking each rule at the given positions; prices become text."""
+    listings = listings.astype({'price': object, 'date': object})
+    broken = listings.iloc[[0] * len(broken_rows)].copy()
+    for row, (rule, changes) in enumerate(broken_rows.items()):
+        for col, value in dict(changes, name=rule).items():
+            broken.iloc[row, broken.columns.get_loc(col)] = value
+    order = np.argsort(np.concatenate([np.arange(len(listings)), np.asarray(positions) - 0.5]), kind='stable')
+    return pd.concat([listings, broken], ignore_index=True).iloc[order].reset_index(drop=True)
+
+def test_validate_listings_reports_every_rule(listings):
+    history = listings[listings['id'].notna()].head(20)
+    checked = with_broken_rows(history, np.linspace(1, 19, len(broken_rows)).astype(int))
+    checked.loc[len(checked) - 1, 'price'] = '$1,234.00'
+    feature_index = index_features(make_geojson(12, 8))
+
+    valid, rejected, report = validate_listings(checked.copy(), feature_index)
+
+    assert report['rows'] == len(checked)
+    assert report['rejected'] == len(broken_rows)
+    assert report['rules'] == {rule: 1 for rule in validation_rules}
+    assert report['unmatched'] == ['Atlantis']
+    assert dict(zip(rejected['name'], rejected['rejected_by'])) == {rule: rule for rule in broken_rows}
+    assert len(valid) == len(history)
+    assert valid['price'].dtype == float
+    assert valid['price'].iloc[-1] == 1234.0
+
+@pytest.mark.parametrize('chunksize', [None, 500])
+def test_load_data_quarantines_the_rejected_rows(tmp_path, listings, chunksize):
+    checked = with_broken_rows(listings, [10, 900, 1700, 2600, 3100, 3900, 4200, 4700, 4800])
+    city_paths = write_listings(str(tmp_path), checked)
+    clean_paths = write_listings(str(tmp_path), listings, 'clean.csv')
+    quarantine_dir = str(tmp_path / 'quarantine')
+    reports = {}
+
+    _, stats, listings_data, _ = load_data(city_paths, chunksize=chunksize, quarantine_dir=quarantine_dir,
+                                           validation_reports=reports)
+    _, clean_stats, clean_listings, _ = load_data(clean_paths, chunksize=chunksize)
+
+    quarantine = pd.read_csv(quarantine_path(quarantine_dir, CITY))
+    assert dict(zip(quarantine['name'], quarantine['rejected_by'])) == {rule: rule for rule in broken_rows}
+    assert reports[CITY]['rejected'] == len(broken_rows)
+    assert reports[CITY]['rules'] == {rule: 1 for rule in validation_rules}
+
+    # The statistics and listings are those of the file without the broken rows
+    assert len(listings_data[CITY]) == len(clean_listings[CITY])
+    pd.testing.assert_frame_equal(stats[CITY], clean_stats[CITY])